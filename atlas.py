@@ -0,0 +1,216 @@
+# atlas.py - Атлас мініатюр: одна картинка на сторінку галереї замість сотні запитів
+
+import os
+import json
+import math
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageOps
+
+
+class AtlasBuilder:
+    """
+    Складає квадратні плитки `tile_size` x `tile_size` (обрізка по центру,
+    як BoxFit.cover у сітці) в одне JPEG-зображення по `columns` у ряд.
+
+    Атлас ідентифікується вмістом сторінки (імена + версії файлів), тому його
+    адреса незмінна. Коли вміст сторінки змінюється, новий атлас збирається з
+    попереднього: незмінені плитки копіюються з нього, і з диска читаються
+    лише нові або змінені прев'ю.
+
+    Сторінки, до яких давно не зверталися, витісняються (LRU), коли атласи
+    займають більше `disk_budget` байт: курсор сторінки зсувається з кожним
+    новим завантаженням, і старі сторінки інакше лишались би на диску назавжди.
+    """
+
+    def __init__(self, cache_dir: str, tile_size: int = 128, columns: int = 10, quality: int = 80,
+                 disk_budget: int = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.tile_size = tile_size
+        self.columns = columns
+        self.quality = quality
+        self.disk_budget = disk_budget
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._pages = OrderedDict()  # page_id -> (atlas_id, байти на диску), від давніших до свіжіших
+        self._pages_bytes = 0
+        self._pages_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_pages()
+
+    # --- Шляхи ---
+    def image_path(self, atlas_id: str) -> str:
+        return os.path.join(self.cache_dir, f"{atlas_id}.jpg")
+
+    def _manifest_path(self, atlas_id: str) -> str:
+        return os.path.join(self.cache_dir, f"{atlas_id}.json")
+
+    def _page_pointer_path(self, page_id: str) -> str:
+        return os.path.join(self.cache_dir, f"page-{page_id}.json")
+
+    @staticmethod
+    def _valid_id(atlas_id: str) -> bool:
+        return bool(atlas_id) and all(c in "0123456789abcdef-" for c in atlas_id)
+
+    def has_atlas(self, atlas_id: str) -> bool:
+        return self._valid_id(atlas_id) and os.path.exists(self.image_path(atlas_id))
+
+    def _read_json(self, path: str):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_json(self, path: str, data):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    # --- Збірка ---
+    def build(self, page_key: str, items: list) -> dict:
+        """
+        `items` — [(filename, version, шлях до прев'ю або None)] у порядку сітки.
+        Повертає маніфест: atlas_id, розміри і прямокутник кожної плитки.
+        Файли без прев'ю в атлас не потрапляють (клієнт вантажить їх окремо).
+        """
+        items = [item for item in items if item[2]]
+        page_id = hashlib.sha1(f"{page_key}:{self.tile_size}:{self.columns}".encode("utf-8")).hexdigest()[:12]
+        content = json.dumps([[name, version] for name, version, _ in items], ensure_ascii=False)
+        atlas_id = f"{page_id}-{hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]}"
+
+        with self._page_lock(page_id):
+            manifest = self._read_json(self._manifest_path(atlas_id))
+            if manifest is not None and os.path.exists(self.image_path(atlas_id)):
+                self._touch(page_id, atlas_id)
+                return manifest
+            pointer = self._read_json(self._page_pointer_path(page_id)) or {}
+            previous_id = pointer.get("atlas_id")
+            manifest = self._render(atlas_id, items, previous_id)
+            self._write_json(self._page_pointer_path(page_id), {"atlas_id": atlas_id})
+            if previous_id and previous_id != atlas_id:
+                self._remove(previous_id)
+            self._touch(page_id, atlas_id)
+        self._evict()
+        return manifest
+
+    def _page_lock(self, page_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(page_id, threading.Lock())
+
+    def _render(self, atlas_id: str, items: list, previous_id) -> dict:
+        tile = self.tile_size
+        columns = max(1, min(self.columns, len(items)))
+        rows = max(1, math.ceil(len(items) / columns))
+        atlas = Image.new("RGB", (columns * tile, rows * tile), (0, 0, 0))
+
+        previous, previous_image = None, None
+        if previous_id and self.has_atlas(previous_id):
+            previous = self._read_json(self._manifest_path(previous_id))
+        previous_tiles = {t["filename"]: t for t in (previous or {}).get("tiles", [])}
+
+        tiles, reused = [], 0
+        for index, (filename, version, source_path) in enumerate(items):
+            x, y = (index % columns) * tile, (index // columns) * tile
+            old = previous_tiles.get(filename)
+            if old is not None and old["version"] == version:
+                if previous_image is None:
+                    previous_image = Image.open(self.image_path(previous_id))
+                    previous_image.load()
+                atlas.paste(previous_image.crop((old["x"], old["y"], old["x"] + tile, old["y"] + tile)), (x, y))
+                reused += 1
+            else:
+                try:
+                    with Image.open(source_path) as img:
+                        img.draft("RGB", (tile * 2, tile * 2))
+                        atlas.paste(ImageOps.fit(img.convert("RGB"), (tile, tile), Image.Resampling.BICUBIC), (x, y))
+                except Exception as e:
+                    print(f"⚠️ Пропускаю плитку атласу {filename}: {e}")
+                    continue
+            tiles.append({"filename": filename, "version": version, "x": x, "y": y, "w": tile, "h": tile})
+
+        tmp_path = f"{self.image_path(atlas_id)}.{threading.get_ident()}.tmp"
+        atlas.save(tmp_path, "JPEG", quality=self.quality, optimize=True)
+        os.replace(tmp_path, self.image_path(atlas_id))
+        manifest = {
+            "atlas_id": atlas_id,
+            "tile": tile,
+            "columns": columns,
+            "width": atlas.width,
+            "height": atlas.height,
+            "tiles": tiles,
+            "reused": reused,
+        }
+        self._write_json(self._manifest_path(atlas_id), manifest)
+        return manifest
+
+    def _remove(self, atlas_id: str):
+        for path in (self.image_path(atlas_id), self._manifest_path(atlas_id)):
+            if os.path.exists(path): os.remove(path)
+
+    # --- Ліміт на диску ---
+    def _atlas_bytes(self, atlas_id: str) -> int:
+        return sum(os.path.getsize(path) for path in (self.image_path(atlas_id), self._manifest_path(atlas_id))
+                   if os.path.exists(path))
+
+    def _load_pages(self):
+        """Відновлює порядок сторінок з mtime покажчиків і прибирає сироти після перезапуску."""
+        pages, live = [], set()
+        for item in os.scandir(self.cache_dir):
+            if not item.is_file(): continue
+            if item.name.endswith(".tmp"):
+                os.remove(item.path)
+                continue
+            if item.name.startswith("page-") and item.name.endswith(".json"):
+                atlas_id = (self._read_json(item.path) or {}).get("atlas_id")
+                if atlas_id and self.has_atlas(atlas_id):
+                    pages.append((item.stat().st_mtime, item.name[5:-5], atlas_id))
+                    live.add(atlas_id)
+                else:
+                    os.remove(item.path)  # покажчик на атлас, якого вже немає
+        for item in os.scandir(self.cache_dir):
+            atlas_id = os.path.splitext(item.name)[0]
+            if item.is_file() and not item.name.startswith("page-") and atlas_id not in live:
+                os.remove(item.path)  # атлас, на який не вказує жодна сторінка
+        for _, page_id, atlas_id in sorted(pages):
+            size = self._atlas_bytes(atlas_id)
+            self._pages[page_id] = (atlas_id, size)
+            self._pages_bytes += size
+        self._evict()
+
+    def _touch(self, page_id: str, atlas_id: str):
+        """Позначає сторінку як щойно використану (і в пам'яті, і mtime покажчика для перезапуску)."""
+        size = self._atlas_bytes(atlas_id)
+        with self._pages_lock:
+            old = self._pages.pop(page_id, None)
+            if old is not None: self._pages_bytes -= old[1]
+            self._pages[page_id] = (atlas_id, size)
+            self._pages_bytes += size
+        try:
+            os.utime(self._page_pointer_path(page_id))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        while True:
+            with self._pages_lock:
+                if self._pages_bytes <= self.disk_budget or len(self._pages) <= 1: return
+                page_id, (atlas_id, size) = self._pages.popitem(last=False)
+                self._pages_bytes -= size
+            with self._page_lock(page_id):
+                pointer = self._read_json(self._page_pointer_path(page_id)) or {}
+                if pointer.get("atlas_id") not in (None, atlas_id): continue  # сторінку щойно перезібрали
+                self._remove(atlas_id)
+                if os.path.exists(self._page_pointer_path(page_id)): os.remove(self._page_pointer_path(page_id))
+            with self._locks_guard:
+                self._locks.pop(page_id, None)
+
+    def set_disk_budget(self, disk_budget: int):
+        self.disk_budget = disk_budget
+        self._evict()
+
+    def usage(self) -> dict:
+        with self._pages_lock:
+            return {"pages": len(self._pages), "disk_bytes": self._pages_bytes, "disk_budget": self.disk_budget}
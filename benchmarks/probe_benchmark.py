@@ -0,0 +1,186 @@
+# probe_benchmark.py - Старий get_original_date проти media_probe на змішаному наборі файлів
+#
+# Запуск з кореня репозиторію:
+#   python benchmarks/probe_benchmark.py [--count 20]
+#
+# Генерує синтетичні JPEG (з EXIF і без), PNG, HEIC (якщо є pillow_heif)
+# і MP4/MOV (якщо є ffmpeg), а тоді для кожного формату міряє середній час
+# на файл, скільки байтів прочитано і в скількох файлах знайдено дату зйомки.
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WIDTH, HEIGHT = 4000, 3000  # 12 Мп
+VIDEO_SECONDS = 10
+
+
+def make_exif(i: int):
+    from PIL import Image
+    exif = Image.Exif()
+    exif[0x010F], exif[0x0110], exif[0x0112] = "Canon", "EOS R6", 6 if i % 2 else 1
+    exif.get_ifd(0x8769)[0x9003] = f"2023:07:{1 + i % 28:02d} 18:22:05"
+    gps = exif.get_ifd(0x8825)
+    gps[1], gps[2], gps[3], gps[4] = "N", (50.0, 27.0, 0.36), "E", (30.0, 31.0, 24.24)
+    return exif
+
+
+def make_corpus(directory: str, count: int) -> list:
+    """[(формат, шлях)] — половина фото з EXIF, половина без (як скріншоти і збережене з месенджерів)."""
+    from PIL import Image
+    import numpy as np
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, WIDTH, dtype=np.float32)
+    y = np.linspace(0, 255, HEIGHT, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    img = Image.fromarray(np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8), "RGB")
+
+    corpus = []
+    for i in range(count):
+        path = os.path.join(directory, f"photo_{i}.jpg")
+        img.save(path, "JPEG", quality=90, **({"exif": make_exif(i)} if i % 2 == 0 else {}))
+        corpus.append(("jpeg", path))
+    small = img.resize((WIDTH // 4, HEIGHT // 4))
+    for i in range(max(1, count // 4)):
+        path = os.path.join(directory, f"screen_{i}.png")
+        small.save(path, "PNG", exif=make_exif(i))
+        corpus.append(("png", path))
+    try:
+        import pillow_heif
+        pillow_heif.register_heif_opener()
+        for i in range(max(1, count // 4)):
+            path = os.path.join(directory, f"photo_{i}.heic")
+            img.save(path, "HEIF", quality=60, exif=make_exif(i).tobytes())
+            corpus.append(("heic", path))
+    except ImportError:
+        print("⚠️ pillow_heif не встановлено — HEIC пропускаю")
+    if shutil.which("ffmpeg"):
+        for i in range(max(1, count // 4)):
+            for ext in ("mp4", "mov"):
+                path = os.path.join(directory, f"video_{i}.{ext}")
+                subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", "testsrc=size=1920x1080:rate=30",
+                                "-f", "lavfi", "-i", "sine", "-t", str(VIDEO_SECONDS), "-c:v", "libx264", "-preset", "ultrafast",
+                                "-c:a", "aac", "-shortest", "-metadata", "creation_time=2022-05-01T10:00:00Z", path], check=True)
+                corpus.append((ext, path))
+    else:
+        print("⚠️ ffmpeg не знайдено — відео пропускаю")
+    return corpus
+
+
+class CountingReads:
+    """Рахує байти, прочитані через builtins.open у старому шляху (PIL і hachoir читають через нього)."""
+
+    def __init__(self):
+        self.total = 0
+
+    def __enter__(self):
+        import builtins, io
+        self._open = builtins.open
+        counter = self
+
+        class Wrapped(io.BufferedReader):
+            def read(self, *args):
+                data = super().read(*args)
+                counter.total += len(data or b"")
+                return data
+
+            def read1(self, *args):
+                data = super().read1(*args)
+                counter.total += len(data or b"")
+                return data
+
+            def readinto(self, b):
+                n = super().readinto(b)
+                counter.total += n or 0
+                return n
+
+        def counting_open(file, mode="r", *args, **kwargs):
+            if "b" in mode and "r" in mode and not any(c in mode for c in "wa+") and not args and not kwargs:
+                return Wrapped(io.FileIO(file, "rb"))
+            return self._open(file, mode, *args, **kwargs)
+
+        builtins.open = counting_open
+        return self
+
+    def __exit__(self, *exc):
+        import builtins
+        builtins.open = self._open
+
+
+def legacy_original_date(file_path: str):
+    """Старий get_original_date з server.py як є (включно з неімпортованим TAGS). None — дату не знайдено."""
+    from PIL import Image
+    from hachoir.parser import createParser
+    from hachoir.metadata import extractMetadata
+    from hachoir.core import config
+    config.quiet = True
+    try:
+        if file_path.lower().endswith((".jpg", ".jpeg", ".heic")):
+            with Image.open(file_path) as img:
+                exif_data = img._getexif()
+                if exif_data:
+                    for tag, value in exif_data.items():
+                        tag_name = TAGS.get(tag, tag)  # noqa: F821 — саме ця помилка і була
+                        if tag_name == "DateTimeOriginal":
+                            return datetime.strptime(value, "%Y:%m:%d %H:%M:%S").timestamp()
+    except Exception:
+        pass
+    try:
+        parser = createParser(file_path)
+        if parser:
+            with parser:
+                metadata = extractMetadata(parser)
+            if metadata and metadata.has("creation_date"):
+                return metadata.get("creation_date").timestamp()
+    except Exception:
+        pass
+    return None
+
+
+def run(corpus: list, variant: str) -> dict:
+    from media_probe import probe
+    stats = {}
+    for fmt, path in corpus:
+        row = stats.setdefault(fmt, {"files": 0, "seconds": 0.0, "bytes": 0, "dates": 0, "size": 0})
+        started = time.perf_counter()
+        if variant == "before":
+            with CountingReads() as reads:
+                found = legacy_original_date(path)
+            read = reads.total
+        else:
+            info = probe(path)
+            found, read = info.get("taken_at"), info["bytes_read"]
+        row["seconds"] += time.perf_counter() - started
+        row["files"] += 1
+        row["bytes"] += read
+        row["size"] += os.path.getsize(path)
+        # 1904 рік — це "нуль" у QuickTime, а не дата зйомки
+        row["dates"] += 1 if found and datetime.fromtimestamp(found).year > 1970 else 0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=20, help="кількість JPEG; інших форматів — чверть від неї")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Генерую набір файлів (JPEG {WIDTH}x{HEIGHT}, PNG, HEIC, MP4/MOV по {VIDEO_SECONDS} с)...")
+        corpus = make_corpus(directory, args.count)
+        print(f"{'variant':<8} {'format':<6} {'files':>5} {'ms/file':>9} {'KB read/file':>13} {'of file, %':>11} {'dates':>6}")
+        for variant in ("before", "after"):
+            for fmt, row in run(corpus, variant).items():
+                print(f"{variant:<8} {fmt:<6} {row['files']:>5} {1000 * row['seconds'] / row['files']:>9.2f} "
+                      f"{row['bytes'] / row['files'] / 1024:>13.1f} {100.0 * row['bytes'] / row['size']:>11.2f} "
+                      f"{row['dates']:>3}/{row['files']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# scan_benchmark.py - Обхід дерева оригіналів: listdir + stat проти TreeScanner зі знімком
+#
+# Запуск з кореня репозиторію:
+#   python benchmarks/scan_benchmark.py [--files 100000] [--per-dir 100]
+#
+# Створює дерево з порожніх .jpg (рік/місяць/день, по --per-dir файлів у каталозі)
+# і міряє: наївний рекурсивний обхід (listdir + isfile + stat кожного файлу),
+# перше сканування TreeScanner (знімку ще немає), повторне без змін і повторне
+# після додавання одного файлу в глибоку підпапку.
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tree_scanner import TreeScanner
+
+MEDIA_EXTENSIONS = (".jpg", ".jpeg", ".png", ".heic", ".mp4", ".mov")
+
+
+def make_tree(root: str, files: int, per_dir: int) -> str:
+    dirs = 0
+    for i in range(files):
+        if i % per_dir == 0:
+            directory = os.path.join(root, str(2000 + dirs // 360), f"{dirs // 30 % 12 + 1:02d}", f"{dirs % 30 + 1:02d}")
+            os.makedirs(directory, exist_ok=True)
+            dirs += 1
+        open(os.path.join(directory, f"IMG_{i:06d}.jpg"), "wb").close()
+    return directory
+
+
+def naive_scan(root: str) -> dict:
+    """Як робив би os.listdir-код, лише рекурсивно: isfile/isdir і stat на кожен запис."""
+    result, stack = {}, [root]
+    while stack:
+        directory = stack.pop()
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                stack.append(path)
+            elif os.path.isfile(path) and name.lower().endswith(MEDIA_EXTENSIONS):
+                st = os.stat(path)
+                result[os.path.relpath(path, root)] = (st.st_size, st.st_mtime_ns)
+    return result
+
+
+def timed(label: str, func):
+    started = time.perf_counter()
+    result = func()
+    print(f"{label:<34} {1000 * (time.perf_counter() - started):>9.1f} ms   files: {len(result)}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--per-dir", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        root = os.path.join(workdir, "originals")
+        print(f"Створюю {args.files} файлів по {args.per_dir} у каталозі...")
+        last_dir = make_tree(root, args.files, args.per_dir)
+        # Щоб каталоги не вважались "щойно зміненими" (RACY_SECONDS)
+        past = time.time() - 60
+        for directory, _, _ in os.walk(root): os.utime(directory, (past, past))
+
+        accept = lambda name: name.lower().endswith(MEDIA_EXTENSIONS)
+        snapshot = os.path.join(workdir, "snapshot.json")
+        timed("naive listdir + stat", lambda: naive_scan(root))
+        timed("TreeScanner, без знімка", lambda: TreeScanner(root, snapshot, accept).scan())
+        # Новий екземпляр — як після перезапуску сервера: знімок читається з диска
+        timed("TreeScanner, знімок з диска", lambda: TreeScanner(root, snapshot, accept).scan())
+        scanner = TreeScanner(root, snapshot, accept)
+        scanner.scan()
+        timed("TreeScanner, без змін", scanner.scan)
+        print(f"  {scanner.last_stats}")
+        open(os.path.join(last_dir, "new.jpg"), "wb").close()
+        os.utime(last_dir, (past, past + 1))
+        timed("TreeScanner, +1 файл", scanner.scan)
+        print(f"  {scanner.last_stats}")
+
+
+if __name__ == "__main__":
+    main()
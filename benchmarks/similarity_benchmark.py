@@ -0,0 +1,85 @@
+# similarity_benchmark.py - Індекс схожих фото проти попарного порівняння хешів
+#
+# Запуск з кореня репозиторію:
+#   python benchmarks/similarity_benchmark.py [--photos 100000] [--bursts 2000]
+#
+# Генерує випадкові 64-бітні pHash/dHash і "серії" з кількох майже однакових
+# кадрів (1-4 змінені біти), будує SimilarityIndex і міряє: побудову, пошук
+# схожих для одного фото, список дублікатів — і попарний перебір для порівняння.
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from similarity import SimilarityIndex, hamming
+
+
+class FakeStore:
+    """Мінімум від MetadataStore, потрібний індексу."""
+
+    def __init__(self, entries: dict):
+        self.entries = entries
+
+    def snapshot(self) -> dict:
+        return self.entries
+
+    def add_listener(self, callback):
+        pass
+
+
+def flip(value: int, bits: int) -> int:
+    for bit in random.sample(range(64), bits): value ^= 1 << bit
+    return value
+
+
+def make_entries(photos: int, bursts: int) -> dict:
+    random.seed(0)
+    entries = {}
+    for i in range(photos - bursts * 3):
+        entries[f"IMG_{i:06d}.jpg"] = {"phash": f"{random.getrandbits(64):016x}", "dhash": f"{random.getrandbits(64):016x}"}
+    for i in range(bursts):
+        phash, dhash = random.getrandbits(64), random.getrandbits(64)
+        for j in range(3):
+            entries[f"BURST_{i:05d}_{j}.jpg"] = {"phash": f"{flip(phash, random.randint(0, 2)):016x}",
+                                                 "dhash": f"{flip(dhash, random.randint(0, 4)):016x}"}
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--photos", type=int, default=100_000)
+    parser.add_argument("--bursts", type=int, default=2000)
+    args = parser.parse_args()
+
+    entries = make_entries(args.photos, args.bursts)
+    index = SimilarityIndex(duplicate_distance=6, duplicate_dhash_distance=10)
+    started = time.perf_counter()
+    index.attach(FakeStore(entries))
+    print(f"побудова індексу ({len(index)} фото)   {time.perf_counter() - started:>8.2f} s")
+
+    names = random.sample(sorted(entries), 200)
+    for distance in (6, 10, 15):
+        started = time.perf_counter()
+        for name in names: index.query(name, distance)
+        print(f"similar, max_distance={distance:<2}           {1000 * (time.perf_counter() - started) / len(names):>8.2f} ms/запит")
+
+    started = time.perf_counter()
+    groups = index.duplicates()
+    print(f"duplicates ({len(groups)} груп)             {1000 * (time.perf_counter() - started):>8.2f} ms")
+
+    hashes = [(name, int(entry["phash"], 16)) for name, entry in entries.items()]
+    started = time.perf_counter()
+    for name in names[:20]:
+        value = int(entries[name]["phash"], 16)
+        [other for other, h in hashes if hamming(value, h) <= 10]
+    per_query = (time.perf_counter() - started) / 20
+    print(f"попарно, один запит                  {1000 * per_query:>8.2f} ms/запит")
+    print(f"попарно, усі дублікати (оцінка)      {per_query * len(hashes) / 2:>8.0f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# thumbnail_benchmark.py - Порівняння старого і нового шляху створення прев'ю
+#
+# Запуск з кореня репозиторію:
+#   python benchmarks/thumbnail_benchmark.py [--count 5] [--sizes 400,550]
+#
+# Генерує синтетичні 24 Мп JPEG і для кожного варіанта в окремому процесі
+# міряє середній час на зображення та пікове RSS.
+
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import resource
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WIDTH, HEIGHT = 6000, 4000  # 24 Мп
+
+
+def make_inputs(directory: str, count: int) -> list:
+    from PIL import Image
+    import numpy as np
+    paths = []
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        # Градієнт + шум: стискається приблизно як справжнє фото
+        x = np.linspace(0, 255, WIDTH, dtype=np.float32)
+        y = np.linspace(0, 255, HEIGHT, dtype=np.float32)[:, None]
+        base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+        noisy = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+        img = Image.fromarray(noisy, "RGB")
+        exif = Image.Exif()
+        exif[0x0112] = 6 if i % 2 else 1  # кожне друге — "повернуте" камерою
+        path = os.path.join(directory, f"synthetic_{i}.jpg")
+        img.save(path, "JPEG", quality=90, exif=exif)
+        paths.append(path)
+    return paths
+
+
+def legacy_thumbnail(image_path: str, thumbnail_path: str, size: int, quality: int):
+    """Старий шлях (як у create_photo_thumbnail): окреме декодування на кожен розмір, без EXIF-орієнтації."""
+    from PIL import Image
+    with Image.open(image_path) as img:
+        if img.mode in ("RGBA", "P"): img = img.convert("RGB")
+        img.thumbnail((size, size))
+        img.save(thumbnail_path, "JPEG", quality=quality, optimize=True)
+
+
+def run_variant(variant: str, paths: list, sizes: list, out_dir: str) -> dict:
+    from thumbnailer import render_photo_sizes
+    started = time.perf_counter()
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        outputs = [(os.path.join(out_dir, f"{stem}_{variant}_{size}.jpg"), size, 80) for size in sizes]
+        if variant == "before":
+            for thumbnail_path, size, quality in outputs:
+                legacy_thumbnail(path, thumbnail_path, size, quality)
+        else:
+            render_photo_sizes(path, outputs)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss у Linux — в кілобайтах
+    return {
+        "variant": variant,
+        "images": len(paths),
+        "ms_per_image": round(1000 * elapsed / len(paths), 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=5)
+    parser.add_argument("--sizes", default="400,550")
+    parser.add_argument("--variant", help=argparse.SUPPRESS)
+    parser.add_argument("--inputs", help=argparse.SUPPRESS)
+    parser.add_argument("--make", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    if args.make:
+        # Генерація теж в окремому процесі: у Linux пікове RSS успадковується через exec
+        print(os.pathsep.join(make_inputs(args.make, args.count)))
+        return
+
+    if args.variant:
+        # Дочірній процес: один варіант, чисте пікове RSS
+        paths = args.inputs.split(os.pathsep)
+        print(json.dumps(run_variant(args.variant, paths, sizes, os.path.dirname(paths[0]))))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Генерую {args.count} синтетичних зображень {WIDTH}x{HEIGHT}...")
+        paths = subprocess.run([sys.executable, os.path.abspath(__file__), "--make", directory, "--count", str(args.count)],
+                               check=True, capture_output=True, text=True).stdout.strip().split(os.pathsep)
+        print(f"{'variant':<8} {'images':>6} {'ms/image':>10} {'peak RSS, MB':>13}")
+        for variant in ("before", "after"):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--variant", variant, "--sizes", args.sizes,
+                 "--inputs", os.pathsep.join(paths)],
+                check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{result['variant']:<8} {result['images']:>6} {result['ms_per_image']:>10} {result['peak_rss_mb']:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# blurhash.py - Кодувальник BlurHash (https://blurha.sh): ~30 символів, з яких клієнт
+# малює розмиту заглушку, поки вантажиться справжнє прев'ю
+
+import math
+from PIL import Image
+
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+# Для кодування досить крихітної копії: компоненти — це найнижчі частоти
+SAMPLE_SIZE = 32
+
+
+def _encode83(value: int, length: int) -> str:
+    return "".join(_BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _srgb_to_linear(value: int) -> float:
+    v = value / 255.0
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value: float) -> int:
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308: return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value: float, exp: float) -> float:
+    return math.copysign(abs(value) ** exp, value)
+
+
+def encode(img: Image.Image, x_components: int = None, y_components: int = None) -> str:
+    """
+    BlurHash зображення. За замовчуванням 4x3 компоненти для горизонтальних
+    кадрів і 3x4 для вертикальних — це 28 символів.
+    """
+    if x_components is None or y_components is None:
+        x_components, y_components = (4, 3) if img.width >= img.height else (3, 4)
+    small = img.convert("RGB").resize((SAMPLE_SIZE, SAMPLE_SIZE), Image.Resampling.BILINEAR)
+    width, height = small.size
+    linear_table = [_srgb_to_linear(v) for v in range(256)]
+    pixels = [tuple(linear_table[c] for c in px) for px in small.getdata()]
+
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_components)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_components)]
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            norm = (1.0 if i == 0 and j == 0 else 2.0) / (width * height)
+            r = g = b = 0.0
+            for y in range(height):
+                row, cy = y * width, cos_y[j][y]
+                for x in range(width):
+                    basis = cos_x[i][x] * cy
+                    pr, pg, pb = pixels[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            factors.append((r * norm, g * norm, b * norm))
+
+    dc, ac = factors[0], factors[1:]
+    result = _encode83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        actual_max = max(abs(c) for factor in ac for c in factor)
+        quantised_max = int(max(0, min(82, math.floor(actual_max * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+        result += _encode83(quantised_max, 1)
+    else:
+        max_value = 1.0
+        result += _encode83(0, 1)
+    result += _encode83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+    for factor in ac:
+        r, g, b = (int(max(0, min(18, math.floor(_sign_pow(c / max_value, 0.5) * 9 + 9.5)))) for c in factor)
+        result += _encode83(r * 19 * 19 + g * 19 + b, 2)
+    return result
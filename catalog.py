@@ -0,0 +1,380 @@
+# catalog.py - Індексований каталог медіафайлів на SQLite (заміна metadata.json)
+
+import os
+import json
+import base64
+import sqlite3
+import threading
+
+# Необов'язкові поля запису, які мають власні колонки (для пошуку по індексу).
+# У записі вони з'являються лише тоді, коли значення не NULL.
+INDEXED_FIELDS = ("content_hash",)
+
+# Поля, які мають окремі колонки в таблиці. Все інше з запису
+# зберігається в колонці `extra` як JSON, щоб не втрачати дані.
+CORE_FIELDS = ("type", "thumbnail", "timestamp", "folder") + INDEXED_FIELDS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    filename  TEXT PRIMARY KEY,
+    folder    TEXT NOT NULL DEFAULT '',
+    type      TEXT NOT NULL,
+    thumbnail TEXT,
+    timestamp REAL,
+    extra     TEXT,
+    version         INTEGER NOT NULL DEFAULT 0,
+    created_version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_media_timestamp ON media(timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_media_type ON media(type, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_media_folder ON media(folder, timestamp DESC);
+-- Видалені записи: потрібні, щоб клієнт у режимі since=<version> дізнався про видалення
+CREATE TABLE IF NOT EXISTS tombstones (
+    filename TEXT PRIMARY KEY,
+    version  INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Колонки, яких не було в першій версії схеми (додаються через ALTER TABLE)
+MIGRATED_COLUMNS = {
+    "version": "INTEGER NOT NULL DEFAULT 0",
+    "created_version": "INTEGER NOT NULL DEFAULT 0",
+    "group_id": "TEXT",
+    "content_hash": "TEXT",
+}
+POST_MIGRATION_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_media_version ON media(version);
+CREATE INDEX IF NOT EXISTS idx_media_group ON media(group_id);
+CREATE INDEX IF NOT EXISTS idx_media_hash ON media(content_hash);
+CREATE INDEX IF NOT EXISTS idx_tombstones_version ON tombstones(version);
+"""
+
+
+def encode_cursor(timestamp: float, filename: str) -> str:
+    """Непрозорий курсор для пагінації: позиція останнього відданого запису."""
+    raw = json.dumps([timestamp, filename], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Розбирає курсор з encode_cursor; кидає ValueError, якщо він зіпсований."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, filename = json.loads(raw.decode("utf-8"))
+        return float(timestamp), str(filename)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+DATA_COLUMNS = ("folder", "type", "thumbnail", "timestamp", "extra") + INDEXED_FIELDS
+UPSERT_SQL = (
+    f"INSERT INTO media (filename, {', '.join(DATA_COLUMNS)}, version, created_version) "
+    f"VALUES ({', '.join('?' * (len(DATA_COLUMNS) + 3))}) "
+    f"ON CONFLICT(filename) DO UPDATE SET "
+    f"{', '.join(f'{c} = excluded.{c}' for c in DATA_COLUMNS)}, version = excluded.version "
+    f"WHERE {' OR '.join(f'{c} IS NOT excluded.{c}' for c in DATA_COLUMNS)}"
+)
+
+
+class Catalog:
+    """
+    Каталог галереї в одному файлі SQLite.
+    Кожен запис — це один рядок, тому додавання/оновлення файлу не
+    переписує всю бібліотеку, а вибірки йдуть по індексах.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        # Одне з'єднання на процес; доступ серіалізуємо власним локом
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # Підписники на зміни (напр. індекс груп); отримують множину зачеплених timestamp-ів
+        self._listeners = []
+        # WAL + synchronous=NORMAL: менше fsync-ів, що важливо для SD-карти
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+            existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(media)")}
+            for column, definition in MIGRATED_COLUMNS.items():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE media ADD COLUMN {column} {definition}")
+            self._conn.executescript(POST_MIGRATION_SCHEMA)
+
+    def add_listener(self, callback):
+        """Реєструє callback(timestamps: set), який викликається після кожної зміни каталогу."""
+        self._listeners.append(callback)
+
+    def _notify(self, timestamps: set):
+        timestamps = {ts for ts in timestamps if ts is not None}
+        for callback in self._listeners:
+            try:
+                callback(timestamps)
+            except Exception as e:
+                print(f"⚠️ Помилка обробника змін каталогу: {e}")
+
+    def _timestamps_of(self, filenames) -> set:
+        filenames = list(filenames)
+        result = set()
+        for i in range(0, len(filenames), 500):
+            chunk = filenames[i:i + 500]
+            rows = self._conn.execute(
+                f"SELECT timestamp FROM media WHERE filename IN ({','.join('?' * len(chunk))})", chunk)
+            result.update(row[0] for row in rows)
+        return result
+
+    # --- Службові значення (версія, прапорці індексів) ---
+    def get_meta(self, key: str, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM catalog_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO catalog_meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, str(value)))
+
+    # --- Перетворення запис <-> рядок ---
+    @staticmethod
+    def _row_to_entry(row) -> dict:
+        entry = json.loads(row["extra"]) if row["extra"] else {}
+        entry.update({"type": row["type"], "thumbnail": row["thumbnail"], "folder": row["folder"]})
+        for field in ("timestamp",) + INDEXED_FIELDS:
+            if row[field] is not None:
+                entry[field] = row[field]
+        return entry
+
+    @staticmethod
+    def _entry_to_params(filename: str, entry: dict) -> tuple:
+        extra = {k: v for k, v in entry.items() if k not in CORE_FIELDS}
+        return (
+            filename,
+            entry.get("folder", ""),
+            entry.get("type", "image"),
+            entry.get("thumbnail"),
+            entry.get("timestamp"),
+            json.dumps(extra, ensure_ascii=False) if extra else None,
+        ) + tuple(entry.get(field) for field in INDEXED_FIELDS)
+
+    # --- Читання ---
+    def get(self, filename: str):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM media WHERE filename = ?", (filename,)).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def contains(self, filename: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM media WHERE filename = ?", (filename,)).fetchone() is not None
+
+    def find_by_hash(self, content_hash: str) -> list:
+        """Імена файлів з таким самим вмістом (по індексу content_hash)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT filename FROM media WHERE content_hash = ?", (content_hash,)).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM media").fetchone()[0]
+
+    def filenames(self, folder=None) -> set:
+        """Імена файлів каталогу (за потреби — лише з однієї папки, по індексу)."""
+        with self._lock:
+            if folder is None:
+                rows = self._conn.execute("SELECT filename FROM media").fetchall()
+            else:
+                rows = self._conn.execute("SELECT filename FROM media WHERE folder = ?", (folder,)).fetchall()
+        return {row[0] for row in rows}
+
+    def list_gallery(self, media_type=None, folder=None) -> list:
+        """Записи з timestamp, від новіших до старіших (йде по індексу timestamp)."""
+        query, params = "SELECT * FROM media WHERE timestamp IS NOT NULL", []
+        if media_type is not None:
+            query += " AND type = ?"; params.append(media_type)
+        if folder is not None:
+            query += " AND folder = ?"; params.append(folder)
+        query += " ORDER BY timestamp DESC, filename"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [(row["filename"], self._row_to_entry(row)) for row in rows]
+
+    def list_gallery_page(self, cursor=None, limit: int = 100) -> tuple:
+        """
+        Одна сторінка галереї (keyset-пагінація по індексу timestamp).
+        Повертає (записи, next_cursor); next_cursor = None на останній сторінці.
+        """
+        query, params = "SELECT * FROM media WHERE timestamp IS NOT NULL", []
+        if cursor:
+            timestamp, filename = decode_cursor(cursor)
+            query += " AND (timestamp < ? OR (timestamp = ? AND filename > ?))"
+            params += [timestamp, timestamp, filename]
+        query += " ORDER BY timestamp DESC, filename LIMIT ?"
+        params.append(limit + 1)  # +1, щоб знати, чи є наступна сторінка
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        items = [(row["filename"], self._row_to_entry(row)) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor(last["timestamp"], last["filename"])
+        return items, next_cursor
+
+    def version(self) -> int:
+        """Поточна версія каталогу; збільшується при кожній зміні."""
+        with self._lock:
+            return self._get_version()
+
+    def _get_version(self) -> int:
+        row = self._conn.execute("SELECT value FROM catalog_meta WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _set_version(self, version: int):
+        self._conn.execute(
+            "INSERT INTO catalog_meta (key, value) VALUES ('version', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (str(version),))
+
+    def changes_since(self, version: int) -> dict:
+        """Що змінилося після версії `version`: нові, змінені та видалені записи."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM media WHERE version > ? ORDER BY timestamp DESC, filename", (version,)).fetchall()
+            deleted = [row[0] for row in self._conn.execute(
+                "SELECT filename FROM tombstones WHERE version > ? ORDER BY version", (version,))]
+        added = [(row["filename"], self._row_to_entry(row)) for row in rows if row["created_version"] > version]
+        changed = [(row["filename"], self._row_to_entry(row)) for row in rows if row["created_version"] <= version]
+        return {"added": added, "changed": changed, "deleted": deleted}
+
+    # --- Часова шкала (для індексу груп) ---
+    def timestamp_before(self, timestamp: float):
+        """Найближчий timestamp, строго менший за заданий (або None)."""
+        with self._lock:
+            return self._conn.execute("SELECT MAX(timestamp) FROM media WHERE timestamp < ?", (timestamp,)).fetchone()[0]
+
+    def timestamp_after(self, timestamp: float):
+        """Найближчий timestamp, строго більший за заданий (або None)."""
+        with self._lock:
+            return self._conn.execute("SELECT MIN(timestamp) FROM media WHERE timestamp > ?", (timestamp,)).fetchone()[0]
+
+    def timeline(self, ts_from=None, ts_to=None) -> list:
+        """Записи з timestamp у [ts_from, ts_to], від старіших до новіших: (filename, entry, group_id)."""
+        query, params = "SELECT * FROM media WHERE timestamp IS NOT NULL", []
+        if ts_from is not None:
+            query += " AND timestamp >= ?"; params.append(ts_from)
+        if ts_to is not None:
+            query += " AND timestamp <= ?"; params.append(ts_to)
+        query += " ORDER BY timestamp, filename"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [(row["filename"], self._row_to_entry(row), row["group_id"]) for row in rows]
+
+    def grouped_timeline(self) -> list:
+        """Записи галереї від новіших до старіших разом з group_id: (filename, entry, group_id)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM media WHERE timestamp IS NOT NULL ORDER BY timestamp DESC, filename DESC").fetchall()
+        return [(row["filename"], self._row_to_entry(row), row["group_id"]) for row in rows]
+
+    def set_group_ids(self, mapping: dict):
+        """Записує group_id для файлів; версію каталогу не змінює (це похідний індекс)."""
+        if not mapping: return
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE media SET group_id = ? WHERE filename = ?",
+                                   [(group_id, name) for name, group_id in mapping.items()])
+
+    def as_dict(self) -> dict:
+        """Повний вміст каталогу у форматі старого metadata.json."""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM media").fetchall()
+        return {row["filename"]: self._row_to_entry(row) for row in rows}
+
+    # --- Запис ---
+    def upsert(self, filename: str, entry: dict):
+        self.apply_batch({filename: entry}, ())
+
+    def upsert_many(self, entries: dict):
+        """Додає або оновлює кілька записів однією транзакцією."""
+        self.apply_batch(entries, ())
+
+    def delete(self, filename: str):
+        self.apply_batch({}, [filename])
+
+    def delete_many(self, filenames):
+        self.apply_batch({}, filenames)
+
+    def apply_batch(self, upserts: dict, deletes):
+        """
+        Застосовує пакет змін (оновлення + видалення) однією транзакцією
+        з однією новою версією каталогу.
+        """
+        deletes = [name for name in deletes if name not in upserts]
+        if not upserts and not deletes: return
+        with self._lock:
+            with self._conn:
+                new_version = self._get_version() + 1
+                upserted = self._upsert_rows(upserts, new_version)
+                deleted = self._delete_rows(deletes, new_version)
+                if upserted is None and deleted is None: return
+                self._set_version(new_version)
+            self._notify((upserted or set()) | (deleted or set()))
+
+    # _upsert_rows/_delete_rows повертають зачеплені timestamp-и або None, якщо нічого не змінилось
+    def _upsert_rows(self, entries: dict, new_version: int):
+        if not entries: return None
+        old_timestamps = self._timestamps_of(entries) if self._listeners else set()
+        params = [self._entry_to_params(name, entry) + (new_version, new_version) for name, entry in entries.items()]
+        before = self._conn.total_changes
+        # Рядок без реальних змін не отримує нову версію, щоб не засмічувати дельту
+        self._conn.executemany(UPSERT_SQL, params)
+        if self._conn.total_changes == before: return None
+        self._conn.executemany("DELETE FROM tombstones WHERE filename = ?", [(name,) for name in entries])
+        return old_timestamps | {entry.get("timestamp") for entry in entries.values()}
+
+    def _delete_rows(self, filenames: list, new_version: int):
+        existing = [(name,) for name in filenames
+                    if self._conn.execute("SELECT 1 FROM media WHERE filename = ?", (name,)).fetchone()]
+        if not existing: return None
+        old_timestamps = self._timestamps_of(name for (name,) in existing)
+        self._conn.executemany("DELETE FROM media WHERE filename = ?", existing)
+        self._conn.executemany(
+            "INSERT INTO tombstones (filename, version) VALUES (?, ?) "
+            "ON CONFLICT(filename) DO UPDATE SET version = excluded.version",
+            [(name, new_version) for (name,) in existing])
+        return old_timestamps
+
+    def replace_all(self, data: dict):
+        """
+        Синхронізує каталог зі словником у форматі metadata.json:
+        пише лише змінені рядки і видаляє відсутні.
+        """
+        current = self.as_dict()
+        changed = {name: entry for name, entry in data.items() if current.get(name) != {"folder": "", **entry}}
+        removed = [name for name in current if name not in data]
+        self.apply_batch(changed, removed)
+
+    # --- Міграція ---
+    def migrate_from_json(self, json_path: str) -> int:
+        """
+        Одноразово переносить записи зі старого metadata.json у каталог.
+        Після успішного імпорту файл перейменовується в *.migrated,
+        щоб міграція не запускалась повторно. Повертає кількість записів.
+        """
+        if not os.path.exists(json_path): return 0
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f: data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️ Не вдалося прочитати {os.path.basename(json_path)} для міграції: {e}")
+            return 0
+        entries = {name: entry for name, entry in data.items() if isinstance(entry, dict)}
+        self.upsert_many(entries)
+        os.replace(json_path, json_path + ".migrated")
+        print(f"✅ Мігровано {len(entries)} записів з {os.path.basename(json_path)} у каталог SQLite")
+        return len(entries)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,185 @@
+# chunked_upload.py - Сесії докачки (resumable upload) для великих файлів
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+
+# Недокачані сесії старші за цей вік видаляються
+SESSION_TTL_SECONDS = 7 * 24 * 3600
+
+
+class UploadError(Exception):
+    """Помилка протоколу докачки; `status_code` відповідає HTTP-коду для клієнта."""
+
+    def __init__(self, status_code: int, message: str, **extra):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+        self.extra = extra
+
+
+class UploadSessionManager:
+    """
+    Зберігає стан сесій докачки на диску (поруч із частково записаним файлом),
+    тож після перезапуску сервера або обриву Wi-Fi клієнт продовжує з `offset`.
+
+    Частини пишуться одразу в `<id>.part` на тому ж розділі, що й оригінали,
+    тому фінальне переміщення — це rename, без повторного копіювання.
+    """
+
+    def __init__(self, sessions_dir: str):
+        self.sessions_dir = sessions_dir
+        self._lock = threading.Lock()
+        # Інкрементальний sha256 для сесій, що пишуться послідовно: id -> (hasher, hashed_offset)
+        self._hashers = {}
+        self._active = set()  # сесії, в які зараз іде запис
+        os.makedirs(sessions_dir, exist_ok=True)
+
+    def _meta_path(self, session_id: str) -> str:
+        return os.path.join(self.sessions_dir, f"{session_id}.json")
+
+    def part_path(self, session_id: str) -> str:
+        return os.path.join(self.sessions_dir, f"{session_id}.part")
+
+    def _save(self, session: dict):
+        tmp_path = self._meta_path(session["id"]) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(session, f, ensure_ascii=False)
+        os.replace(tmp_path, self._meta_path(session["id"]))
+
+    def get(self, session_id: str) -> dict:
+        # id приходить з URL, тож не дозволяємо нічого, крім hex-ідентифікатора
+        if not session_id or not all(c in "0123456789abcdef" for c in session_id):
+            raise UploadError(404, "Upload session not found")
+        try:
+            with open(self._meta_path(session_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            raise UploadError(404, "Upload session not found")
+
+    def create(self, filename: str, size: int, target_dir: str, folder: str = "", sha256=None) -> dict:
+        self.cleanup_expired()
+        if size < 0:
+            raise UploadError(400, "Invalid size")
+        session = {
+            "id": uuid.uuid4().hex,
+            "filename": filename,
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "offset": 0,
+            "target_dir": target_dir,
+            "folder": folder,
+            "created": time.time(),
+            "updated": time.time(),
+        }
+        # Порожній файл створюємо одразу, щоб PUT-и лише дописували в нього
+        open(self.part_path(session["id"]), "wb").close()
+        self._save(session)
+        self._hashers[session["id"]] = (hashlib.sha256(), 0)
+        return session
+
+    def begin_chunk(self, session_id: str, start: int, total=None) -> tuple:
+        """
+        Перевіряє, що шматок починається з поточного offset, і відкриває файл для запису.
+        Повертає (session, file). Дозволено лише послідовне дописування.
+        """
+        with self._lock:
+            session = self.get(session_id)
+            if total is not None and total != session["size"]:
+                raise UploadError(400, "Total size does not match the session", offset=session["offset"])
+            if session_id in self._active:
+                raise UploadError(409, "Another chunk is being written", offset=session["offset"])
+            if start != session["offset"]:
+                raise UploadError(409, "Chunk does not start at the current offset", offset=session["offset"])
+            f = open(self.part_path(session_id), "r+b")
+            f.seek(start)
+            self._active.add(session_id)
+            return session, f
+
+    def write(self, session: dict, f, data: bytes, position: int) -> int:
+        """Пише шматок тіла запиту; повертає нову позицію."""
+        if position + len(data) > session["size"]:
+            raise UploadError(413, "Chunk exceeds the declared size", offset=session["offset"])
+        f.write(data)
+        hasher = self._hashers.get(session["id"])
+        if hasher is not None and hasher[1] == position:
+            hasher[0].update(data)
+            self._hashers[session["id"]] = (hasher[0], position + len(data))
+        return position + len(data)
+
+    def end_chunk(self, session: dict, f, position: int) -> dict:
+        """Фіксує на диску новий offset (навіть якщо з'єднання обірвалось посеред шматка)."""
+        try:
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+            with self._lock:
+                session = {**self.get(session["id"]), "offset": position, "updated": time.time()}
+                self._save(session)
+            return session
+        finally:
+            self._active.discard(session["id"])
+
+    def finalize(self, session_id: str, sha256=None, find_duplicate=None) -> tuple:
+        """
+        Перевіряє розмір і контрольну суму та переносить файл на місце.
+        `find_duplicate(content_hash)` може повернути ім'я вже наявного файлу
+        з таким самим вмістом — тоді докачаний файл просто видаляється.
+        Повертає (session, final_path або None для дубліката, content_hash, duplicate).
+        """
+        with self._lock:
+            session = self.get(session_id)
+            if session["offset"] != session["size"]:
+                raise UploadError(409, "Upload is incomplete", offset=session["offset"])
+            actual = self._sha256(session)
+            expected = (sha256 or session["sha256"] or "").lower()
+            if expected and actual != expected:
+                self._discard(session_id)
+                raise UploadError(422, "Checksum mismatch, upload discarded", expected=expected, actual=actual)
+            duplicate = find_duplicate(actual) if find_duplicate else None
+            if duplicate:
+                self._discard(session_id)
+                return session, None, actual, duplicate
+            final_path = os.path.join(session["target_dir"], session["filename"])
+            os.replace(self.part_path(session_id), final_path)
+            os.remove(self._meta_path(session_id))
+            self._hashers.pop(session_id, None)
+            return session, final_path, actual, None
+
+    def _sha256(self, session: dict) -> str:
+        hasher = self._hashers.get(session["id"])
+        if hasher is not None and hasher[1] == session["size"]:
+            return hasher[0].hexdigest()
+        # Після перезапуску сервера стан хешу втрачено — рахуємо по файлу
+        h = hashlib.sha256()
+        with open(self.part_path(session["id"]), "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def abort(self, session_id: str):
+        with self._lock:
+            self.get(session_id)
+            self._discard(session_id)
+
+    def _discard(self, session_id: str):
+        for path in (self.part_path(session_id), self._meta_path(session_id)):
+            if os.path.exists(path): os.remove(path)
+        self._hashers.pop(session_id, None)
+
+    def cleanup_expired(self):
+        now = time.time()
+        for name in os.listdir(self.sessions_dir):
+            if not name.endswith(".json"): continue
+            session_id = name[:-5]
+            try:
+                session = self.get(session_id)
+            except UploadError:
+                continue
+            if now - session.get("updated", 0) > SESSION_TTL_SECONDS:
+                print(f"🧹 Видаляю прострочену сесію докачки {session_id} ({session['filename']})")
+                with self._lock:
+                    self._discard(session_id)
@@ -1,50 +1,49 @@
 # generate_thumbnails.py
 import os
-from PIL import Image
+import json
+from thumbnailer import render_photo_sizes
 
 # Шляхи до папок, такі ж як у сервері
 STORAGE_PATH = "storage"
 ORIGINALS_PATH = os.path.join(STORAGE_PATH, "originals")
 THUMBNAILS_PATH = os.path.join(STORAGE_PATH, "thumbnails")
+SETTINGS_FILE = os.path.join(STORAGE_PATH, "settings.json")
 
-def create_thumbnail(image_path: str, thumbnail_path: str):
-    try:
-        size = (550, 550)
-        quality = 60
-        with Image.open(image_path) as img:
-            img.thumbnail(size)
-            if img.mode in ("RGBA", "LA"):
-                # Конвертуємо до RGB, якщо є альфа-канал
-                background = Image.new("RGB", img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[-1])
-                img = background
-            elif img.mode != "RGB":
-                img = img.convert("RGB")
-            img.save(thumbnail_path, "JPEG", quality=quality, optimize=True)
-        print(f"OK: Thumbnail created for {os.path.basename(image_path)}")
-    except Exception as e:
-        # Ігноруємо файли, які не є зображеннями (наприклад, .DS_Store)
-        if not image_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-             print(f"SKIP: Skipping non-image file {os.path.basename(image_path)}")
-        else:
-            print(f"ERROR: Could not create thumbnail for {os.path.basename(image_path)}: {e}")
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.heic', '.heif', '.webp')
+
+def load_preview_settings() -> tuple:
+    # Той самий розмір і якість, що й у сервера, щоб прев'ю не відрізнялись
+    settings = {"preview_size": 400, "preview_quality": 80}
+    if os.path.exists(SETTINGS_FILE):
+        try:
+            with open(SETTINGS_FILE, "r") as f:
+                settings.update(json.load(f))
+        except Exception:
+            pass
+    return settings["preview_size"], settings["preview_quality"]
 
 if __name__ == "__main__":
     print("Starting thumbnail generation...")
     os.makedirs(THUMBNAILS_PATH, exist_ok=True)
-    
+    size, quality = load_preview_settings()
+
     # Отримуємо список оригіналів та існуючих прев'ю
     original_files = set(os.listdir(ORIGINALS_PATH))
     thumbnail_files = set(os.listdir(THUMBNAILS_PATH))
 
     # Генеруємо прев'ю тільки для тих файлів, для яких їх ще немає
     for filename in original_files:
-        if filename not in thumbnail_files:
-            print(f"Processing {filename}...")
-            original_file_path = os.path.join(ORIGINALS_PATH, filename)
-            thumbnail_file_path = os.path.join(THUMBNAILS_PATH, filename)
-            create_thumbnail(original_file_path, thumbnail_file_path)
-        else:
-             print(f"SKIP: Thumbnail for {filename} already exists.")
+        # Ігноруємо файли, які не є зображеннями (наприклад, .DS_Store)
+        if not filename.lower().endswith(IMAGE_EXTENSIONS):
+            print(f"SKIP: Skipping non-image file {filename}")
+            continue
+        thumbnail_filename = f"{os.path.splitext(filename)[0]}.jpg"
+        if thumbnail_filename in thumbnail_files:
+            print(f"SKIP: Thumbnail for {filename} already exists.")
+            continue
+        print(f"Processing {filename}...")
+        original_file_path = os.path.join(ORIGINALS_PATH, filename)
+        if render_photo_sizes(original_file_path, [(os.path.join(THUMBNAILS_PATH, thumbnail_filename), size, quality)]):
+            print(f"OK: Thumbnail created for {filename}")
 
-    print("Done!")
\ No newline at end of file
+    print("Done!")
@@ -0,0 +1,99 @@
+# grouping.py - Індекс "моментів": серії фото, зроблені майже одночасно
+
+import threading
+
+# Ключ у catalog_meta: індекс груп уже повністю побудовано
+GROUPS_BUILT_KEY = "groups_built"
+
+
+class MomentGrouper:
+    """
+    Підтримує group_id у каталозі інкрементально.
+
+    Група — це максимальна послідовність знімків (за часом), де сусідні
+    відрізняються не більше ніж на `gap_seconds` і, якщо задано `similar`,
+    ще й схожі візуально. При зміні одного запису перераховується лише
+    ділянка часової шкали навколо нього, а не вся бібліотека.
+    """
+
+    def __init__(self, catalog, gap_seconds: float = 90, similar=None):
+        self.catalog = catalog
+        self.gap_seconds = gap_seconds
+        # similar(entry_a, entry_b) -> bool; None = групуємо тільки за часом
+        self.similar = similar
+        self._lock = threading.Lock()
+
+    def attach(self):
+        """Підписується на зміни каталогу і будує індекс, якщо його ще немає."""
+        self.catalog.add_listener(self.on_catalog_change)
+        if self.catalog.get_meta(GROUPS_BUILT_KEY) != "1":
+            self.rebuild()
+
+    def rebuild(self):
+        """Повна перебудова індексу за один прохід по часовій шкалі."""
+        with self._lock:
+            self._assign(self.catalog.timeline())
+            self.catalog.set_meta(GROUPS_BUILT_KEY, "1")
+        print("✅ Індекс груп (моментів) побудовано")
+
+    def on_catalog_change(self, timestamps: set):
+        with self._lock:
+            covered = []
+            for ts in sorted(timestamps):
+                if any(lo <= ts <= hi for lo, hi in covered): continue
+                lo, hi = self._region(ts)
+                self._assign(self.catalog.timeline(lo, hi))
+                covered.append((lo, hi))
+
+    def _region(self, timestamp: float) -> tuple:
+        """Межі ділянки шкали, яку може зачепити зміна в точці `timestamp`."""
+        lo = hi = timestamp
+        while True:
+            prev = self.catalog.timestamp_before(lo)
+            if prev is None or lo - prev > self.gap_seconds: break
+            lo = prev
+        while True:
+            nxt = self.catalog.timestamp_after(hi)
+            if nxt is None or nxt - hi > self.gap_seconds: break
+            hi = nxt
+        return lo, hi
+
+    def _starts_new_group(self, prev_entry: dict, entry: dict) -> bool:
+        if entry["timestamp"] - prev_entry["timestamp"] > self.gap_seconds: return True
+        return self.similar is not None and not self.similar(prev_entry, entry)
+
+    def _assign(self, timeline: list):
+        """Розбиває впорядковані записи на групи і записує лише змінені group_id."""
+        updates, group_id, prev_entry = {}, None, None
+        for filename, entry, current_group in timeline:
+            if prev_entry is None or self._starts_new_group(prev_entry, entry):
+                # Ідентифікатор групи — ім'я її найстаршого файлу, тож він стабільний
+                group_id = filename
+            if current_group != group_id:
+                updates[filename] = group_id
+            prev_entry = entry
+        self.catalog.set_group_ids(updates)
+
+
+def grouped_layout(rows: list, item_json) -> list:
+    """
+    Перетворює (filename, entry, group_id) від новіших до старіших у формат
+    /gallery/grouped/: {"type": "group", "items": [...]} або {"type": "single", "item": ...}.
+    """
+    layout, current_group, current_items = [], None, []
+
+    def flush():
+        if not current_items: return
+        if len(current_items) > 1:
+            layout.append({"type": "group", "timestamp": current_items[0]["timestamp"], "items": list(current_items)})
+        else:
+            layout.append({"type": "single", "timestamp": current_items[0]["timestamp"], "item": current_items[0]})
+
+    for filename, entry, group_id in rows:
+        if group_id is None or group_id != current_group:
+            flush()
+            current_items = []
+            current_group = group_id
+        current_items.append(item_json(filename, entry))
+    flush()
+    return layout
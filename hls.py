@@ -0,0 +1,408 @@
+# hls.py - HLS-трансляція відео: драбина бітрейтів через локальний ffmpeg,
+# сегменти на диску з лімітом у байтах
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import subprocess
+from collections import deque
+import ffmpeg
+from video_previews import probe_video
+
+# (назва, висота короткої сторони, відео кбіт/с, аудіо кбіт/с) — від найменшого:
+# перший варіант у master-плейлисті плеєр бере для старту
+HLS_LADDER = [
+    ("360p", 360, 800, 96),
+    ("720p", 720, 2500, 128),
+    ("1080p", 1080, 5000, 160),
+]
+
+# Короткі перші сегменти — плеєр стартує, щойно закодовано ~2 секунди
+HLS_INIT_SEGMENT_SECONDS = 2
+HLS_SEGMENT_SECONDS = 4
+# Одночасно кодуємо не більше стількох роликів (на Pi і один — відчутне навантаження)
+HLS_MAX_TRANSCODES = 1
+# Скільки чекати на перший сегмент, перш ніж віддати клієнту 503
+HLS_START_TIMEOUT = 20.0
+# Плеєр перечитує плейлист типу EVENT щонайменше раз на сегмент; якщо стільки
+# секунд не було жодного запиту, глядач пішов — кодування стає фоновим
+HLS_VIEWER_TIMEOUT = 3 * HLS_SEGMENT_SECONDS
+
+PLAYLIST_NAME = "index.m3u8"
+_COMPLETE_MARKER = "complete"
+_META_FILE = "meta.json"
+
+
+class HlsManager:
+    """
+    Сесія — це один ролик у одній версії: каталог `cache_dir/<id>/` з master-
+    плейлистом і підкаталогом на кожен варіант драбини. Усі варіанти кодуються
+    одним процесом ffmpeg (одне декодування оригіналу), плейлисти типу EVENT
+    доступні одразу після першого сегмента і доростають до кінця ролика.
+
+    Запити з плеєра мають пріоритет: фонова підготовка (`prepare`) іде лише
+    тоді, коли вільний слот, з пониженим пріоритетом процесу, і поступається
+    місцем, якщо ролик попросили переглянути. Кодування, яке запустив плеєр,
+    стає фоновим, щойно глядач гортає далі (`viewer_timeout` без запитів), тож
+    наступний ролик не чекає на слот. Закінчені сесії витісняються
+    найдавніше переглянутими першими, коли кеш перевищує `disk_budget` байт.
+    """
+
+    def __init__(self, cache_dir: str, disk_budget: int, ladder: list = None,
+                 max_transcodes: int = HLS_MAX_TRANSCODES, viewer_timeout: float = HLS_VIEWER_TIMEOUT):
+        self.cache_dir = cache_dir
+        self.disk_budget = disk_budget
+        self.ladder = ladder or HLS_LADDER
+        self.max_transcodes = max_transcodes
+        self.viewer_timeout = viewer_timeout
+        self._lock = threading.Condition()
+        self._active = {}      # session_id -> {"process", "background", "failed", "seen"}
+        self._waiting = deque()  # сесії з плеєра, що чекають на слот
+        self._idle = deque()     # (session_id, шлях) для фонової підготовки
+        self._idle_worker = None
+        os.makedirs(cache_dir, exist_ok=True)
+        self._cleanup_incomplete()
+        self.evict()
+
+    # --- Шляхи ---
+    @staticmethod
+    def session_id(filename: str, source_sig: str) -> str:
+        name_id = hashlib.sha1(filename.encode("utf-8")).hexdigest()[:12]
+        return f"{name_id}-{hashlib.sha1(source_sig.encode('utf-8')).hexdigest()[:12]}"
+
+    @staticmethod
+    def _valid_id(session_id: str) -> bool:
+        return bool(session_id) and all(c in "0123456789abcdef-" for c in session_id)
+
+    def _session_dir(self, session_id: str) -> str:
+        return os.path.join(self.cache_dir, session_id)
+
+    def rendition_names(self) -> set:
+        return {name for name, *_ in self.ladder}
+
+    def is_complete(self, session_id: str) -> bool:
+        return os.path.exists(os.path.join(self._session_dir(session_id), _COMPLETE_MARKER))
+
+    def _read_meta(self, session_id: str):
+        try:
+            with open(os.path.join(self._session_dir(session_id), _META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _touch(self, session_id: str):
+        try:
+            os.utime(self._session_dir(session_id))
+        except FileNotFoundError:
+            pass
+
+    def _seen(self, session_id: str):
+        """Запит від плеєра: сесію ще дивляться."""
+        with self._lock:
+            state = self._active.get(session_id)
+            if state is not None: state["seen"] = time.monotonic()
+
+    # --- Драбина ---
+    def _plan(self, video_path: str) -> list:
+        """Варіанти, не більші за оригінал (за короткою стороною), з розмірами кадру."""
+        info = probe_video(video_path)
+        width, height = info["width"], info["height"]
+        short_side = min(width, height) if width and height else None
+        plan = []
+        for name, rung, video_kbps, audio_kbps in self.ladder:
+            if short_side and rung > short_side and plan: break
+            target = min(rung, short_side) if short_side else rung
+            target -= target % 2
+            if width and height:
+                scale = target / short_side
+                size = (int(width * scale) // 2 * 2, int(height * scale) // 2 * 2)
+            else:
+                size = None
+            plan.append({"name": name, "short_side": target, "size": size, "portrait": bool(width and height and height > width),
+                         "video_kbps": video_kbps, "audio_kbps": audio_kbps})
+        return plan
+
+    def _ffmpeg_args(self, video_path: str, session_dir: str, plan: list) -> list:
+        source = ffmpeg.input(video_path)
+        split = source.video.filter_multi_output("split", len(plan))
+        outputs = []
+        for index, rendition in enumerate(plan):
+            side = rendition["short_side"]
+            width, height = (side, -2) if rendition["portrait"] else (-2, side)
+            video = split.stream(index).filter("scale", width, height)
+            rendition_dir = os.path.join(session_dir, rendition["name"])
+            os.makedirs(rendition_dir, exist_ok=True)
+            outputs.append(ffmpeg.output(
+                video, os.path.join(rendition_dir, PLAYLIST_NAME),
+                # Аудіо необов'язкове: "?" — не падати на німих роликах
+                map="0:a:0?",
+                vcodec="libx264", preset="veryfast", pix_fmt="yuv420p",
+                **{"b:v": f"{rendition['video_kbps']}k", "maxrate": f"{rendition['video_kbps']}k",
+                   "bufsize": f"{rendition['video_kbps'] * 2}k", "b:a": f"{rendition['audio_kbps']}k"},
+                # Ключовий кадр кожні 2 с: усі варіанти ріжуться на сегменти в тих самих місцях
+                force_key_frames=f"expr:gte(t,n_forced*{HLS_INIT_SEGMENT_SECONDS})",
+                acodec="aac", ac=2,
+                format="hls", hls_time=HLS_SEGMENT_SECONDS, hls_init_time=HLS_INIT_SEGMENT_SECONDS,
+                hls_playlist_type="event", hls_flags="independent_segments+temp_file",
+                hls_segment_filename=os.path.join(rendition_dir, "%05d.ts"),
+            ))
+        return (ffmpeg.merge_outputs(*outputs)
+                .global_args("-nostdin", "-loglevel", "error")
+                .overwrite_output().compile())
+
+    def _write_master(self, session_id: str, plan: list):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+        for rendition in plan:
+            bandwidth = (rendition["video_kbps"] + rendition["audio_kbps"]) * 1000
+            info = f"BANDWIDTH={int(bandwidth * 1.1)},AVERAGE-BANDWIDTH={bandwidth}"
+            if rendition["size"]: info += f",RESOLUTION={rendition['size'][0]}x{rendition['size'][1]}"
+            lines.append(f"#EXT-X-STREAM-INF:{info}")
+            # Абсолютний шлях: master віддається за іменем файлу, а сегменти — за сесією
+            lines.append(f"/hls/session/{session_id}/{rendition['name']}/{PLAYLIST_NAME}")
+        with open(os.path.join(self._session_dir(session_id), _META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"renditions": plan, "master": "\n".join(lines) + "\n"}, f, ensure_ascii=False)
+
+    # --- Кодування ---
+    def start(self, session_id: str, video_path: str) -> bool:
+        """
+        Запускає (або ставить у чергу) кодування для плеєра. True — сесія
+        готова або кодується; False — попередня спроба для цієї версії впала.
+        """
+        with self._lock:
+            self._touch(session_id)
+            if self.is_complete(session_id): return True
+            state = self._active.get(session_id)
+            if state is not None:
+                if state["failed"]: return False
+                if state["background"]: state["background"] = False  # далі — як запит плеєра
+                state["seen"] = time.monotonic()
+                return True
+            self._active[session_id] = {"process": None, "background": False, "failed": False, "seen": time.monotonic()}
+            self._waiting.append(session_id)
+            self._demote_abandoned()
+            self._preempt_background()
+        threading.Thread(target=self._run, args=(session_id, video_path), daemon=True).start()
+        return True
+
+    def prepare(self, session_id: str, video_path: str):
+        """Фонова підготовка (наприклад, після завантаження), коли сервер простоює."""
+        with self._lock:
+            if self.is_complete(session_id) or session_id in self._active: return
+            self._idle.append((session_id, video_path))
+            self._ensure_idle_worker()
+
+    def _ensure_idle_worker(self):
+        if self._idle_worker is None or not self._idle_worker.is_alive():
+            self._idle_worker = threading.Thread(target=self._idle_loop, daemon=True)
+            self._idle_worker.start()
+
+    def _running_count(self) -> int:
+        return sum(1 for state in self._active.values() if state["process"] is not None)
+
+    def _demote_abandoned(self):
+        """Кодування для плеєра, від якого давно немає запитів, переводить у фонові (під self._lock)."""
+        now = time.monotonic()
+        for session_id, state in self._active.items():
+            if state["background"] or state["failed"] or now - state["seen"] < self.viewer_timeout: continue
+            state["background"] = True
+            process = state["process"]
+            if process is not None:
+                try:
+                    os.setpriority(os.PRIO_PROCESS, process.pid, 10)
+                except (OSError, AttributeError):
+                    pass
+            elif session_id in self._waiting:
+                # Ще не почалось: нехай чекає на простій, а не на слот для плеєра
+                self._waiting.remove(session_id)
+                self._lock.notify_all()
+
+    def _preempt_background(self):
+        """Зупиняє фонове кодування, якщо на слот чекає плеєр (під self._lock)."""
+        if self._running_count() < self.max_transcodes: return
+        for session_id, state in self._active.items():
+            if state["background"] and state["process"] is not None:
+                state["preempted"] = True
+                state["process"].kill()  # результат усе одно викидаємо
+                return
+
+    def _idle_loop(self):
+        while True:
+            with self._lock:
+                while self._waiting or self._running_count() >= self.max_transcodes:
+                    self._lock.wait(timeout=5)
+                if not self._idle: return
+                session_id, video_path = self._idle.popleft()
+                if self.is_complete(session_id) or session_id in self._active: continue
+                self._active[session_id] = {"process": None, "background": True, "failed": False, "seen": 0.0}
+            self._run(session_id, video_path)
+
+    def _run(self, session_id: str, video_path: str):
+        session_dir = self._session_dir(session_id)
+        shutil.rmtree(session_dir, ignore_errors=True)
+        os.makedirs(session_dir, exist_ok=True)
+        started = time.time()
+        try:
+            plan = self._plan(video_path)
+            self._write_master(session_id, plan)
+            args = self._ffmpeg_args(video_path, session_dir, plan)
+        except Exception as e:
+            print(f"❌ HLS: не вдалося підготувати {os.path.basename(video_path)}: {e}")
+            self._finish(session_id, False)
+            return
+
+        with self._lock:
+            # Плеєри — у порядку запитів; фонові чекають, поки немає ні тих, ні вільного слота
+            while (self._running_count() >= self.max_transcodes
+                   or (self._waiting and self._waiting[0] != session_id)):
+                if session_id in self._waiting:
+                    # Слот може звільнитись і тоді, коли глядач іншого ролика гортає далі
+                    self._demote_abandoned()
+                    self._preempt_background()
+                self._lock.wait(timeout=1)
+            if session_id in self._waiting: self._waiting.remove(session_id)
+            state = self._active[session_id]
+            with open(os.path.join(session_dir, "ffmpeg.log"), "wb") as log:
+                state["process"] = subprocess.Popen(
+                    args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=log,
+                    preexec_fn=(lambda: os.nice(10)) if state["background"] else None)
+            process = state["process"]
+
+        ok = process.wait() == 0
+        with self._lock:
+            preempted = self._active[session_id].pop("preempted", False)
+        if preempted:
+            print(f"⏸️ HLS: фонове кодування {os.path.basename(video_path)} поступилося переглядові")
+            with self._lock:
+                del self._active[session_id]
+                self._idle.appendleft((session_id, video_path))
+                # Покинута плеєром сесія йшла у власному потоці — дороблятиме фоновий обробник
+                self._ensure_idle_worker()
+                self._lock.notify_all()
+            shutil.rmtree(session_dir, ignore_errors=True)
+            return
+        if ok:
+            print(f"🎬 HLS: {os.path.basename(video_path)} готове за {time.time() - started:.1f} с "
+                  f"({', '.join(r['name'] for r in plan)})")
+        else:
+            print(f"❌ HLS: ffmpeg завершився з помилкою для {os.path.basename(video_path)}")
+        self._finish(session_id, ok)
+
+    def _finish(self, session_id: str, ok: bool):
+        session_dir = self._session_dir(session_id)
+        if ok:
+            open(os.path.join(session_dir, _COMPLETE_MARKER), "w").close()
+            # Сесії попередніх версій цього ролика більше не знадобляться
+            name_id = session_id.split("-")[0]
+            with self._lock:
+                busy = set(self._active)
+            for name in os.listdir(self.cache_dir):
+                if name.startswith(f"{name_id}-") and name != session_id and name not in busy:
+                    shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+        with self._lock:
+            state = self._active.get(session_id)
+            if ok or state is None:
+                self._active.pop(session_id, None)
+            else:
+                # Пам'ятаємо невдачу, щоб плеєр не перезапускав ffmpeg на кожен запит
+                state["failed"], state["process"] = True, None
+            self._lock.notify_all()
+        if not ok: shutil.rmtree(session_dir, ignore_errors=True)
+        self.evict()
+
+    # --- Відповіді ---
+    def master_playlist(self, session_id: str):
+        meta = self._read_meta(session_id)
+        return meta["master"] if meta else None
+
+    def wait_for_master(self, session_id: str, timeout: float = HLS_START_TIMEOUT):
+        """Master-плейлист пишеться до запуску ffmpeg, тож чекати доводиться лише черги."""
+        return self._wait(session_id, lambda: self.master_playlist(session_id), timeout)
+
+    def media_playlist(self, session_id: str, rendition: str, timeout: float = HLS_START_TIMEOUT):
+        """Шлях до плейлиста варіанта, щойно в ньому з'явився хоча б один сегмент."""
+        if not self._valid_id(session_id) or rendition not in self.rendition_names(): return None
+        path = os.path.join(self._session_dir(session_id), rendition, PLAYLIST_NAME)
+
+        def ready():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    return path if "#EXTINF" in f.read() else None
+            except FileNotFoundError:
+                return None
+
+        self._touch(session_id)
+        self._seen(session_id)
+        return self._wait(session_id, ready, timeout)
+
+    def _wait(self, session_id: str, check, timeout: float):
+        deadline = time.monotonic() + timeout
+        while True:
+            result = check()
+            if result is not None: return result
+            with self._lock:
+                state = self._active.get(session_id)
+                if state is None or state["failed"]: return check()
+                state["seen"] = time.monotonic()  # запит плеєра ще відкритий
+            if time.monotonic() >= deadline: return None
+            time.sleep(0.25)
+
+    def segment_path(self, session_id: str, rendition: str, segment: str):
+        if not self._valid_id(session_id) or rendition not in self.rendition_names(): return None
+        stem, _, ext = segment.partition(".")
+        if ext != "ts" or not stem.isdigit(): return None
+        path = os.path.join(self._session_dir(session_id), rendition, segment)
+        if not os.path.exists(path): return None
+        self._seen(session_id)
+        return path
+
+    # --- Місце на диску ---
+    def _cleanup_incomplete(self):
+        """Після перезапуску незакінчені сесії нікому не належать — кодуємо наново за запитом."""
+        for item in os.scandir(self.cache_dir):
+            if item.is_dir() and not self.is_complete(item.name):
+                shutil.rmtree(item.path, ignore_errors=True)
+
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except FileNotFoundError:
+                    pass
+        return total
+
+    def set_disk_budget(self, disk_budget: int):
+        self.disk_budget = disk_budget
+        self.evict()
+
+    def usage(self) -> dict:
+        sessions = [item for item in os.scandir(self.cache_dir) if item.is_dir()]
+        with self._lock:
+            self._demote_abandoned()
+            active = [{"session": sid, "background": state["background"], "failed": state["failed"]}
+                      for sid, state in self._active.items()]
+        return {
+            "disk_bytes": sum(self._dir_size(item.path) for item in sessions),
+            "sessions": len(sessions),
+            "active": active,
+            "queued_background": len(self._idle),
+        }
+
+    def evict(self):
+        """Витісняє найдавніше переглянуті закінчені сесії, поки кеш не влізе в ліміт."""
+        sessions = []
+        for item in os.scandir(self.cache_dir):
+            if not item.is_dir(): continue
+            sessions.append((item.stat().st_mtime, item.name, self._dir_size(item.path)))
+        total = sum(size for _, _, size in sessions)
+        for _, session_id, size in sorted(sessions):
+            if total <= self.disk_budget: break
+            with self._lock:
+                if session_id in self._active: continue
+            shutil.rmtree(self._session_dir(session_id), ignore_errors=True)
+            total -= size
@@ -0,0 +1,148 @@
+# http_cache.py - Відповіді з валідаторами кешу (ETag/Last-Modified), 304 і Range/206
+
+import os
+import hashlib
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from starlette.responses import Response, StreamingResponse
+
+# Адреса без версії може почати віддавати інший вміст — клієнт щоразу перепитує (дешево, 304)
+CACHE_REVALIDATE = "private, no-cache"
+# Адреса з версією вмісту (?v=...) ніколи не змінюється
+CACHE_IMMUTABLE = "private, max-age=31536000, immutable"
+
+STREAM_CHUNK_SIZE = 256 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def make_etag(*parts) -> str:
+    """Сильний ETag з будь-яких частин, що однозначно визначають вміст."""
+    return '"' + hashlib.sha1(":".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def file_etag(st: os.stat_result) -> str:
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Слабке порівняння для If-None-Match: W/"x" і "x" вважаються однаковими."""
+    if header.strip() == "*": return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"): candidate = candidate[2:]
+        if candidate == bare: return True
+    return False
+
+
+def _parse_http_date(value: str):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def is_not_modified(request, etag: str, last_modified: float = None) -> bool:
+    """Чи є в клієнта актуальна копія (If-None-Match має пріоритет над If-Modified-Since)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if last_modified is not None and "if-modified-since" in request.headers:
+        since = _parse_http_date(request.headers["if-modified-since"])
+        return since is not None and int(last_modified) <= since
+    return False
+
+
+def parse_range(header: str, size: int):
+    """
+    (start, end) включно для одного діапазону 'bytes=...'; None — віддати весь файл
+    (заголовка немає, він некоректний або просить кілька діапазонів — RFC дозволяє
+    в такому разі відповісти 200). RangeNotSatisfiable, якщо діапазон поза файлом.
+    """
+    if not header or not header.strip().lower().startswith("bytes="): return None
+    spec = header.strip()[6:].strip()
+    if "," in spec: return None
+    start_s, sep, end_s = spec.partition("-")
+    if not sep: return None
+    try:
+        if start_s == "":
+            suffix = int(end_s)
+            if suffix <= 0: raise RangeNotSatisfiable()
+            start, end = max(0, size - suffix), size - 1
+        else:
+            start = int(start_s)
+            end = min(int(end_s), size - 1) if end_s else size - 1
+    except ValueError:
+        return None
+    if start < 0 or start >= size or start > end: raise RangeNotSatisfiable()
+    return start, end
+
+
+def _range_allowed(request, etag: str, last_modified: float) -> bool:
+    """If-Range: діапазон лише якщо у клієнта та сама версія, інакше — весь файл."""
+    if_range = request.headers.get("if-range")
+    if if_range is None: return True
+    if_range = if_range.strip()
+    if if_range.startswith('"'): return if_range == etag
+    if if_range.startswith("W/"): return False
+    since = _parse_http_date(if_range)
+    return since is not None and last_modified is not None and int(last_modified) == since
+
+
+def _respond(request, size: int, read_range, media_type: str, etag: str, last_modified,
+             cache_control: str, headers: dict) -> Response:
+    base_headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes", **(headers or {})}
+    if last_modified is not None:
+        base_headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=base_headers)
+    byte_range = None
+    if _range_allowed(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**base_headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        (start, end), status = byte_range, 206
+        base_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    base_headers["Content-Length"] = str(max(0, end - start + 1))
+    return StreamingResponse(read_range(start, end), status_code=status, media_type=media_type, headers=base_headers)
+
+
+def file_response(request, path: str, media_type: str = None, cache_control: str = CACHE_REVALIDATE,
+                  etag: str = None, headers: dict = None) -> Response:
+    """Файл з ETag/Last-Modified, 304 на умовні запити і підтримкою Range."""
+    st = os.stat(path)
+    media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    def read_range(start: int, end: int):
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not chunk: break
+                remaining -= len(chunk)
+                yield chunk
+
+    return _respond(request, st.st_size, read_range, media_type, etag or file_etag(st), st.st_mtime,
+                    cache_control, headers)
+
+
+def bytes_response(request, data: bytes, media_type: str, etag: str, cache_control: str = CACHE_REVALIDATE,
+                   headers: dict = None) -> Response:
+    """Те саме для вмісту в пам'яті (наприклад, з кешу рендерів)."""
+    def read_range(start: int, end: int):
+        yield data[start:end + 1]
+
+    return _respond(request, len(data), read_range, media_type, etag, None, cache_control, headers)
+
+
+def not_modified_response(etag: str, cache_control: str = CACHE_REVALIDATE, headers: dict = None) -> Response:
+    """304 без звернення до вмісту — коли ETag відомий заздалегідь."""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control, **(headers or {})})
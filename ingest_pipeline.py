@@ -0,0 +1,141 @@
+# ingest_pipeline.py - Поетапна фонова обробка завантажених файлів
+
+import time
+import uuid
+import queue
+import threading
+from collections import OrderedDict
+
+
+class IngestJob:
+    """Один файл, що проходить через етапи обробки."""
+
+    def __init__(self, filename: str, data: dict):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.data = data  # довільні дані для етапів (шлях, хеш, запис метаданих...)
+        self.status = "queued"
+        self.stage = None
+        self.result = None
+        self.created = time.time()
+        self.finished = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    def finish(self, status: str, result: dict = None):
+        """Завершує задачу достроково (наприклад, 'skipped') або після останнього етапу."""
+        self.status = status
+        self.result = result
+        self.finished = time.time()
+
+    def to_json(self) -> dict:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "result": self.result,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class IngestStage:
+    """
+    Етап конвеєра. `func(job)` обробляє одну задачу; якщо `batch` = True,
+    то `func(jobs)` отримує всі задачі, що накопичились у черзі (до `max_batch`).
+    """
+
+    def __init__(self, name: str, func, workers: int = 1, batch: bool = False, max_batch: int = 200):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch = batch
+        self.max_batch = max_batch
+
+
+class IngestPipeline:
+    """
+    Кожен етап має власну обмежену чергу і пул потоків, тож повільні прев'ю
+    не затримують ні прийом файлів, ні запис метаданих. Коли черга першого
+    етапу заповнена, submit() чекає — це природне обмеження навантаження.
+    """
+
+    def __init__(self, stages: list, max_queue: int = 256, history_limit: int = 5000, on_finish=None):
+        self.stages = stages
+        self.history_limit = history_limit
+        self.on_finish = on_finish
+        self._queues = [queue.Queue(maxsize=max_queue) for _ in stages]
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        for index, stage in enumerate(stages):
+            for n in range(stage.workers):
+                threading.Thread(target=self._worker, args=(index,), name=f"ingest-{stage.name}-{n}", daemon=True).start()
+
+    def submit(self, filename: str, **data) -> IngestJob:
+        job = IngestJob(filename, data)
+        with self._lock:
+            self._jobs[job.id] = job
+            # Старі завершені задачі забуваємо, щоб історія не росла безмежно
+            while len(self._jobs) > self.history_limit:
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if not oldest.done: break
+                del self._jobs[oldest_id]
+        self._queues[0].put(job)
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            "queues": {stage.name: q.qsize() for stage, q in zip(self.stages, self._queues)},
+            "active": sum(1 for job in jobs if not job.done),
+            "finished": sum(1 for job in jobs if job.done),
+        }
+
+    def _take(self, index: int) -> list:
+        stage, q = self.stages[index], self._queues[index]
+        jobs = [q.get()]
+        if stage.batch:
+            while len(jobs) < stage.max_batch:
+                try:
+                    jobs.append(q.get_nowait())
+                except queue.Empty:
+                    break
+        return jobs
+
+    def _worker(self, index: int):
+        stage = self.stages[index]
+        while True:
+            jobs = self._take(index)
+            for job in jobs:
+                job.stage, job.status = stage.name, "processing"
+            try:
+                if stage.batch: stage.func(jobs)
+                else: stage.func(jobs[0])
+            except Exception as e:
+                print(f"🛑 Помилка на етапі '{stage.name}': {e}")
+                for job in jobs:
+                    if not job.done: job.finish("error", {"filename": job.filename, "status": "error", "message": str(e)})
+            for job in jobs:
+                if job.done:
+                    self._finished(job)
+                elif index + 1 < len(self.stages):
+                    job.status = "queued"
+                    self._queues[index + 1].put(job)
+                else:
+                    job.finish("success", job.result)
+                    self._finished(job)
+
+    def _finished(self, job: IngestJob):
+        if self.on_finish is None: return
+        try:
+            self.on_finish(job)
+        except Exception as e:
+            print(f"⚠️ Помилка обробника завершення ingest: {e}")
@@ -0,0 +1,168 @@
+# jobs.py - Довгі фонові задачі (генерація прев'ю, пересканування) з прогресом і скасуванням
+
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """Стан однієї фонової задачі; оновлюється з робочого потоку, читається з ендпоінтів."""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "running"
+        self.message = ""
+        self.total = 0
+        self.processed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.result = None
+        self.started = time.time()
+        self.finished = None
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check_cancelled(self):
+        if self.cancelled: raise JobCancelled()
+
+    def to_json(self) -> dict:
+        elapsed = (self.finished or time.time()) - self.started
+        rate = self.processed / elapsed if elapsed > 0 and self.processed else 0.0
+        remaining = max(self.total - self.processed, 0)
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "message": self.message,
+            "total": self.total,
+            "processed": self.processed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "percent": round(100.0 * self.processed / self.total, 1) if self.total else (100.0 if self.finished else 0.0),
+            "rate_per_second": round(rate, 2),
+            "eta_seconds": round(remaining / rate, 1) if rate and self.status == "running" else None,
+            "elapsed_seconds": round(elapsed, 1),
+            "result": self.result,
+        }
+
+
+class JobManager:
+    """Запускає задачі у фонових потоках; одночасно — не більше однієї задачі кожного виду."""
+
+    def __init__(self, history_limit: int = 50):
+        self.history_limit = history_limit
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self, kind: str, func) -> tuple:
+        """
+        Запускає func(job) у потоці. Якщо задача цього виду вже йде,
+        повертає її. Повертає (job, created).
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.kind == kind and job.status == "running":
+                    return job, False
+            job = Job(kind)
+            self._jobs[job.id] = job
+            self._trim()
+        threading.Thread(target=self._run, args=(job, func), name=f"job-{kind}", daemon=True).start()
+        return job, True
+
+    def _run(self, job: Job, func):
+        try:
+            job.result = func(job)
+            job.status = "cancelled" if job.cancelled else "completed"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            print(f"🛑 Фонова задача {job.kind} завершилась з помилкою: {e}")
+            job.status, job.message = "failed", str(e)
+        finally:
+            job.finished = time.time()
+
+    def _trim(self):
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in sorted(finished, key=lambda j: j.finished)[:max(0, len(self._jobs) - self.history_limit)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.started, reverse=True)
+
+
+# --- Спільний пул процесів (по одному на ядро) ---
+# Не fork: сервер багатопотоковий (конвеєр, запис у каталог, стеження, uvicorn), і
+# скопійований посеред чужої критичної секції лок назавжди заблокує дочірній процес.
+# Процеси пулу стартують з чистого forkserver; thumbnailer і video_previews безпечні для імпорту.
+PROCESS_POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+_PROCESS_POOL = None
+_PROCESS_POOL_LOCK = threading.Lock()
+_PROCESS_POOL_INITIALIZER = (None, ())
+
+
+def set_process_pool_initializer(initializer, *initargs):
+    """Що виконати в кожному процесі пулу при старті; задається до першого get_process_pool()."""
+    global _PROCESS_POOL_INITIALIZER
+    _PROCESS_POOL_INITIALIZER = (initializer, initargs)
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _PROCESS_POOL
+    with _PROCESS_POOL_LOCK:
+        if _PROCESS_POOL is None:
+            initializer, initargs = _PROCESS_POOL_INITIALIZER
+            _PROCESS_POOL = ProcessPoolExecutor(max_workers=os.cpu_count() or 2, mp_context=PROCESS_POOL_CONTEXT,
+                                                initializer=initializer, initargs=initargs)
+        return _PROCESS_POOL
+
+
+def run_in_process_pool(job: Job, func, tasks: list, on_result, window: int = None):
+    """
+    Виконує func(task) для кожної задачі в пулі процесів і викликає
+    on_result(task, result_or_exception) у поточному потоці.
+    У пулі тримаємо лише `window` задач, тож скасування спрацьовує швидко,
+    а пам'ять не росте від тисяч очікуючих future.
+    """
+    pool = get_process_pool()
+    window = window or (pool._max_workers * 4)
+    pending, queue = {}, iter(tasks)
+    try:
+        while True:
+            while len(pending) < window and not job.cancelled:
+                task = next(queue, None)
+                if task is None: break
+                pending[pool.submit(func, task)] = task
+            if not pending: break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = e
+                on_result(task, result)
+    finally:
+        for future in pending:
+            future.cancel()
+    job.check_cancelled()
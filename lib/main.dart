@@ -39,6 +39,8 @@ final service = FlutterBackgroundService();
 final FlutterLocalNotificationsPlugin flutterLocalNotificationsPlugin = FlutterLocalNotificationsPlugin();
 const String notificationChannelId = 'sync_channel';
 const int progressNotificationId = 1;
+// Flutter декодує WebP, тож просимо сервер віддавати прев'ю в ньому (менше трафіку)
+const Map<String, String> imageAcceptHeaders = {'Accept': 'image/webp,image/jpeg;q=0.9'};
 
 
 // ===============================================================
@@ -49,8 +51,12 @@ class GalleryItem {
   final String type;
   final String thumbnail;
   final DateTime timestamp;
+  final String? version; // версія вмісту: адреси з ?v= сервер дозволяє кешувати назавжди
+  final String? placeholder; // BlurHash для заглушки, поки вантажиться прев'ю
 
-  GalleryItem({required this.filename, required this.type, required this.thumbnail, required this.timestamp});
+  GalleryItem({required this.filename, required this.type, required this.thumbnail, required this.timestamp, this.version, this.placeholder});
+
+  String get versionQuery => version == null ? '' : '?v=$version';
 
   factory GalleryItem.fromJson(Map<String, dynamic> json) {
     if (json['timestamp'] == null) throw Exception('Missing timestamp for item: ${json['filename']}');
@@ -61,6 +67,8 @@ class GalleryItem {
       type: json['type'],
       thumbnail: json['thumbnail'],
       timestamp: DateTime.fromMillisecondsSinceEpoch((timestampValue * 1000).toInt()),
+      version: json['version'],
+      placeholder: json['placeholder'],
     );
   }
 }
@@ -144,6 +152,11 @@ class ApiService {
   ApiService(this._prefs);
   Future<String> getBaseUrl() async => _prefs.getString('server_ip') ?? '';
 
+  // Остання отримана галерея та її ETag (версія каталогу на сервері).
+  // Якщо на сервері нічого не змінилось, він відповідає 304 і ми не качаємо список знову.
+  String? _galleryEtag;
+  List<GalleryItem>? _galleryCache;
+
   Future<List<GalleryItem>> fetchGalleryItems() async {
     final baseUrl = await getBaseUrl();
     if (baseUrl.isEmpty) {
@@ -152,7 +165,12 @@ class ApiService {
         throw Exception('IP адреса сервера не налаштована.');
     }
     try {
-      final response = await http.get(Uri.parse('$baseUrl/gallery/')).timeout(const Duration(seconds: 15));
+      final headers = <String, String>{};
+      if (_galleryEtag != null && _galleryCache != null) headers['If-None-Match'] = _galleryEtag!;
+      final response = await http.get(Uri.parse('$baseUrl/gallery/'), headers: headers).timeout(const Duration(seconds: 15));
+      if (response.statusCode == 304 && _galleryCache != null) {
+        return _galleryCache!;
+      }
       if (response.statusCode == 200) {
         final List<dynamic> data = json.decode(utf8.decode(response.bodyBytes));
         final List<GalleryItem> validItems = [];
@@ -163,6 +181,8 @@ class ApiService {
             print('Skipping invalid item: $e');
           }
         }
+        _galleryEtag = response.headers['etag'];
+        _galleryCache = validItems;
         return validItems;
       } else {
         throw Exception('Failed to load gallery (status code: ${response.statusCode})');
@@ -1146,8 +1166,8 @@ Widget build(BuildContext context) {
                                       future: apiService.getBaseUrl(),
                                       builder: (context, urlSnapshot) {
                                         if (!urlSnapshot.hasData || urlSnapshot.data!.isEmpty) return const SizedBox.shrink();
-                                        final thumbnailUrl = '${urlSnapshot.data}/thumbnail/${item.thumbnail}';
-                                        return CachedNetworkImage(imageUrl: thumbnailUrl, fit: BoxFit.cover, placeholder: (c, u) => Container(color: Colors.grey.withOpacity(0.1)), errorWidget: (c, u, e) => const Icon(Icons.error));
+                                        final thumbnailUrl = '${urlSnapshot.data}/thumbnail/${item.thumbnail}${item.versionQuery}';
+                                        return CachedNetworkImage(imageUrl: thumbnailUrl, httpHeaders: imageAcceptHeaders, fit: BoxFit.cover, placeholder: (c, u) => Container(color: Colors.grey.withOpacity(0.1)), errorWidget: (c, u, e) => const Icon(Icons.error));
                                       },
                                     ),
                                     if (item.type == 'video') Center(child: Container(decoration: BoxDecoration(color: Colors.black.withOpacity(0.5), shape: BoxShape.circle), child: const Icon(Icons.play_arrow, color: Colors.white, size: 24))),
@@ -1250,20 +1270,28 @@ return PageView.builder(
   itemCount: widget.galleryItems.length,
   itemBuilder: (context, index) {
     final item = widget.galleryItems[index];
-    final fileUrl = '$baseUrl/original_resized/${item.filename}';
-    final thumbUrl = '$baseUrl/thumbnail/${item.thumbnail}';
+    final videoUrl = '$baseUrl/hls/${Uri.encodeComponent(item.filename)}/master.m3u8';
+    final progressiveUrl = '$baseUrl/original_resized/${Uri.encodeComponent(item.filename)}';
+    final thumbUrl = '$baseUrl/thumbnail/${item.thumbnail}${item.versionQuery}';
+    // Для фото беремо прев'ю під фізичний розмір екрана, а не весь оригінал
+    final screen = MediaQuery.of(context);
+    final screenPixels = (screen.size.longestSide * screen.devicePixelRatio).round();
+    final screenImageUrl = '$baseUrl/thumbnail/$screenPixels/${Uri.encodeComponent(item.filename)}${item.versionQuery}';
 
     if (item.type == 'image') {
   return _FullScreenImageWithFadePhotoView(
     thumbnailUrl: thumbUrl,
-    fullImageUrl: fileUrl,
+    fullImageUrl: screenImageUrl,
     photoViewController: _photoViewController,
     heroTag: item.filename, // Додаємо heroTag
   );
 } else if (item.type == 'video') {
+      // Відео — через HLS: старт за кілька секунд і бітрейт під мережу;
+      // якщо сервер не зміг його закодувати — звичайний файл
       return MediaPageWidget(
         item: item,
-        fileUrl: fileUrl,
+        fileUrl: videoUrl,
+        fallbackUrl: progressiveUrl,
         pageStream: _pageStreamController.stream,
         pageIndex: index,
         isCurrentPage: index == widget.initialIndex,
@@ -1345,6 +1373,7 @@ class _FullScreenImageWithFadePhotoViewState extends State<_FullScreenImageWithF
         if (_showThumb)
           CachedNetworkImage(
             imageUrl: widget.thumbnailUrl,
+            httpHeaders: imageAcceptHeaders,
             fit: BoxFit.contain,
             fadeInDuration: Duration.zero,
             fadeOutDuration: Duration.zero,
@@ -1353,6 +1382,7 @@ class _FullScreenImageWithFadePhotoViewState extends State<_FullScreenImageWithF
         if (_fullImageProvider == null)
           CachedNetworkImage(
             imageUrl: widget.fullImageUrl,
+            httpHeaders: imageAcceptHeaders,
             fit: BoxFit.contain,
             fadeInDuration: Duration.zero,
             fadeOutDuration: Duration.zero,
@@ -1390,10 +1420,11 @@ class _FullScreenImageWithFadePhotoViewState extends State<_FullScreenImageWithF
 class MediaPageWidget extends StatefulWidget {
   final GalleryItem item;
   final String fileUrl;
+  final String? fallbackUrl;
   final Stream<int> pageStream;
   final int pageIndex;
   final bool isCurrentPage;
-  const MediaPageWidget({Key? key, required this.item, required this.fileUrl, required this.pageStream, required this.pageIndex, required this.isCurrentPage}) : super(key: key);
+  const MediaPageWidget({Key? key, required this.item, required this.fileUrl, this.fallbackUrl, required this.pageStream, required this.pageIndex, required this.isCurrentPage}) : super(key: key);
   @override
   State<MediaPageWidget> createState() => _MediaPageWidgetState();
 }
@@ -1417,7 +1448,17 @@ class _MediaPageWidgetState extends State<MediaPageWidget> {
 
   Future<void> _initializeVideoPlayer() async {
     _videoController = VideoPlayerController.networkUrl(Uri.parse(widget.fileUrl));
-    await _videoController!.initialize();
+    try {
+      await _videoController!.initialize();
+    } catch (e) {
+      // HLS недоступне (немає ffmpeg, кодування впало, сервер зайнятий) — граємо файл напряму
+      final failed = _videoController;
+      _videoController = null;
+      await failed?.dispose();
+      if (_isDisposed || widget.fallbackUrl == null) return;
+      _videoController = VideoPlayerController.networkUrl(Uri.parse(widget.fallbackUrl!));
+      await _videoController!.initialize();
+    }
     if (_isDisposed) return;
     _createChewieController();
     if (mounted) {
@@ -1468,7 +1509,7 @@ class _MediaPageWidgetState extends State<MediaPageWidget> {
         child: _FullScreenImageWithFade(
           thumbnailUrl: () async {
             final baseUrl = await apiService.getBaseUrl();
-            return '$baseUrl/thumbnail/${widget.item.thumbnail}';
+            return '$baseUrl/thumbnail/${widget.item.thumbnail}${widget.item.versionQuery}';
           },
           fullImageUrl: widget.fileUrl,
         ),
@@ -1519,6 +1560,7 @@ class _FullScreenImageWithFadeState extends State<_FullScreenImageWithFade> {
             // 1. Мініатюра на весь екран
             CachedNetworkImage(
               imageUrl: thumbUrl,
+              httpHeaders: imageAcceptHeaders,
               fit: BoxFit.contain,
               fadeInDuration: Duration.zero,
               fadeOutDuration: Duration.zero,
@@ -1530,6 +1572,7 @@ class _FullScreenImageWithFadeState extends State<_FullScreenImageWithFade> {
               curve: Curves.easeInOut,
               child: CachedNetworkImage(
                 imageUrl: widget.fullImageUrl,
+                httpHeaders: imageAcceptHeaders,
                 fit: BoxFit.contain,
                 fadeInDuration: Duration.zero,
                 fadeOutDuration: Duration.zero,
@@ -2093,7 +2136,7 @@ Future<void> _generateAllThumbnails() async {
     if (baseUrl.isEmpty) return;
     final resp = await http.post(Uri.parse('$baseUrl/thumbnails/generate_all/'));
     if (resp.statusCode == 200) {
-      ScaffoldMessenger.of(context).showSnackBar(const SnackBar(content: Text('Мініатюри згенеровано')));
+      ScaffoldMessenger.of(context).showSnackBar(const SnackBar(content: Text('Генерацію мініатюр запущено у фоні')));
     } else {
       ScaffoldMessenger.of(context).showSnackBar(SnackBar(content: Text('Помилка генерації: ${resp.body}')));
     }
@@ -2264,7 +2307,11 @@ Future<void> _loadSelectedSyncFolders() async {
         }),
       );
       if (resp.statusCode == 200) {
-        ScaffoldMessenger.of(context).showSnackBar(const SnackBar(content: Text('Налаштування збережено')));
+        final data = json.decode(resp.body);
+        final message = data['thumbnails_job'] != null
+            ? 'Налаштування збережено, мініатюри оновлюються у фоні'
+            : 'Налаштування збережено';
+        ScaffoldMessenger.of(context).showSnackBar(SnackBar(content: Text(message)));
       }
     } finally {
       setState(() => _isLoading = false);
@@ -2285,7 +2332,8 @@ String _formatFolderPath(String fullPath) {
       if (baseUrl.isEmpty) return;
       final resp = await http.post(Uri.parse('$baseUrl/thumbnails/clear_cache/'));
       if (resp.statusCode == 200) {
-        ScaffoldMessenger.of(context).showSnackBar(const SnackBar(content: Text('Кеш мініатюр очищено')));
+        // Старі мініатюри лишаються в галереї, поки сервер не зробить нові
+        ScaffoldMessenger.of(context).showSnackBar(const SnackBar(content: Text('Мініатюри перебудовуються у фоні')));
       }
     } finally {
       setState(() => _isLoading = false);
@@ -2478,8 +2526,8 @@ SwitchListTile(
             const SizedBox(height: 8),
             ListTile(
               leading: const Icon(Icons.cleaning_services_outlined),
-              title: const Text('Очистити кеш мініатюр на сервері'),
-              subtitle: const Text('Видалити згенеровані мініатюри на сервері. Вони будуть створені заново при наступному запиті.'),
+              title: const Text('Перебудувати кеш мініатюр на сервері'),
+              subtitle: const Text('Створити всі мініатюри заново у фоні. Поки нові не готові, галерея показує старі.'),
               shape: RoundedRectangleBorder(borderRadius: BorderRadius.circular(12)),
               tileColor: colorScheme.surfaceVariant.withOpacity(0.3),
               onTap: _isLoading ? null : _clearThumbnailsCache,
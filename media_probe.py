@@ -0,0 +1,539 @@
+# media_probe.py - Метадані медіафайлу за один прохід по заголовках (JPEG/PNG/HEIC/MP4/MOV)
+#
+# Читаємо лише службові частини файлу: сегменти JPEG до початку скану,
+# чанки PNG до IDAT, бокси ISO BMFF (HEIC/MP4/MOV) без mdat і без таблиць
+# семплів. Пікселі й кадри не декодуються.
+
+import os
+import re
+import math
+import struct
+from datetime import datetime, timezone, timedelta
+
+# Верхня межа для одного блоку метаданих, який читаємо цілком (EXIF, meta у HEIC)
+MAX_METADATA_BLOCK = 4 * 1024 * 1024
+
+# Секунди між 1904-01-01 (епоха QuickTime) і 1970-01-01
+_MAC_EPOCH_OFFSET = 2082844800
+
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_HEIF_BRANDS = {b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"mif1", b"msf1", b"avif"}
+
+# Теги TIFF/EXIF, які нас цікавлять
+_TAG_MAKE, _TAG_MODEL, _TAG_ORIENTATION, _TAG_DATETIME = 0x010F, 0x0110, 0x0112, 0x0132
+_TAG_EXIF_IFD, _TAG_GPS_IFD = 0x8769, 0x8825
+_TAG_DATETIME_ORIGINAL, _TAG_DATETIME_DIGITIZED = 0x9003, 0x9004
+_TAG_OFFSET_TIME_ORIGINAL = 0x9011
+_TAG_PIXEL_X, _TAG_PIXEL_Y = 0xA002, 0xA003
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+
+
+class _CountingFile:
+    """Обгортка над файлом, що рахує прочитані байти (для бенчмарку)."""
+
+    def __init__(self, f):
+        self._f = f
+        self.bytes_read = 0
+
+    def read(self, size: int) -> bytes:
+        data = self._f.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = 0):
+        return self._f.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._f.tell()
+
+
+def probe(path: str) -> dict:
+    """
+    Метадані файлу одним проходом по заголовках. Ключі (лише відомі значення):
+    format, taken_at (Unix-час зйомки), width, height (як показується, з
+    урахуванням повороту), orientation (EXIF 1..8), rotation (градуси для
+    відео/HEIC), camera_make, camera_model, gps {lat, lon[, alt]},
+    duration (с), video_codec, audio_codec, bytes_read.
+    Невідомий формат або пошкоджений файл — словник лише з bytes_read.
+    """
+    with open(path, "rb") as raw:
+        f = _CountingFile(raw)
+        size = os.fstat(raw.fileno()).st_size
+        head = f.read(16)
+        info = {}
+        try:
+            if head.startswith(b"\xff\xd8"):
+                info = _probe_jpeg(f)
+            elif head.startswith(b"\x89PNG\r\n\x1a\n"):
+                info = _probe_png(f)
+            elif head[4:8] == b"ftyp":
+                info = _probe_bmff(f, size)
+        except Exception:
+            # Пошкоджений заголовок або поле несподіваного типу — беремо те, що встигли прочитати
+            pass
+        info = {k: v for k, v in info.items() if v is not None}
+        info["bytes_read"] = f.bytes_read
+        return info
+
+
+# ======================================================================
+# TIFF / EXIF
+# ======================================================================
+def _parse_exif_datetime(value, offset=None):
+    """'YYYY:MM:DD HH:MM:SS' (+ необов'язкове зміщення '+03:00') у Unix-час."""
+    # Тип поля задає файл: дата, записана як UNDEFINED, приходить байтами — таку пропускаємо
+    if not value or not isinstance(value, str): return None
+    try:
+        dt = datetime.strptime(value.strip("\x00 ")[:19], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+    if offset and isinstance(offset, str):
+        try:
+            sign = -1 if offset.startswith("-") else 1
+            hours, minutes = offset.strip("+- \x00").split(":")
+            dt = dt.replace(tzinfo=timezone(sign * timedelta(hours=int(hours), minutes=int(minutes))))
+        except ValueError:
+            pass
+    # Без зміщення EXIF-час — місцевий час камери, тлумачимо його як місцевий час сервера
+    return dt.timestamp()
+
+
+def _read_ifd(data: bytes, offset: int, endian: str) -> dict:
+    """Тег -> значення для одного IFD (рядки, числа або кортежі)."""
+    entries = {}
+    if not isinstance(offset, int) or offset <= 0 or offset + 2 > len(data): return entries
+    count = struct.unpack_from(endian + "H", data, offset)[0]
+    for i in range(count):
+        pos = offset + 2 + i * 12
+        if pos + 12 > len(data): break
+        tag, typ, n = struct.unpack_from(endian + "HHI", data, pos)
+        unit = _TYPE_SIZES.get(typ)
+        if unit is None: continue
+        length = unit * n
+        value_pos = pos + 8 if length <= 4 else struct.unpack_from(endian + "I", data, pos + 8)[0]
+        if value_pos + length > len(data): continue
+        raw = data[value_pos:value_pos + length]
+        if typ == 2:
+            entries[tag] = raw.split(b"\x00", 1)[0].decode("utf-8", errors="replace").strip()
+        elif typ in (3, 8):
+            entries[tag] = struct.unpack(endian + ("H" if typ == 3 else "h") * n, raw)
+        elif typ in (4, 9):
+            entries[tag] = struct.unpack(endian + ("I" if typ == 4 else "i") * n, raw)
+        elif typ in (5, 10):
+            nums = struct.unpack(endian + ("I" if typ == 5 else "i") * (2 * n), raw)
+            entries[tag] = tuple(nums[j] / nums[j + 1] if nums[j + 1] else 0.0 for j in range(0, len(nums), 2))
+        else:
+            entries[tag] = raw
+    return entries
+
+
+def _number(value):
+    """Перше число з числового тегу (кортежу); None, якщо тег іншого типу."""
+    if isinstance(value, tuple) and value and isinstance(value[0], (int, float)): return value[0]
+    return None
+
+
+def _text(value):
+    return value if isinstance(value, str) and value else None
+
+
+def _gps_coordinate(values, ref):
+    if not isinstance(values, tuple) or len(values) < 3: return None
+    degrees = values[0] + values[1] / 60 + values[2] / 3600
+    return round(-degrees if ref in ("S", "W") else degrees, 7)
+
+
+def _parse_tiff(data: bytes) -> dict:
+    """Дата зйомки, камера, орієнтація, розміри і GPS з блоку TIFF (EXIF)."""
+    if len(data) < 8 or data[:2] not in (b"II", b"MM"): return {}
+    endian = "<" if data[:2] == b"II" else ">"
+    ifd0 = _read_ifd(data, struct.unpack_from(endian + "I", data, 4)[0], endian)
+    exif = _read_ifd(data, _number(ifd0.get(_TAG_EXIF_IFD)), endian)
+    gps = _read_ifd(data, _number(ifd0.get(_TAG_GPS_IFD)), endian)
+
+    info = {
+        "taken_at": (_parse_exif_datetime(exif.get(_TAG_DATETIME_ORIGINAL), exif.get(_TAG_OFFSET_TIME_ORIGINAL))
+                     or _parse_exif_datetime(exif.get(_TAG_DATETIME_DIGITIZED))
+                     or _parse_exif_datetime(ifd0.get(_TAG_DATETIME))),
+        "camera_make": _text(ifd0.get(_TAG_MAKE)),
+        "camera_model": _text(ifd0.get(_TAG_MODEL)),
+        "orientation": _number(ifd0.get(_TAG_ORIENTATION)),
+        "exif_width": _number(exif.get(_TAG_PIXEL_X)),
+        "exif_height": _number(exif.get(_TAG_PIXEL_Y)),
+    }
+    lat = _gps_coordinate(gps.get(2), gps.get(1))
+    lon = _gps_coordinate(gps.get(4), gps.get(3))
+    if lat is not None and lon is not None:
+        info["gps"] = {"lat": lat, "lon": lon}
+        altitude = _number(gps.get(6))
+        if altitude is not None:
+            below = isinstance(gps.get(5), bytes) and gps[5][:1] == b"\x01"
+            info["gps"]["alt"] = round(-altitude if below else altitude, 1)
+    return info
+
+
+def _oriented(width, height, orientation):
+    """Розміри так, як кадр показується: орієнтації 5-8 міняють сторони місцями."""
+    if width and height and orientation in (5, 6, 7, 8): return height, width
+    return width, height
+
+
+# ======================================================================
+# JPEG
+# ======================================================================
+def _probe_jpeg(f) -> dict:
+    info, width, height = {"format": "jpeg"}, None, None
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF: break
+        code = marker[1]
+        if code == 0xFF:  # заповнювач між сегментами
+            f.seek(-1, 1)
+            continue
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7: continue
+        if code in (0xD9, 0xDA): break  # далі лише стиснені дані
+        length = struct.unpack(">H", f.read(2))[0]
+        if code == 0xE1 and length <= MAX_METADATA_BLOCK:
+            payload = f.read(length - 2)
+            if payload.startswith(b"Exif\x00\x00"):
+                info.update(_parse_tiff(payload[6:]))
+            continue
+        if code in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">xHH", f.read(5))
+            f.seek(length - 7, 1)
+            break  # SOF іде після APP-сегментів — решта нас не цікавить
+        f.seek(length - 2, 1)
+    info["width"], info["height"] = _oriented(width or info.get("exif_width"),
+                                              height or info.get("exif_height"), info.get("orientation"))
+    info.pop("exif_width", None)
+    info.pop("exif_height", None)
+    return info
+
+
+# ======================================================================
+# PNG
+# ======================================================================
+def _probe_png(f) -> dict:
+    info = {"format": "png"}
+    f.seek(8)
+    while True:
+        header = f.read(8)
+        if len(header) < 8: break
+        length, kind = struct.unpack(">I4s", header)
+        if kind == b"IHDR":
+            info["width"], info["height"] = struct.unpack(">II", f.read(8))
+            f.seek(length - 8 + 4, 1)
+        elif kind == b"eXIf" and length <= MAX_METADATA_BLOCK:
+            exif = _parse_tiff(f.read(length))
+            info.update({k: v for k, v in exif.items() if k not in ("exif_width", "exif_height")})
+            f.seek(4, 1)
+        elif kind in (b"IDAT", b"IEND"):
+            break  # eXIf за стандартом іде до даних зображення
+        else:
+            f.seek(length + 4, 1)
+    info["width"], info["height"] = _oriented(info.get("width"), info.get("height"), info.get("orientation"))
+    return info
+
+
+# ======================================================================
+# ISO BMFF: HEIC / MP4 / MOV
+# ======================================================================
+def _iter_boxes(f, start: int, end: int):
+    """(тип, початок вмісту, кінець вмісту) для боксів у [start, end); вміст не читається."""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8: return
+        size, kind = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_size: return
+        yield kind, pos + header_size, min(pos + size, end)
+        pos += size
+
+
+def _read_box(f, start: int, end: int, limit: int = MAX_METADATA_BLOCK) -> bytes:
+    f.seek(start)
+    return f.read(min(end - start, limit))
+
+
+def _probe_bmff(f, size: int) -> dict:
+    boxes = {kind: (start, end) for kind, start, end in _iter_boxes(f, 0, size) if kind in (b"ftyp", b"meta", b"moov")}
+    ftyp = _read_box(f, *boxes[b"ftyp"], limit=256) if b"ftyp" in boxes else b""
+    brands = {ftyp[i:i + 4] for i in range(0, len(ftyp), 4)} - {ftyp[4:8]} if ftyp else set()
+    major = ftyp[:4]
+    if b"meta" in boxes and (major in _HEIF_BRANDS or brands & _HEIF_BRANDS) and b"moov" not in boxes:
+        return _probe_heif(f, *boxes[b"meta"], avif=major == b"avif")
+    if b"moov" in boxes:
+        info = _probe_moov(f, *boxes[b"moov"])
+        info["format"] = "mov" if major == b"qt  " else "mp4"
+        return info
+    return {}
+
+
+# --- HEIC ---
+def _probe_heif(f, start: int, end: int, avif: bool = False) -> dict:
+    info = {"format": "avif" if avif else "heic"}
+    meta = _read_box(f, start, end)
+    children = {}
+    for kind, s, e in _iter_boxes(_BytesFile(meta), 4, len(meta)):  # meta — FullBox
+        children.setdefault(kind, (s, e))
+
+    primary = None
+    if b"pitm" in children:
+        s, _ = children[b"pitm"]
+        primary = struct.unpack_from(">H" if meta[s] == 0 else ">I", meta, s + 4)[0]
+    exif_items = _heif_items_of_type(meta, children.get(b"iinf"), b"Exif")
+    properties = _heif_item_properties(meta, children.get(b"iprp"))
+
+    for prop_kind, prop in properties.get(primary, []):
+        if prop_kind == b"ispe":
+            info["width"], info["height"] = struct.unpack_from(">II", prop, 4)
+        elif prop_kind == b"irot":
+            info["rotation"] = (prop[0] & 3) * 90
+    if info.get("rotation") in (90, 270) and info.get("width"):
+        info["width"], info["height"] = info["height"], info["width"]
+
+    if exif_items and b"iloc" in children:
+        locations = _heif_item_locations(meta, *children[b"iloc"])
+        location = locations.get(exif_items[0])
+        if location:
+            offset, length = location
+            f.seek(offset)
+            payload = f.read(min(length, MAX_METADATA_BLOCK))
+            if len(payload) >= 4:
+                tiff_start = 4 + struct.unpack_from(">I", payload, 0)[0]
+                exif = _parse_tiff(payload[tiff_start:])
+                # Для HEIC орієнтацію задає irot; EXIF-поле лише інформаційне
+                info.update({k: v for k, v in exif.items() if k not in ("exif_width", "exif_height", "orientation")})
+    return info
+
+
+class _BytesFile:
+    """Мінімальний файловий інтерфейс над bytes для _iter_boxes."""
+
+    def __init__(self, data: bytes):
+        self._data, self._pos = data, 0
+
+    def seek(self, offset: int, whence: int = 0):
+        self._pos = offset if whence == 0 else self._pos + offset
+
+    def read(self, size: int) -> bytes:
+        chunk = self._data[self._pos:self._pos + size]
+        self._pos += len(chunk)
+        return chunk
+
+
+def _heif_items_of_type(meta: bytes, box, item_type: bytes) -> list:
+    if not box: return []
+    start, end = box
+    version = meta[start]
+    count_size = 2 if version == 0 else 4
+    items = []
+    for kind, s, e in _iter_boxes(_BytesFile(meta), start + 4 + count_size, end):
+        if kind != b"infe" or meta[s] < 2: continue
+        if meta[s] == 2:
+            item_id, kind_at = struct.unpack_from(">H", meta, s + 4)[0], s + 8
+        else:
+            item_id, kind_at = struct.unpack_from(">I", meta, s + 4)[0], s + 10
+        if meta[kind_at:kind_at + 4] == item_type: items.append(item_id)
+    return items
+
+
+def _heif_item_properties(meta: bytes, box) -> dict:
+    """item_id -> [(тип властивості, вміст)] з iprp/ipco + ipma."""
+    if not box: return {}
+    reader = _BytesFile(meta)
+    ipco, ipma = None, None
+    for kind, s, e in _iter_boxes(reader, *box):
+        if kind == b"ipco": ipco = (s, e)
+        elif kind == b"ipma": ipma = (s, e)
+    if not ipco or not ipma: return {}
+    props = [(kind, meta[s:e]) for kind, s, e in _iter_boxes(reader, *ipco)]
+    start, _ = ipma
+    version, flags = meta[start], int.from_bytes(meta[start + 1:start + 4], "big")
+    count = struct.unpack_from(">I", meta, start + 4)[0]
+    pos, result = start + 8, {}
+    for _ in range(count):
+        if version < 1:
+            item_id = struct.unpack_from(">H", meta, pos)[0]; pos += 2
+        else:
+            item_id = struct.unpack_from(">I", meta, pos)[0]; pos += 4
+        associations = meta[pos]; pos += 1
+        for _ in range(associations):
+            if flags & 1:
+                index = struct.unpack_from(">H", meta, pos)[0] & 0x7FFF; pos += 2
+            else:
+                index = meta[pos] & 0x7F; pos += 1
+            if 0 < index <= len(props): result.setdefault(item_id, []).append(props[index - 1])
+    return result
+
+
+def _heif_item_locations(meta: bytes, start: int, end: int) -> dict:
+    """item_id -> (зміщення у файлі, довжина) першого екстенту з iloc."""
+    version = meta[start]
+    pos = start + 4
+    offset_size, length_size = meta[pos] >> 4, meta[pos] & 0xF
+    base_offset_size, index_size = meta[pos + 1] >> 4, (meta[pos + 1] & 0xF) if version in (1, 2) else 0
+    pos += 2
+
+    def read_uint(n):
+        nonlocal pos
+        value = int.from_bytes(meta[pos:pos + n], "big") if n else 0
+        pos += n
+        return value
+
+    count = read_uint(2 if version < 2 else 4)
+    locations = {}
+    for _ in range(count):
+        item_id = read_uint(2 if version < 2 else 4)
+        method = read_uint(2) & 0xF if version in (1, 2) else 0
+        read_uint(2)  # data_reference_index
+        base = read_uint(base_offset_size)
+        extents = read_uint(2)
+        first = None
+        for _ in range(extents):
+            read_uint(index_size)
+            extent_offset, extent_length = read_uint(offset_size), read_uint(length_size)
+            if first is None: first = (base + extent_offset, extent_length)
+        if first and method == 0: locations[item_id] = first
+    return locations
+
+
+# --- MP4 / MOV ---
+_CONTAINERS = {b"trak", b"mdia", b"minf", b"stbl", b"udta"}
+
+
+def _fixed_16_16(value: int) -> float:
+    if value >= 1 << 31: value -= 1 << 32
+    return value / 65536.0
+
+
+def _parse_iso6709(value: str):
+    """'+50.4501+030.5234+179.000/' -> {lat, lon[, alt]}."""
+    match = re.match(r"([+-]\d+(?:\.\d+)?)([+-]\d+(?:\.\d+)?)([+-]\d+(?:\.\d+)?)?", value.strip())
+    if not match: return None
+    gps = {"lat": round(float(match.group(1)), 7), "lon": round(float(match.group(2)), 7)}
+    if match.group(3): gps["alt"] = round(float(match.group(3)), 1)
+    return gps
+
+
+def _mac_time(value: int):
+    # 0 означає "не задано"; інакше отримали б 1904 рік
+    return value - _MAC_EPOCH_OFFSET if value > _MAC_EPOCH_OFFSET else None
+
+
+def _probe_moov(f, start: int, end: int) -> dict:
+    info, tracks = {}, []
+    for kind, s, e in _iter_boxes(f, start, end):
+        if kind == b"mvhd":
+            data = _read_box(f, s, e, limit=32)
+            if data[0] == 1:
+                created, _, timescale, duration = struct.unpack_from(">QQIQ", data, 4)
+            else:
+                created, _, timescale, duration = struct.unpack_from(">IIII", data, 4)
+            info["taken_at"] = _mac_time(created)
+            if timescale: info["duration"] = round(duration / timescale, 3)
+        elif kind == b"trak":
+            tracks.append(_probe_trak(f, s, e))
+        elif kind == b"udta":
+            info.update(_probe_udta(f, s, e))
+        elif kind == b"meta":
+            info.update(_probe_quicktime_keys(f, s, e))
+
+    video = next((t for t in tracks if t.get("handler") == b"vide"), None)
+    audio = next((t for t in tracks if t.get("handler") == b"soun"), None)
+    if video:
+        info["video_codec"] = video.get("codec")
+        rotation = video.get("rotation", 0)
+        if rotation: info["rotation"] = rotation
+        width, height = video.get("width"), video.get("height")
+        if width and height and rotation in (90, 270): width, height = height, width
+        info["width"], info["height"] = width, height
+    if audio: info["audio_codec"] = audio.get("codec")
+    return info
+
+
+def _probe_trak(f, start: int, end: int) -> dict:
+    track = {}
+
+    def walk(s0, e0):
+        for kind, s, e in _iter_boxes(f, s0, e0):
+            if kind in _CONTAINERS:
+                walk(s, e)
+            elif kind == b"tkhd":
+                data = _read_box(f, s, e, limit=96)
+                base = 4 + (32 if data[0] == 1 else 20) + 8 + 8  # до матриці
+                a, b = struct.unpack_from(">ii", data, base)
+                track["rotation"] = round(math.degrees(math.atan2(b / 65536.0, a / 65536.0))) % 360
+                w, h = struct.unpack_from(">II", data, base + 36)
+                track["width"], track["height"] = round(_fixed_16_16(w)), round(_fixed_16_16(h))
+            elif kind == b"hdlr":
+                # У MOV є ще hdlr у minf (тип посилання на дані) — нам потрібен перший, з mdia
+                track.setdefault("handler", _read_box(f, s, e, limit=12)[8:12])
+            elif kind == b"stsd":
+                data = _read_box(f, s, e, limit=16)
+                if len(data) >= 16: track["codec"] = data[12:16].decode("latin-1").strip()
+                return  # таблиці семплів (stts, stsz, stco...) не читаємо
+    walk(start, end)
+    return track
+
+
+def _probe_udta(f, start: int, end: int) -> dict:
+    """QuickTime udta: ©xyz (координати), ©mak, ©mod або вкладений meta з keys."""
+    info = {}
+    for kind, s, e in _iter_boxes(f, start, end):
+        if kind == b"meta":
+            info.update(_probe_quicktime_keys(f, s, e))
+        elif kind in (b"\xa9xyz", b"\xa9mak", b"\xa9mod") and e - s <= 1024:
+            data = _read_box(f, s, e)
+            length = struct.unpack_from(">H", data, 0)[0]
+            text = data[4:4 + length].decode("utf-8", errors="replace").strip("\x00 ")
+            if kind == b"\xa9xyz": info["gps"] = _parse_iso6709(text)
+            elif kind == b"\xa9mak": info["camera_make"] = text or None
+            else: info["camera_model"] = text or None
+    return info
+
+
+def _probe_quicktime_keys(f, start: int, end: int) -> dict:
+    """moov/meta з keys + ilst (так пишуть телефони Apple): модель, координати, дата зйомки."""
+    if end - start > MAX_METADATA_BLOCK: return {}
+    data = _read_box(f, start, end)
+    reader = _BytesFile(data)
+    # У QuickTime meta — звичайний бокс, у MP4 — FullBox з 4 байтами версії
+    offset = 0 if data[4:8] == b"hdlr" else 4
+    keys, values = [], {}
+    for kind, s, e in _iter_boxes(reader, offset, len(data)):
+        if kind == b"keys":
+            count = struct.unpack_from(">I", data, s + 4)[0]
+            pos = s + 8
+            for _ in range(count):
+                size = struct.unpack_from(">I", data, pos)[0]
+                keys.append(data[pos + 8:pos + size].decode("utf-8", errors="replace"))
+                pos += size
+        elif kind == b"ilst":
+            for item, is_, ie in _iter_boxes(reader, s, e):
+                index = struct.unpack(">I", item)[0]
+                for sub, ds, de in _iter_boxes(reader, is_, ie):
+                    if sub == b"data": values[index] = data[ds + 8:de]
+    info = {}
+    for index, key in enumerate(keys, start=1):
+        raw = values.get(index)
+        if raw is None: continue
+        text = raw.decode("utf-8", errors="replace").strip("\x00 ")
+        if key == "com.apple.quicktime.location.ISO6709": info["gps"] = _parse_iso6709(text)
+        elif key == "com.apple.quicktime.make": info["camera_make"] = text or None
+        elif key == "com.apple.quicktime.model": info["camera_model"] = text or None
+        elif key == "com.apple.quicktime.creationdate":
+            # '2023-07-14T18:22:05+0300' — місцевий час зйомки з часовим поясом
+            try:
+                info["taken_at"] = datetime.strptime(text[:24], "%Y-%m-%dT%H:%M:%S%z").timestamp()
+            except ValueError:
+                pass
+    return info
@@ -0,0 +1,243 @@
+# metadata_store.py - Спільне для процесу сховище метаданих у пам'яті з відкладеним записом
+
+import os
+import json
+import shutil
+import threading
+
+
+class MetadataStore:
+    """
+    Кеш усіх записів каталогу в пам'яті, захищений локом.
+
+    Зміни одразу видно всім читачам, а в каталог вони потрапляють пакетами:
+    фоновий потік раз на `flush_interval` секунд (або коли назбиралось
+    `max_batch` змін) пише все однією транзакцією. Повторні зміни того самого
+    файлу між скиданнями зливаються в одну.
+
+    Щоб не втратити зміни при аварійному завершенні, кожна зміна спершу
+    дописується в журнал (JSON Lines). Після успішного скидання журнал
+    очищається, а при старті незастосовані записи з нього відтворюються.
+    """
+
+    def __init__(self, catalog, journal_path=None, flush_interval: float = 2.0, max_batch: int = 500, journal_fsync: bool = False):
+        self.catalog = catalog
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.journal_fsync = journal_fsync
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()  # одночасно йде лише одне скидання
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._pending = {}  # filename -> entry (або None = видалити)
+        self._journal = None
+        # Підписники на зміни (напр. індекс схожих фото): callback(upserts, deletes), під локом сховища
+        self._listeners = []
+
+        if journal_path:
+            self._recover_journal()
+        self._entries = catalog.as_dict()
+        # Зворотний індекс вмісту: content_hash -> імена файлів (для дедуплікації)
+        self._by_hash = {}
+        for name, entry in self._entries.items():
+            self._index_hash(name, entry)
+        if journal_path:
+            self._journal = open(journal_path, "a", encoding="utf-8")
+
+        self._thread = threading.Thread(target=self._flush_loop, name="metadata-flush", daemon=True)
+        self._thread.start()
+
+    def add_listener(self, callback):
+        """Реєструє callback(upserts: dict, deletes: list), який викликається при кожній зміні."""
+        self._listeners.append(callback)
+
+    # --- Читання (з пам'яті) ---
+    def get(self, filename: str):
+        with self._lock:
+            entry = self._entries.get(filename)
+            return dict(entry) if entry is not None else None
+
+    def contains(self, filename: str) -> bool:
+        with self._lock:
+            return filename in self._entries
+
+    def folder_of(self, filename: str):
+        """Папка запису або None, якщо такого файлу в галереї немає."""
+        with self._lock:
+            entry = self._entries.get(filename)
+            return entry.get("folder", "") if entry is not None else None
+
+    def filenames(self, folder=None) -> set:
+        with self._lock:
+            if folder is None: return set(self._entries)
+            return {name for name, entry in self._entries.items() if entry.get("folder", "") == folder}
+
+    def find_by_hash(self, content_hash: str) -> list:
+        with self._lock:
+            return sorted(self._by_hash.get(content_hash, ()))
+
+    def snapshot(self) -> dict:
+        """Копія всіх записів у форматі старого metadata.json."""
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._entries.items()}
+
+    # --- Зміни (в пам'ять + журнал, у каталог — пізніше) ---
+    def set(self, filename: str, entry: dict):
+        self.apply({filename: entry}, ())
+
+    def set_many(self, entries: dict):
+        self.apply(entries, ())
+
+    def update(self, filename: str, **fields):
+        """Оновлює окремі поля існуючого запису (нічого не робить, якщо запису немає)."""
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is None: return False
+            self.apply({filename: {**entry, **fields}}, ())
+            return True
+
+    def remove(self, filename: str):
+        self.apply({}, [filename])
+
+    def remove_many(self, filenames):
+        self.apply({}, filenames)
+
+    def replace_all(self, data: dict):
+        """Сумісність із save_metadata(): змінює лише ті записи, що відрізняються."""
+        with self._lock:
+            changed = {name: entry for name, entry in data.items() if self._entries.get(name) != {"folder": "", **entry}}
+            removed = [name for name in self._entries if name not in data]
+            self.apply(changed, removed)
+
+    def apply(self, upserts: dict, deletes):
+        deletes = list(deletes)
+        if not upserts and not deletes: return
+        with self._lock:
+            for name, entry in upserts.items():
+                entry = {"folder": "", **entry}
+                self._unindex_hash(name, self._entries.get(name))
+                self._entries[name] = entry
+                self._index_hash(name, entry)
+                self._pending[name] = entry
+            for name in deletes:
+                if name in upserts: continue
+                self._unindex_hash(name, self._entries.pop(name, None))
+                self._pending[name] = None
+            self._write_journal(upserts, deletes)
+            for callback in self._listeners:
+                try:
+                    callback(upserts, [name for name in deletes if name not in upserts])
+                except Exception as e:
+                    print(f"⚠️ Помилка обробника змін сховища: {e}")
+            pending_count = len(self._pending)
+        if pending_count >= self.max_batch:
+            self._wakeup.set()
+
+    def _index_hash(self, name: str, entry):
+        if entry and entry.get("content_hash"):
+            self._by_hash.setdefault(entry["content_hash"], set()).add(name)
+
+    def _unindex_hash(self, name: str, entry):
+        if entry and entry.get("content_hash"):
+            names = self._by_hash.get(entry["content_hash"])
+            if names is not None:
+                names.discard(name)
+                if not names: del self._by_hash[entry["content_hash"]]
+
+    # --- Журнал ---
+    def _write_journal(self, upserts: dict, deletes: list):
+        if self._journal is None: return
+        for name, entry in upserts.items():
+            self._journal.write(json.dumps({"op": "set", "filename": name, "entry": entry}, ensure_ascii=False) + "\n")
+        for name in deletes:
+            self._journal.write(json.dumps({"op": "delete", "filename": name}, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        if self.journal_fsync:
+            os.fsync(self._journal.fileno())
+
+    def _recover_journal(self):
+        """Відтворює в каталозі зміни, які не встигли скинутись до аварійної зупинки."""
+        upserts, deletes = {}, set()
+        found = False
+        # .flushing — журнал, скидання якого перервалось; він старший за основний
+        for path in (self.journal_path + ".flushing", self.journal_path):
+            if not os.path.exists(path): continue
+            found = True
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # недописаний останній рядок
+                    if record.get("op") == "set":
+                        upserts[record["filename"]] = record["entry"]
+                        deletes.discard(record["filename"])
+                    elif record.get("op") == "delete":
+                        upserts.pop(record["filename"], None)
+                        deletes.add(record["filename"])
+        if not found: return
+        self.catalog.apply_batch(upserts, deletes)
+        for path in (self.journal_path + ".flushing", self.journal_path):
+            if os.path.exists(path): os.remove(path)
+        if upserts or deletes:
+            print(f"♻️ Відновлено з журналу метаданих: {len(upserts)} змін, {len(deletes)} видалень")
+
+    def _rotate_journal(self):
+        """Відкладає поточний журнал у *.flushing; нові зміни підуть у свіжий файл."""
+        flushing_path = self.journal_path + ".flushing"
+        self._journal.close()
+        if os.path.exists(flushing_path):
+            # Попереднє скидання не вдалось — дописуємо, а не перезаписуємо його журнал
+            with open(self.journal_path, "r", encoding="utf-8") as src, open(flushing_path, "a", encoding="utf-8") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, flushing_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    # --- Скидання в каталог ---
+    def flush(self):
+        """Синхронно пише всі накопичені зміни в каталог."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending: return 0
+                batch, self._pending = self._pending, {}
+                if self._journal is not None:
+                    self._rotate_journal()
+            upserts = {name: entry for name, entry in batch.items() if entry is not None}
+            deletes = [name for name, entry in batch.items() if entry is None]
+            try:
+                self.catalog.apply_batch(upserts, deletes)
+            except Exception as e:
+                print(f"🛑 Не вдалося записати метадані в каталог: {e}")
+                with self._lock:
+                    # Повертаємо пакет назад (новіші зміни мають пріоритет)
+                    self._pending = {**batch, **self._pending}
+                raise
+            if self._journal is not None and os.path.exists(self.journal_path + ".flushing"):
+                os.remove(self.journal_path + ".flushing")
+            return len(batch)
+
+    def _flush_loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass  # вже залоговано у flush(); спробуємо в наступному вікні
+
+    def close(self):
+        """Зупиняє фоновий потік і скидає все, що залишилось."""
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self.flush()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+                if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) == 0:
+                    os.remove(self.journal_path)
@@ -0,0 +1,143 @@
+# rendition_cache.py - Дворівневий кеш готових зображень (пам'ять + диск) з лімітом у байтах
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class RenditionCache:
+    """
+    Кеш байтів відрендерених зображень за довільним рядковим ключем.
+
+    Гарячі елементи тримаються в пам'яті (LRU з лімітом `memory_budget` байт),
+    усі — на диску в `cache_dir` (LRU з лімітом `disk_budget` байт). Порядок
+    використання дискових файлів після перезапуску відновлюється з їх mtime,
+    тому при кожному влучанні файл "торкаємо".
+    """
+
+    def __init__(self, cache_dir: str, memory_budget: int, disk_budget: int):
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # ключ -> bytes
+        self._memory_bytes = 0
+        self._disk = OrderedDict()  # ім'я файлу -> розмір
+        self._disk_bytes = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evicted": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_disk_index()
+
+    def _load_disk_index(self):
+        files = []
+        for item in os.scandir(self.cache_dir):
+            if not item.is_file(): continue
+            if item.name.endswith(".tmp"):
+                os.remove(item.path)  # залишок перерваного запису
+                continue
+            st = item.stat()
+            files.append((st.st_mtime, item.name, st.st_size))
+        for _, name, size in sorted(files):
+            self._disk[name] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    @staticmethod
+    def _file_name(key: str) -> str:
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Байти за ключем або None."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return data
+            name = self._file_name(key)
+            if name not in self._disk:
+                self.stats["misses"] += 1
+                return None
+            self._disk.move_to_end(name)
+        path = os.path.join(self.cache_dir, name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget_disk(name)
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            self.stats["disk_hits"] += 1
+            self._remember(key, data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        name = self._file_name(key)
+        path = os.path.join(self.cache_dir, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._forget_disk(name)
+            self._disk[name] = len(data)
+            self._disk_bytes += len(data)
+            self._remember(key, data)
+            self._evict_disk()
+
+    def clear(self):
+        """Видаляє все (наприклад, після зміни налаштувань якості)."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for name in list(self._disk):
+                self._remove_file(name)
+            self._disk.clear()
+            self._disk_bytes = 0
+
+    def set_disk_budget(self, disk_budget: int):
+        with self._lock:
+            self.disk_budget = disk_budget
+            self._evict_disk()
+
+    def usage(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "memory_bytes": self._memory_bytes,
+                "memory_items": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+                "disk_items": len(self._disk),
+            }
+
+    # --- Внутрішнє (під self._lock) ---
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.memory_budget: return  # завеликий для RAM — лише на диску
+        old = self._memory.pop(key, None)
+        if old is not None: self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_budget:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _forget_disk(self, name: str):
+        size = self._disk.pop(name, None)
+        if size is not None: self._disk_bytes -= size
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.disk_budget and self._disk:
+            name, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._remove_file(name)
+            self.stats["evicted"] += 1
+
+    def _remove_file(self, name: str):
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except FileNotFoundError:
+            pass
@@ -8,18 +8,40 @@ import random
 import threading
 import uuid
 import io
+import hashlib
+import tarfile
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 import traceback
 from datetime import datetime
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Form, Body, Query
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from typing import List
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Form, Body, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool
 from PIL import Image, ImageDraw, ImageFont
-import ffmpeg
-from hachoir.parser import createParser
-from hachoir.metadata import extractMetadata
 import requests
 from gradio_client import Client as GradioClient, file as gradio_file
 
+from catalog import Catalog
+from grouping import MomentGrouper, grouped_layout
+from metadata_store import MetadataStore
+from chunked_upload import UploadSessionManager, UploadError
+from ingest_pipeline import IngestPipeline, IngestStage
+from thumbnailer import render_thumbnail_task, render_renditions, transcode_image, supported_formats, IMAGE_FORMATS
+from video_previews import render_animated_preview, ffmpeg_slots, use_ffmpeg_slots
+from hls import HlsManager
+from watcher import MediaWatcher
+from tree_scanner import TreeScanner, RACY_SECONDS
+from similarity import SimilarityIndex, MAX_QUERY_DISTANCE
+from media_probe import probe as probe_media_headers
+from jobs import JobManager, run_in_process_pool, get_process_pool, set_process_pool_initializer
+from rendition_cache import RenditionCache
+from atlas import AtlasBuilder
+from http_cache import (file_response, bytes_response, not_modified_response, is_not_modified, make_etag,
+                        CACHE_IMMUTABLE, CACHE_REVALIDATE)
+
 try:
     # Новий спосіб (Pillow >= 9.1.0)
     LANCZOS_FILTER = Image.Resampling.LANCZOS
@@ -45,14 +67,23 @@ THUMBNAILS_PATH = os.path.join(STORAGE_PATH, "thumbnails")
 MEMORIES_PATH = os.path.join(STORAGE_PATH, "memories")
 MUSIC_FOLDER = os.path.join(STORAGE_PATH, "music")
 
-METADATA_FILE = os.path.join(STORAGE_PATH, "metadata.json")
+METADATA_FILE = os.path.join(STORAGE_PATH, "metadata.json")  # старий формат, лише для міграції
+CATALOG_FILE = os.path.join(STORAGE_PATH, "catalog.db")
+METADATA_JOURNAL_FILE = os.path.join(STORAGE_PATH, "metadata.journal")
 SETTINGS_FILE = os.path.join(STORAGE_PATH, "settings.json")
 FRAMES_CONFIG_FILE = os.path.join(ASSETS_FOLDER, "frames_config.json")
 FONT_FILE = os.path.join(ASSETS_FOLDER, "Roboto-Regular.ttf")
 
-for path in [ORIGINALS_PATH, THUMBNAILS_PATH, MEMORIES_PATH, MUSIC_FOLDER, ASSETS_FOLDER]:
+UPLOAD_SESSIONS_PATH = os.path.join(STORAGE_PATH, "uploads")  # недокачані частини великих файлів
+DERIVATIVES_PATH = os.path.join(STORAGE_PATH, "derivatives")  # прев'ю інших розмірів: derivatives/<розмір>/<ім'я>.jpg
+
+for path in [ORIGINALS_PATH, THUMBNAILS_PATH, MEMORIES_PATH, MUSIC_FOLDER, ASSETS_FOLDER, UPLOAD_SESSIONS_PATH, DERIVATIVES_PATH]:
     os.makedirs(path, exist_ok=True)
 
+# --- Підтримувані формати ---
+SUPPORTED_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.heic', '.webp']
+SUPPORTED_VIDEO_EXTENSIONS = ['.mp4', '.mov', '.avi', '.mkv', '.webm']
+
 # --- Налаштування AI ---
 HF_SPACE_CAPTION_URL = "bodyapromax2010/bodyasync-image-caption"
 OLLAMA_API_URL = "http://localhost:11434/api/generate"
@@ -66,90 +97,270 @@ try:
 except IOError:
     FONT = ImageFont.load_default()
 
-# --- Функції для роботи з метаданими (без змін) ---
-# ... (load_metadata, save_metadata) ...
+# --- Каталог метаданих (SQLite) ---
+CATALOG = Catalog(CATALOG_FILE)
+# Одноразова міграція зі старого metadata.json
+if os.path.exists(METADATA_FILE):
+    CATALOG.migrate_from_json(METADATA_FILE)
+
+# --- Індекс груп "моментів" для /gallery/grouped/ ---
+# Знімки, між якими не більше GROUP_GAP_SECONDS, потрапляють в одну групу
+GROUP_GAP_SECONDS = 90
+GROUPER = MomentGrouper(CATALOG, gap_seconds=GROUP_GAP_SECONDS)
+GROUPER.attach()
+
+# --- Сховище метаданих у пам'яті ---
+# Завантаження пишуть сюди (під локом), а в каталог зміни скидаються пакетами
+# раз на METADATA_FLUSH_INTERVAL секунд. Незбережені зміни лежать у журналі.
+METADATA_FLUSH_INTERVAL = 2.0
+STORE = MetadataStore(CATALOG, journal_path=METADATA_JOURNAL_FILE, flush_interval=METADATA_FLUSH_INTERVAL)
+
+# --- Індекс схожих фото ---
+# pHash/dHash рахуються разом з прев'ю; індекс живе в пам'яті й оновлюється
+# з кожною зміною сховища. Дублікати — pHash і dHash відрізняються щонайбільше
+# на стільки біт (з 64): повторно збережені копії, серії майже однакових кадрів.
+DUPLICATE_PHASH_DISTANCE = 6
+DUPLICATE_DHASH_DISTANCE = 10
+SIMILAR_DEFAULT_DISTANCE = 10
+SIMILARITY_INDEX = SimilarityIndex(DUPLICATE_PHASH_DISTANCE, DUPLICATE_DHASH_DISTANCE)
+SIMILARITY_INDEX.attach(STORE)
+
+@app.on_event("shutdown")
+def flush_metadata_on_shutdown():
+    STORE.close()
+
+# load_metadata/save_metadata залишені для сумісності: вони копіюють/порівнюють
+# усі записи, тому в гарячих шляхах краще звертатися до STORE напряму.
 def load_metadata():
-    if not os.path.exists(METADATA_FILE): return {}
-    try:
-        with open(METADATA_FILE, 'r', encoding='utf-8') as f: return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError): return {}
+    return STORE.snapshot()
 
 def save_metadata(data):
-    with open(METADATA_FILE, 'w', encoding='utf-8') as f: json.dump(data, f, indent=4, ensure_ascii=False)
-
-
-# --- Функції для створення прев'ю (без змін) ---
-# ... (create_photo_thumbnail, create_video_thumbnail) ...
-def create_photo_thumbnail(image_path: str, thumbnail_path: str):
-    try:
-        settings = load_settings()
-        size = (settings.get("preview_size", 400), settings.get("preview_size", 400))
-        quality = settings.get("preview_quality", 80)
-        with Image.open(image_path) as img:
-            if img.format and img.format.upper() in ['HEIC', 'HEIF']:
-                from pillow_heif import register_heif_opener
-                register_heif_opener()
-                img = Image.open(image_path)
-            if img.mode in ("RGBA", "P"): img = img.convert("RGB")
-            img.thumbnail(size)
-            img.save(thumbnail_path, "JPEG", quality=quality, optimize=True)
-        return True
-    except Exception as e:
-        print(f"❌ Помилка фото-прев'ю для {os.path.basename(image_path)}: {e}")
-        return False
-
-def create_video_thumbnail(video_path: str, thumbnail_path: str):
-    try:
-        settings = load_settings()
-        size = settings.get("preview_size", 400)
-        (ffmpeg.input(video_path, ss=1).filter('scale', size, -1).output(thumbnail_path, vframes=1).overwrite_output().run(capture_stdout=True, capture_stderr=True))
-        return True
-    except ffmpeg.Error as e:
-        print(f"❌ Помилка FFmpeg для {os.path.basename(video_path)}: {e.stderr.decode()}")
-        return False
+    STORE.replace_all(data)
+
+
+# --- Функції для створення прев'ю ---
+# Сам рендер живе в thumbnailer.py і video_previews.py (їх використовує і пул процесів),
+# тут лише відбитки, за якими видно, чи прев'ю актуальне.
+def source_signature(file_path: str) -> str:
+    """Відбиток оригіналу (розмір + mtime): якщо він не змінився, файл не треба обробляти знову."""
+    st = os.stat(file_path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+def thumbnail_settings_version(settings: dict) -> str:
+    """Версія налаштувань прев'ю; thumbnail_epoch змінюється, коли треба перебудувати все."""
+    ladder = ",".join(str(size) for size in derivative_ladder(settings))
+    version = f"{settings.get('preview_size', 400)}:{settings.get('preview_quality', 80)}:{ladder}"
+    epoch = settings.get("thumbnail_epoch", 0)
+    return f"{version}:e{epoch}" if epoch else version
+
+def thumbnail_signature(source_sig: str, settings: dict) -> str:
+    """Відбиток прев'ю: оригінал + версія налаштувань, з якими його зроблено."""
+    return f"{source_sig}:{thumbnail_settings_version(settings)}"
+
+
+# --- Драбина розмірів прев'ю ---
+# Кожне фото має набір похідних зображень (наприклад 128/400/1080/2160):
+# сітка бере найменше, переглядач — під розмір екрана. Розмір preview_size
+# лежить у THUMBNAILS_PATH, як і раніше, решта — у DERIVATIVES_PATH/<розмір>/.
+def derivative_ladder(settings: dict) -> list:
+    sizes = {int(size) for size in settings.get("derivative_sizes", []) if int(size) > 0}
+    sizes.add(settings.get("preview_size", 400))
+    return sorted(sizes)
+
+def derivative_path(thumbnail_name: str, size: int, settings: dict) -> str:
+    if size == settings.get("preview_size", 400): return os.path.join(THUMBNAILS_PATH, thumbnail_name)
+    return os.path.join(DERIVATIVES_PATH, str(size), thumbnail_name)
+
+def derivative_outputs(thumbnail_name: str, settings: dict, sizes=None) -> list:
+    """[(шлях, розмір, якість), ...] для thumbnailer; за замовчуванням — уся драбина."""
+    outputs = []
+    for size in sizes or derivative_ladder(settings):
+        path = derivative_path(thumbnail_name, size, settings)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        outputs.append((path, size, settings.get("preview_quality", 80)))
+    return outputs
+
+def thumbnail_task_for(file_type: str, file_path: str, thumbnail_name: str, settings: dict, sizes=None) -> tuple:
+    """Задача для render_thumbnail_task: усі розміри з одного декодування оригіналу."""
+    return (file_type, file_path, derivative_outputs(thumbnail_name, settings, sizes))
 
 
 # =================================================================
 # НОВА ФУНКЦІЯ ДЛЯ ОТРИМАННЯ ОРИГІНАЛЬНОЇ ДАТИ
 # =================================================================
-def get_original_date(file_path: str) -> float:
+def read_media_info(file_path: str) -> dict:
     """
-    Намагається отримати оригінальну дату створення з метаданих файлу.
-    Якщо не вдається, повертає дату зміни файлу в системі.
+    Дата зйомки і технічні метадані (розміри, камера, GPS, тривалість і кодеки
+    відео) за один прохід по заголовках файлу. Повертає поля запису: timestamp
+    і media. Якщо дати в метаданих немає, береться дата зміни файлу.
     """
-    try:
-        # Для фотографій (JPEG/HEIC)
-        if file_path.lower().endswith(('.jpg', '.jpeg', '.heic')):
-            with Image.open(file_path) as img:
-                exif_data = img._getexif()
-                if exif_data:
-                    for tag, value in exif_data.items():
-                        tag_name = TAGS.get(tag, tag)
-                        if tag_name == 'DateTimeOriginal':
-                            # Формат 'YYYY:MM:DD HH:MM:SS'
-                            dt_obj = datetime.strptime(value, '%Y:%m:%d %H:%M:%S')
-                            print(f"✅ Знайдено дату в EXIF: {dt_obj}")
-                            return dt_obj.timestamp()
-    except Exception:
-        pass # Просто ігноруємо помилки читання EXIF
+    info = probe_media_headers(file_path)
+    info.pop("bytes_read", None)
+    timestamp = info.get("taken_at")
+    if timestamp is None:
+        timestamp = os.path.getmtime(file_path)
+        print(f"⚠️ Не вдалося знайти оригінальну дату, використовую fallback: {datetime.fromtimestamp(timestamp)}")
+    return {"timestamp": timestamp, "media": info}
+
+
+def get_media_type(filename: str):
+    """'image', 'video' або None, якщо формат не підтримується галереєю."""
+    file_extension = os.path.splitext(filename.lower())[1]
+    if file_extension in SUPPORTED_IMAGE_EXTENSIONS: return "image"
+    if file_extension in SUPPORTED_VIDEO_EXTENSIONS: return "video"
+    return None
+
+
+def probe_media_file(filename: str, file_path: str, folder: str = "", content_hash: str = None):
+    """Тип, оригінальна дата й розмір — запис метаданих без прев'ю. None для непідтримуваних файлів."""
+    file_type = get_media_type(filename)
+    if file_type is None: return None
+    entry = {
+        "type": file_type,
+        "thumbnail": f"{os.path.splitext(os.path.basename(filename))[0]}.jpg",
+        **read_media_info(file_path),
+        "folder": folder,
+        "size": os.path.getsize(file_path),
+        "source_sig": source_signature(file_path),
+    }
+    if content_hash: entry["content_hash"] = content_hash
+    return entry
+
+
+def thumbnail_result_fields(result: dict) -> dict:
+    """Що з результату рендеру прев'ю потрапляє в запис: заглушка BlurHash і перцептивні хеші."""
+    return {key: result[key] for key in ("placeholder", "phash", "dhash") if result.get(key)}
+
+
+def create_entry_thumbnail(file_path: str, entry: dict) -> bool:
+    """Робить прев'ю для запису і запам'ятовує, з якого оригіналу та налаштувань воно зроблене."""
+    settings = load_settings()
+    result = render_thumbnail_task(thumbnail_task_for(entry["type"], file_path, entry["thumbnail"], settings))
+    if result is None: return False
+    entry["thumb_sig"] = thumbnail_signature(entry["source_sig"], settings)
+    entry.update(thumbnail_result_fields(result))
+    return True
 
-    try:
-        # Для відео (MP4/MOV) за допомогою Hachoir
-        parser = createParser(file_path)
-        if parser:
-            with parser:
-                metadata = extractMetadata(parser)
-            if metadata and metadata.has('creation_date'):
-                dt_obj = metadata.get('creation_date')
-                print(f"✅ Знайдено дату в метаданих відео: {dt_obj}")
-                return dt_obj.timestamp()
-    except Exception:
-        pass # Ігноруємо помилки Hachoir
 
-    # Якщо нічого не знайдено, повертаємо час останньої зміни файлу
-    fallback_timestamp = os.path.getmtime(file_path)
-    print(f"⚠️ Не вдалося знайти оригінальну дату, використовую fallback: {datetime.fromtimestamp(fallback_timestamp)}")
-    return fallback_timestamp
+def prepare_media_entry(filename: str, file_path: str, folder: str = "", content_hash: str = None) -> tuple:
+    """
+    Прев'ю + дата для вже збереженого файлу, але без запису в метадані.
+    Повертає (результат для клієнта, запис або None), щоб пакетне завантаження
+    могло зберегти всі записи разом.
+    """
+    entry = probe_media_file(filename, file_path, folder, content_hash)
+    if entry is None:
+        return {"filename": filename, "status": "skipped", "message": "Unsupported file type"}, None
+    if not create_entry_thumbnail(file_path, entry):
+        return {"filename": filename, "type": entry["type"], "status": "error", "message": "Could not create thumbnail"}, None
+    return {"filename": filename, "type": entry["type"], "status": "success"}, entry
+
+
+# --- Фоновий конвеєр обробки (ingest) ---
+# Після запису байтів на диск файл проходить етапи probe -> thumbnail -> commit
+# у фонових потоках, а клієнт одразу отримує ingest_id для /ingest/status/.
+def ingest_probe_stage(job):
+    if not job.data.get("content_hash"):
+        # Файли, що з'явились у папці повз завантаження (стеження, копіювання), хешуємо тут,
+        # щоб дедуплікація і /sync/missing бачили й їх
+        try:
+            content_hash = file_sha256(job.data["path"])
+        except OSError as e:
+            job.finish("error", {"filename": job.filename, "status": "error", "message": f"Could not read file: {e}"})
+            return
+        job.data["content_hash"] = content_hash
+        with INFLIGHT_LOCK:
+            INFLIGHT_HASHES.setdefault(content_hash, job.filename)
+    entry = probe_media_file(job.filename, job.data["path"], job.data.get("folder", ""), job.data.get("content_hash"))
+    if entry is None:
+        job.finish("skipped", {"filename": job.filename, "status": "skipped", "message": "Unsupported file type"})
+        return
+    job.data["entry"] = entry
+
+def ingest_thumbnail_stage(job):
+    entry = job.data["entry"]
+    if not create_entry_thumbnail(job.data["path"], entry):
+        job.finish("error", {"filename": job.filename, "type": entry["type"], "status": "error", "message": "Could not create thumbnail"})
+        return
+    job.result = {"filename": job.filename, "type": entry["type"], "status": "success"}
+
+def ingest_commit_stage(jobs):
+    # Усе, що накопичилось у черзі, йде в сховище одним пакетом
+    STORE.set_many({job.filename: job.data["entry"] for job in jobs})
+    if load_settings().get("hls_prepare_on_ingest"):
+        for job in jobs:
+            if job.data["entry"]["type"] == "video":
+                HLS.prepare(HLS.session_id(job.filename, job.data["entry"]["source_sig"]), job.data["path"])
+
+# Хеші файлів, які ще обробляються, — щоб дублікат не проскочив до commit,
+# і їхні шляхи — щоб стеження за папкою не поставило той самий файл удруге
+INFLIGHT_HASHES = {}
+INFLIGHT_PATHS = set()
+INFLIGHT_LOCK = threading.Lock()
+
+def ingest_finished(job):
+    content_hash = job.data.get("content_hash")
+    with INFLIGHT_LOCK:
+        INFLIGHT_PATHS.discard(job.data["path"])
+        if content_hash and INFLIGHT_HASHES.get(content_hash) == job.filename: del INFLIGHT_HASHES[content_hash]
+
+INGEST_PIPELINE = IngestPipeline([
+    IngestStage("probe", ingest_probe_stage, workers=2),
+    IngestStage("thumbnail", ingest_thumbnail_stage, workers=os.cpu_count() or 2),
+    IngestStage("commit", ingest_commit_stage, workers=1, batch=True),
+], on_finish=ingest_finished)
+
+def submit_ingest(filename: str, file_path: str, folder: str = "", content_hash: str = None) -> dict:
+    """Ставить збережений файл у конвеєр і повертає відповідь для клієнта."""
+    with INFLIGHT_LOCK:
+        INFLIGHT_PATHS.add(file_path)
+        if content_hash: INFLIGHT_HASHES[content_hash] = filename
+    job = INGEST_PIPELINE.submit(filename, path=file_path, folder=folder, content_hash=content_hash)
+    return {"filename": filename, "status": "queued", "ingest_id": job.id}
+
+
+# --- Дедуплікація за вмістом ---
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def save_stream_with_hash(src, dest_path: str) -> tuple:
+    """Копіює потік у файл, паралельно рахуючи sha256. Повертає (hexdigest, size)."""
+    hasher, size = hashlib.sha256(), 0
+    with open(dest_path, "wb") as buffer:
+        for block in iter(lambda: src.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(block)
+            buffer.write(block)
+            size += len(block)
+    return hasher.hexdigest(), size
+
+def file_sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as src:
+        for block in iter(lambda: src.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def original_path_for(filename: str, entry: dict) -> str:
+    return os.path.join(ORIGINALS_PATH, entry.get("folder", ""), os.path.basename(filename))
+
+def find_duplicate(content_hash: str):
+    """Ім'я файлу галереї з таким самим вмістом, якщо він ще є на диску."""
+    for name in STORE.find_by_hash(content_hash):
+        entry = STORE.get(name)
+        if entry and os.path.exists(original_path_for(name, entry)):
+            return name
+    with INFLIGHT_LOCK:
+        return INFLIGHT_HASHES.get(content_hash)
+
+
+def resolve_originals_dir(path: str) -> str:
+    """Абсолютний шлях до підпапки ORIGINALS_PATH з перевіркою виходу за її межі."""
+    base_path = os.path.abspath(ORIGINALS_PATH)
+    target_dir_path = os.path.abspath(os.path.join(base_path, path))
+    if not target_dir_path.startswith(base_path):
+        raise HTTPException(status_code=403, detail="Access denied")
+    if not os.path.isdir(target_dir_path):
+        raise HTTPException(status_code=404, detail="Target directory not found")
+    return target_dir_path
 
 
 def get_raw_english_description(image_path):
@@ -460,9 +671,79 @@ def create_collage_and_save(selected_memories: list, output_path: str):
 
 # ... (всі імпорти та функції-хелпери без змін) ...
 
-# <--- ЗМІНА: Модифікуємо існуючий ендпоінт
+# --- Файловий менеджер: кеш вмісту каталогів ---
+# Лістинг (os.scandir: тип запису береться з самого каталогу, stat — один на файл)
+# кешується, доки не зміниться mtime каталогу. Зміна розміру файлу mtime каталогу
+# не чіпає, тож щойно змінені каталоги (RACY_SECONDS) не кешуються.
+DIRECTORY_CACHE_SIZE = 64
+DIRECTORY_CACHE = OrderedDict()  # шлях -> {"mtime_ns", "items", "sorted": {порядок: items}}
+DIRECTORY_CACHE_LOCK = threading.Lock()
+FILES_MAX_PAGE_SIZE = 5000
+FILES_SORT_KEYS = {
+    "name": lambda item: item["name"].lower(),
+    "size": lambda item: item.get("size", 0),
+    "modified": lambda item: item["modified"],
+}
+
+def read_directory(path: str) -> dict:
+    mtime_ns = os.stat(path).st_mtime_ns
+    with DIRECTORY_CACHE_LOCK:
+        cached = DIRECTORY_CACHE.get(path)
+        if cached and cached["mtime_ns"] == mtime_ns:
+            DIRECTORY_CACHE.move_to_end(path)
+            return cached
+    items = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir():
+                    items.append({"name": entry.name, "type": "directory", "modified": entry.stat().st_mtime})
+                else:
+                    st = entry.stat()
+                    items.append({"name": entry.name, "type": "file", "size": st.st_size, "modified": st.st_mtime})
+            except FileNotFoundError:
+                continue
+    listing = {"mtime_ns": mtime_ns, "items": items, "sorted": {}}
+    if time.time_ns() - mtime_ns > RACY_SECONDS * 1e9:
+        with DIRECTORY_CACHE_LOCK:
+            DIRECTORY_CACHE[path] = listing
+            DIRECTORY_CACHE.move_to_end(path)
+            while len(DIRECTORY_CACHE) > DIRECTORY_CACHE_SIZE: DIRECTORY_CACHE.popitem(last=False)
+    return listing
+
+def invalidate_directory(path: str):
+    """
+    Забуває лістинг папки, у якій щойно записано чи видалено `path`: перезапис
+    файлу на місці не змінює mtime каталогу, тож кеш сам цього не помітить.
+    """
+    with DIRECTORY_CACHE_LOCK:
+        DIRECTORY_CACHE.pop(os.path.dirname(os.path.abspath(path)), None)
+
+def sorted_directory(listing: dict, sort: str, descending: bool) -> list:
+    """Папки завжди перед файлами; відсортований список кешується разом з лістингом."""
+    order = (sort, descending)
+    items = listing["sorted"].get(order)
+    if items is None:
+        key = FILES_SORT_KEYS[sort]
+        items = sorted(listing["items"], key=lambda item: (item["type"] != "directory", key(item), item["name"]), reverse=descending)
+        if descending:
+            # reverse перевернув і порядок "папки, потім файли" — повертаємо папки наверх
+            items = [item for item in items if item["type"] == "directory"] + [item for item in items if item["type"] != "directory"]
+        listing["sorted"][order] = items
+    return items
+
 @app.get("/files/list/")
-async def list_files_in_path(path: str = ""):
+def list_files_in_path(
+    path: str = "",
+    offset: int = Query(0, ge=0),
+    limit: int = Query(None, ge=1, le=FILES_MAX_PAGE_SIZE),
+    sort: str = Query("name", pattern="^(name|size|modified)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+):
+    """
+    Вміст папки в ORIGINALS_PATH. Без limit — усі записи (як раніше);
+    offset/limit — сторінка вже відсортованого списку, total — скільки записів усього.
+    """
     base_path = os.path.abspath(ORIGINALS_PATH)
     requested_path = os.path.abspath(os.path.join(base_path, path))
 
@@ -471,38 +752,19 @@ async def list_files_in_path(path: str = ""):
     if not os.path.isdir(requested_path):
         raise HTTPException(status_code=404, detail="Directory not found")
 
-    items = []
-    # <--- ЗМІНА: Завантажуємо метадані, щоб знати, які файли є частиною галереї
-    gallery_metadata = load_metadata()
-    gallery_files = set(gallery_metadata.keys()) # Використовуємо set для швидкого пошуку
-
-    # Додаємо віртуальну папку "Галерея" тільки в корені
-    if not path:
-        items.append({"name": "Галерея", "type": "virtual_gallery"})
-
     try:
-        for item_name in os.listdir(requested_path):
-            item_path = os.path.join(requested_path, item_name)
-            
-            # <--- ЗМІНА: Фільтруємо файли, які є частиною галереї
-            # Показуємо їх тільки якщо ми НЕ в кореневій папці
-            if os.path.isfile(item_path) and item_name in gallery_files and not path:
-                continue # Пропускаємо файли галереї в кореневій директорії
-
-            if os.path.isdir(item_path):
-                items.append({"name": item_name, "type": "directory"})
-            else:
-                size = os.path.getsize(item_path)
-                items.append({"name": item_name, "type": "file", "size": size})
-        
-        # Сортування залишається тим самим
-        items.sort(key=lambda x: (
-            0 if x['type'] == 'virtual_gallery' else 1 if x['type'] == 'directory' else 2,
-            x['name'].lower()
-        ))
-        return JSONResponse(content={"path": path, "items": items})
-    except Exception as e:
+        items = sorted_directory(read_directory(requested_path), sort, order == "desc")
+    except OSError as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if not path:
+        # У корені файли галереї показує віртуальна папка "Галерея", а не список файлів
+        items = [{"name": "Галерея", "type": "virtual_gallery"}] + [
+            item for item in items if item["type"] != "file" or STORE.folder_of(item["name"]) != ""]
+    total = len(items)
+    if limit is not None or offset:
+        items = items[offset:offset + limit if limit is not None else None]
+    # JSONResponse напряму: без jsonable_encoder, який на 20 тис. записів повільніший за сам лістинг
+    return JSONResponse(content={"path": path, "items": items, "total": total, "offset": offset, "limit": limit})
 
 # ... (решта коду сервера без змін) ...
 
@@ -522,6 +784,7 @@ async def create_folder(path: str = Form(...), folder_name: str = Form(...)):
     
     try:
         os.makedirs(new_folder_path)
+        invalidate_directory(new_folder_path)
         return {"status": "success", "message": f"Folder '{folder_name}' created."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -529,38 +792,16 @@ async def create_folder(path: str = Form(...), folder_name: str = Form(...)):
 # <--- НОВЕ: Ендпоінт для завантаження файлу в конкретну папку
 @app.post("/files/upload_to_path/")
 async def upload_file_to_path(file: UploadFile = File(...), path: str = Form("")):
-    base_path = os.path.abspath(ORIGINALS_PATH)
-    target_dir_path = os.path.abspath(os.path.join(base_path, path))
-
-    if not target_dir_path.startswith(base_path):
-        raise HTTPException(status_code=403, detail="Access denied")
-    if not os.path.isdir(target_dir_path):
-        raise HTTPException(status_code=404, detail="Target directory not found")
-
+    target_dir_path = resolve_originals_dir(path)
     file_location = os.path.join(target_dir_path, file.filename)
     
-    with open(file_location, "wb+") as file_object:
-        shutil.copyfileobj(file.file, file_object)
-
-    # Якщо це медіафайл, оновлюємо метадані для галереї
-    file_extension = os.path.splitext(file.filename.lower())[1]
-    if file_extension in ['.jpg', '.jpeg', '.png', '.gif', '.mp4', '.mov']:
-        # Викликаємо логіку з твого головного ендпоінта /upload/
-        # (це спрощення, в ідеалі цю логіку треба винести в окрему функцію)
-        thumbnail_filename = f"{os.path.splitext(file.filename)[0]}.jpg"
-        thumbnail_path = os.path.join(THUMBNAILS_PATH, thumbnail_filename)
-        metadata = load_metadata()
-        metadata[file.filename] = {
-            "type": "image" if file_extension in ['.jpg', '.jpeg', '.png', '.gif'] else "video",
-            "thumbnail": thumbnail_filename,
-            "timestamp": get_original_date(file_location)
-        }
-        save_metadata(metadata)
-        if metadata[file.filename]["type"] == "image":
-             create_photo_thumbnail(file_location, thumbnail_path)
-        else:
-             create_video_thumbnail(file_location, thumbnail_path)
+    content_hash, _ = await run_in_threadpool(save_stream_with_hash, file.file, file_location)
+    invalidate_directory(file_location)
 
+    # Якщо це медіафайл, оновлюємо метадані для галереї (у фоні)
+    if get_media_type(file.filename):
+        result = await run_in_threadpool(submit_ingest, file.filename, file_location, path.strip("/"), content_hash)
+        return {"status": "success", "filename": file.filename, "ingest_id": result["ingest_id"]}
 
     return {"status": "success", "filename": file.filename}
 
@@ -588,123 +829,1012 @@ async def get_all_memories():
     return all_memories
 
 @app.get("/memories/{filename}")
-async def get_memory_asset(filename: str):
+async def get_memory_asset(filename: str, request: Request):
     file_path = os.path.join(MEMORIES_PATH, filename)
-    if os.path.exists(file_path): return FileResponse(file_path)
+    if os.path.exists(file_path): return file_response(request, file_path)
     raise HTTPException(status_code=404, detail="Asset not found")
 
 @app.get("/music/{filename}")
-async def get_music_asset(filename: str):
+async def get_music_asset(filename: str, request: Request):
     file_path = os.path.join(MUSIC_FOLDER, filename)
-    if os.path.exists(file_path): return FileResponse(file_path)
+    if os.path.exists(file_path): return file_response(request, file_path)
     raise HTTPException(status_code=404, detail="Asset not found")
 
 
 @app.post("/upload/")
 async def upload_file(file: UploadFile = File(...)):
-    # ... (код визначення типів та збереження файлу залишається тим самим) ...
-    supported_image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.heic', 'webp']
-    supported_video_extensions = ['.mp4', '.mov', '.avi', '.mkv', 'webm']
     original_file_path = os.path.join(ORIGINALS_PATH, file.filename)
-    with open(original_file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    file_extension = os.path.splitext(file.filename.lower())[1]
-    file_type = None
-    if file_extension in supported_image_extensions: file_type = "image"
-    elif file_extension in supported_video_extensions: file_type = "video"
-    else: return {"filename": file.filename, "status": "skipped", "message": "Unsupported file type"}
-
-    # ... (код створення прев'ю залишається тим самим) ...
-    thumbnail_filename = f"{os.path.splitext(file.filename)[0]}.jpg"
-    thumbnail_file_path = os.path.join(THUMBNAILS_PATH, thumbnail_filename)
-    thumbnail_created = False
-    if file_type == "image": thumbnail_created = create_photo_thumbnail(original_file_path, thumbnail_file_path)
-    elif file_type == "video": thumbnail_created = create_video_thumbnail(original_file_path, thumbnail_file_path)
-
-    if thumbnail_created:
-        metadata = load_metadata()
-        metadata[file.filename] = {
-            "type": file_type,
-            "thumbnail": thumbnail_filename,
-            # --- ВИКОРИСТОВУЄМО НОВУ ФУНКЦІЮ ---
-            "timestamp": get_original_date(original_file_path)
-        }
-        save_metadata(metadata)
-        return {"filename": file.filename, "type": file_type, "status": "success"}
+    # Пишемо у тимчасовий файл і рахуємо хеш, поки дані йдуть (у пулі потоків, не в event loop)
+    temp_file_path = original_file_path + ".uploading"
+    content_hash, _ = await run_in_threadpool(save_stream_with_hash, file.file, temp_file_path)
+    duplicate = find_duplicate(content_hash)
+    if duplicate:
+        # Такий вміст уже є — не перезаписуємо і не робимо прев'ю вдруге
+        os.remove(temp_file_path)
+        return {"filename": file.filename, "status": "duplicate", "existing": duplicate}
+    os.replace(temp_file_path, original_file_path)
+    invalidate_directory(original_file_path)
+
+    if get_media_type(file.filename) is None:
+        return {"filename": file.filename, "status": "skipped", "message": "Unsupported file type"}
+    # Прев'ю, дату і метадані робить фоновий конвеєр; статус — /ingest/status/{ingest_id}
+    return await run_in_threadpool(submit_ingest, file.filename, original_file_path, "", content_hash)
+
+
+@app.get("/ingest/status/{ingest_id}")
+async def get_ingest_status(ingest_id: str):
+    job = INGEST_PIPELINE.get(ingest_id)
+    if not job: raise HTTPException(status_code=404, detail="Ingest job not found")
+    return job.to_json()
+
+@app.get("/ingest/status/")
+async def get_ingest_overview():
+    return INGEST_PIPELINE.stats()
+
+
+# --- Пакетне завантаження ---
+# Обробка (прев'ю + дата) йде паралельно в пулі, а метадані зберігаються одним пакетом
+BATCH_WORKERS = os.cpu_count() or 2
+BATCH_POOL = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch-ingest")
+
+def iter_batch_sources(files, archive):
+    """(ім'я, файловий об'єкт) з multipart-файлів і/або потокового tar-архіву."""
+    for file in files or []:
+        yield file.filename, file.file
+    if archive is not None:
+        # "r|*" — читаємо tar послідовно, без перемотування (підходить і для .tar.gz)
+        with tarfile.open(fileobj=archive.file, mode="r|*") as tar:
+            for member in tar:
+                if not member.isfile(): continue
+                yield member.name, tar.extractfile(member)
+
+def save_batch_sources(files, archive, saved: list, results: list):
+    """
+    Пише файли пакета на диск, відкидаючи дублікати. Збережені додаються в
+    `saved` як (ім'я, шлях, хеш) одразу, щоб виклик міг прибрати їх з INFLIGHT_PATHS
+    за будь-якої помилки; помилки окремих файлів і пошкоджений архів — у `results`.
+    """
+    batch_hashes = {}
+    try:
+        for name, src in iter_batch_sources(files, archive):
+            filename = os.path.basename(name)
+            if not filename or filename.startswith("."):
+                continue
+            original_file_path = os.path.join(ORIGINALS_PATH, filename)
+            temp_file_path = original_file_path + ".uploading"
+            try:
+                content_hash, _ = save_stream_with_hash(src, temp_file_path)
+            except (OSError, EOFError, tarfile.TarError) as e:
+                if os.path.exists(temp_file_path): os.remove(temp_file_path)
+                results.append({"filename": filename, "status": "error", "message": f"Could not save file: {e}"})
+                continue
+            duplicate = find_duplicate(content_hash) or batch_hashes.get(content_hash)
+            if duplicate:
+                os.remove(temp_file_path)
+                results.append({"filename": filename, "status": "duplicate", "existing": duplicate})
+                continue
+            with INFLIGHT_LOCK: INFLIGHT_PATHS.add(original_file_path)
+            saved.append((filename, original_file_path, content_hash))
+            try:
+                os.replace(temp_file_path, original_file_path)
+            except OSError as e:
+                saved.pop()
+                with INFLIGHT_LOCK: INFLIGHT_PATHS.discard(original_file_path)
+                os.remove(temp_file_path)
+                results.append({"filename": filename, "status": "error", "message": f"Could not save file: {e}"})
+                continue
+            invalidate_directory(original_file_path)
+            batch_hashes[content_hash] = filename
+    except (OSError, EOFError, tarfile.TarError) as e:
+        # Архів обірвався чи пошкоджений посередині: те, що вже збережено, обробляємо як зазвичай
+        print(f"⚠️ Пакетне завантаження перервано: {e}")
+        results.append({"filename": archive.filename if archive is not None else None, "status": "error",
+                        "message": f"Could not read upload: {e}"})
+
+def prepare_batch_entry(item: tuple) -> tuple:
+    filename, file_path, content_hash = item
+    try:
+        return prepare_media_entry(filename, file_path, content_hash=content_hash)
+    except Exception as e:
+        print(f"❌ Помилка обробки {filename}: {e}")
+        return {"filename": filename, "status": "error", "message": str(e)}, None
+
+@app.post("/upload/batch")
+def upload_batch(files: List[UploadFile] = File(None), archive: UploadFile = File(None)):
+    """
+    Багато файлів за один запит: multipart-поля `files` або tar-архів у полі `archive`.
+    Звичайний def, тому запис на диск і обробка не блокують event loop.
+    """
+    results, saved = [], []
+    try:
+        save_batch_sources(files, archive, saved, results)
+        prepared = BATCH_POOL.map(prepare_batch_entry, saved)
+        entries = {}
+        for (filename, _, _), (result, entry) in zip(saved, prepared):
+            results.append(result)
+            if entry is not None: entries[filename] = entry
+        # Один пакет у сховище і одразу одна транзакція в каталог
+        STORE.set_many(entries)
+        STORE.flush()
+    finally:
+        with INFLIGHT_LOCK: INFLIGHT_PATHS.difference_update(path for _, path, _ in saved)
+    summary = {status: sum(1 for r in results if r["status"] == status) for status in ("success", "duplicate", "skipped", "error")}
+    return {"status": "success", "summary": summary, "results": results}
+
+
+# =================================================================
+# ДОКАЧКА ВЕЛИКИХ ФАЙЛІВ (resumable upload)
+# =================================================================
+# 1. POST /upload/sessions            {"filename", "size", "sha256"?, "path"?} -> {"id", "offset"}
+# 2. PUT  /upload/sessions/{id}       тіло = байти, заголовок Content-Range: bytes start-end/total
+# 3. GET  /upload/sessions/{id}       -> поточний offset (звідки продовжувати після обриву)
+# 4. POST /upload/sessions/{id}/finalize -> перевірка sha256, перенесення і звичайна обробка
+UPLOAD_SESSIONS = UploadSessionManager(UPLOAD_SESSIONS_PATH)
+
+def upload_error_response(e: UploadError) -> JSONResponse:
+    return JSONResponse(status_code=e.status_code, content={"detail": e.message, **e.extra})
+
+def parse_content_range(header: str) -> tuple:
+    """'bytes 0-1048575/2000000' -> (0, 2000000); total може бути '*' (None)."""
+    try:
+        unit, spec = header.strip().split(" ", 1)
+        byte_range, total = spec.split("/", 1)
+        start = int(byte_range.split("-", 1)[0])
+        if unit != "bytes" or start < 0: raise ValueError
+        return start, (None if total == "*" else int(total))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid Content-Range: {header}")
+
+@app.post("/upload/sessions")
+async def create_upload_session(filename: str = Body(...), size: int = Body(...), sha256: str = Body(None), path: str = Body("")):
+    filename = os.path.basename(filename)
+    if not filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    target_dir_path = resolve_originals_dir(path)
+    # Якщо клієнт одразу знає хеш і такий файл уже є — качати нічого не треба
+    duplicate = find_duplicate(sha256.lower()) if sha256 else None
+    if duplicate:
+        return {"filename": filename, "status": "duplicate", "existing": duplicate}
+    try:
+        session = UPLOAD_SESSIONS.create(filename, size, target_dir_path, folder=path.strip("/"), sha256=sha256)
+    except UploadError as e:
+        return upload_error_response(e)
+    return {"id": session["id"], "offset": 0, "size": size}
+
+@app.put("/upload/sessions/{session_id}")
+async def upload_session_chunk(session_id: str, request: Request):
+    content_range = request.headers.get("content-range")
+    if content_range:
+        start, total = parse_content_range(content_range)
+    elif "upload-offset" in request.headers:
+        try:
+            start, total = int(request.headers["upload-offset"]), None
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid Upload-Offset: {request.headers['upload-offset']}")
+        if start < 0: raise HTTPException(status_code=400, detail=f"Invalid Upload-Offset: {start}")
     else:
-        raise HTTPException(status_code=500, detail="Could not create thumbnail")
+        raise HTTPException(status_code=400, detail="Content-Range or Upload-Offset header is required")
+
+    try:
+        session, f = UPLOAD_SESSIONS.begin_chunk(session_id, start, total)
+    except UploadError as e:
+        return upload_error_response(e)
+    position = start
+    try:
+        # Читаємо тіло потоком і пишемо одразу в .part, без тимчасового файлу Starlette
+        async for data in request.stream():
+            if data:
+                position = await run_in_threadpool(UPLOAD_SESSIONS.write, session, f, data, position)
+    except UploadError as e:
+        await run_in_threadpool(UPLOAD_SESSIONS.end_chunk, session, f, position)
+        return upload_error_response(e)
+    except Exception as e:
+        # Обрив з'єднання: зберігаємо те, що встигли отримати
+        print(f"⚠️ Обрив докачки {session_id} на {position} байтах: {e}")
+    session = await run_in_threadpool(UPLOAD_SESSIONS.end_chunk, session, f, position)
+    return {"id": session_id, "offset": session["offset"], "size": session["size"]}
+
+@app.get("/upload/sessions/{session_id}")
+async def get_upload_session(session_id: str):
+    try:
+        session = UPLOAD_SESSIONS.get(session_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    return {"id": session_id, "filename": session["filename"], "offset": session["offset"], "size": session["size"]}
+
+@app.post("/upload/sessions/{session_id}/finalize")
+def finalize_upload_session(session_id: str, sha256: str = Body(None, embed=True)):
+    # Звичайний def: sha256 і прев'ю рахуються в пулі потоків, а не в event loop
+    try:
+        session, final_path, content_hash, duplicate = UPLOAD_SESSIONS.finalize(session_id, sha256, find_duplicate=find_duplicate)
+    except UploadError as e:
+        return upload_error_response(e)
+    if duplicate:
+        return {"filename": session["filename"], "status": "duplicate", "existing": duplicate}
+    invalidate_directory(final_path)
+    if get_media_type(session["filename"]) is None:
+        return {"filename": session["filename"], "status": "skipped", "message": "Unsupported file type"}
+    return submit_ingest(session["filename"], final_path, folder=session["folder"], content_hash=content_hash)
+
+@app.delete("/upload/sessions/{session_id}")
+async def abort_upload_session(session_id: str):
+    try:
+        UPLOAD_SESSIONS.abort(session_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    return {"status": "aborted", "id": session_id}
+
+
+@app.post("/sync/missing")
+async def get_missing_files(files: list = Body(..., embed=True)):
+    """
+    Клієнт надсилає [{"name", "size", "hash"}] для всіх файлів у папці,
+    а у відповідь отримує лише ті, яких на сервері ще немає.
+    """
+    missing = []
+    for item in files:
+        name, size, content_hash = item.get("name"), item.get("size"), (item.get("hash") or "").lower()
+        if content_hash and STORE.find_by_hash(content_hash):
+            continue
+        entry = STORE.get(name) if name else None
+        # Старі записи без хешу звіряємо за ім'ям і розміром
+        if entry and not entry.get("content_hash") and (size is None or entry.get("size") in (None, size)):
+            continue
+        missing.append(item)
+    return {"missing": missing, "present": len(files) - len(missing)}
+
+
+# --- ЕНДПОІНТ get_gallery/ ---
+GALLERY_MAX_PAGE_SIZE = 1000
 
+def media_version(entry: dict):
+    """
+    Версія вмісту запису для адрес з ?v=: змінюється разом з оригіналом або
+    налаштуваннями прев'ю. None для старих записів без відбитку прев'ю.
+    """
+    sig = entry.get("thumb_sig")
+    return hashlib.sha1(sig.encode("utf-8")).hexdigest()[:16] if sig else None
+
+def gallery_item_json(filename: str, entry: dict) -> dict:
+    """Один елемент галереї у форматі, який очікує Flutter-клієнт."""
+    return {"filename": filename, "type": entry["type"], "thumbnail": entry["thumbnail"], "timestamp": entry.get("timestamp"),
+            "version": media_version(entry), "placeholder": entry.get("placeholder")}
+
+# --- Застарілі прев'ю ---
+# Після зміни налаштувань старі прев'ю лишаються на місці й віддаються, поки
+# їх не замінять нові (запис атомарний), тож галерея ніколи не порожніє.
+# Оновлення йде двома шляхами: фоновою задачею по всіх файлах і окремо — для
+# того, що клієнт переглядає просто зараз (сторінки галереї, прев'ю за розміром).
+STALE_REFRESH_PENDING = set()
+STALE_REFRESH_LOCK = threading.Lock()
+
+def thumbnail_is_stale(entry: dict, settings: dict) -> bool:
+    return entry.get("thumb_sig") != thumbnail_signature(entry.get("source_sig", ""), settings)
+
+def schedule_thumbnail_refresh(filename: str, entry: dict, settings: dict):
+    """Перебудовує всю драбину прев'ю запису в пулі процесів, не блокуючи запит."""
+    original_file_path = original_path_for(filename, entry)
+    with STALE_REFRESH_LOCK:
+        if filename in STALE_REFRESH_PENDING: return
+        STALE_REFRESH_PENDING.add(filename)
+    try:
+        sig = source_signature(original_file_path)
+        task = thumbnail_task_for(entry["type"], original_file_path, entry["thumbnail"], settings)
+        future = get_process_pool().submit(render_thumbnail_task, task)
+    except OSError:
+        with STALE_REFRESH_LOCK: STALE_REFRESH_PENDING.discard(filename)
+        return
+
+    def done(future):
+        with STALE_REFRESH_LOCK: STALE_REFRESH_PENDING.discard(filename)
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"⚠️ Не вдалося оновити прев'ю {filename}: {e}")
+            return
+        if isinstance(result, dict) and STORE.contains(filename):
+            STORE.update(filename, source_sig=sig, thumb_sig=thumbnail_signature(sig, settings),
+                         **thumbnail_result_fields(result))
+    future.add_done_callback(done)
+
+def refresh_stale_thumbnails(items):
+    """Ставить у чергу застарілі прев'ю з [(filename, entry)], які зараз побачить клієнт."""
+    settings = load_settings()
+    for filename, entry in items:
+        if thumbnail_is_stale(entry, settings): schedule_thumbnail_refresh(filename, entry, settings)
 
-# --- ЕНДПОІНТ get_gallery/ ЗАЛИШАЄТЬСЯ БЕЗ ЗМІН, він вже готовий ---
 @app.get("/gallery/")
-async def get_gallery_list():
-    metadata = load_metadata()
-    if not metadata: return []
-    # Використовуємо .get() для безпечного отримання timestamp, на випадок старих записів
-    sorted_items = sorted(metadata.items(), key=lambda item: item[1].get('timestamp', 0), reverse=True)
-    gallery_list = [
-        {"filename": key, "type": value["type"], "thumbnail": value["thumbnail"], "timestamp": value.get("timestamp")}
-        for key, value in sorted_items if value.get("timestamp") # Віддаємо тільки ті, де є timestamp
-    ]
-    return JSONResponse(content=gallery_list)
+async def get_gallery_list(
+    request: Request,
+    cursor: str = Query(None),
+    limit: int = Query(None, ge=1, le=GALLERY_MAX_PAGE_SIZE),
+    since: int = Query(None, ge=0),
+):
+    """
+    Без параметрів — увесь список (як раніше).
+    cursor/limit — посторінково, від новіших до старіших.
+    since=<version> — лише додані/змінені/видалені записи після цієї версії.
+    Версія каталогу віддається як ETag, тож повторний запит без змін отримує 304.
+    """
+    version = CATALOG.version()
+    etag = f'"{version}"'
+    headers = {"ETag": etag, "X-Gallery-Version": str(version), "Cache-Control": "no-cache"}
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, cache_control="no-cache", headers={"X-Gallery-Version": str(version)})
+
+    if since is not None:
+        changes = CATALOG.changes_since(since)
+        return JSONResponse(content={
+            "version": version,
+            "added": [gallery_item_json(k, v) for k, v in changes["added"] if v.get("timestamp")],
+            "changed": [gallery_item_json(k, v) for k, v in changes["changed"] if v.get("timestamp")],
+            "deleted": changes["deleted"],
+        }, headers=headers)
+
+    if cursor is not None or limit is not None:
+        try:
+            items, next_cursor = CATALOG.list_gallery_page(cursor, limit or 100)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        refresh_stale_thumbnails(items)
+        return JSONResponse(content={
+            "version": version,
+            "items": [gallery_item_json(k, v) for k, v in items],
+            "next_cursor": next_cursor,
+        }, headers=headers)
+
+    # Каталог сам сортує по індексу timestamp і віддає тільки записи, де він є
+    gallery_list = [gallery_item_json(key, value) for key, value in CATALOG.list_gallery()]
+    return JSONResponse(content=gallery_list, headers=headers)
+
+# --- Атлас мініатюр для першого відображення сітки ---
+ATLAS_CACHE_PATH = os.path.join(STORAGE_PATH, "cache", "atlas")
+ATLAS_TILE_SIZE = 128
+ATLAS_COLUMNS = 10
+ATLAS_MAX_TILES = 200
+ATLAS_CACHE_BYTES = 256 * 1024 * 1024  # давно не переглянуті сторінки витісняються
+ATLASES = AtlasBuilder(ATLAS_CACHE_PATH, tile_size=ATLAS_TILE_SIZE, columns=ATLAS_COLUMNS, disk_budget=ATLAS_CACHE_BYTES)
+
+def atlas_tile_source(entry: dict, settings: dict):
+    """Найменше готове прев'ю, з якого вийде плитка атласу (без генерації на льоту)."""
+    for size in derivative_ladder(settings):
+        if size < ATLAS_TILE_SIZE: continue
+        path = derivative_path(entry["thumbnail"], size, settings)
+        if os.path.exists(path): return path
+    return None
+
+@app.get("/gallery/atlas/")
+def get_gallery_atlas(
+    cursor: str = Query(None),
+    limit: int = Query(100, ge=1, le=ATLAS_MAX_TILES),
+):
+    """
+    Сторінка галереї (як /gallery/?cursor=&limit=) разом з атласом її мініатюр:
+    одна картинка /gallery/atlas/<atlas_id>.jpg і прямокутник кожної плитки в ній.
+    Елементи, яких немає в tiles, клієнт вантажить звичайним /thumbnail/.
+    """
+    try:
+        items, next_cursor = CATALOG.list_gallery_page(cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    settings = load_settings()
+    # limit — частина ключа: та сама сторінка з іншим limit має інший вміст
+    manifest = ATLASES.build(
+        f"{limit}:{cursor or ''}",
+        [(filename, media_version(entry) or entry.get("source_sig"), atlas_tile_source(entry, settings)) for filename, entry in items],
+    )
+    return {
+        "version": CATALOG.version(),
+        "items": [gallery_item_json(k, v) for k, v in items],
+        "next_cursor": next_cursor,
+        "atlas": {**manifest, "url": f"/gallery/atlas/{manifest['atlas_id']}.jpg"},
+    }
+
+@app.get("/gallery/atlas/{atlas_id}.jpg")
+async def get_gallery_atlas_image(atlas_id: str, request: Request):
+    # Ідентифікатор атласу залежить від вмісту, тож картинку можна кешувати назавжди
+    if not ATLASES.has_atlas(atlas_id): raise HTTPException(status_code=404, detail="Atlas not found")
+    return file_response(request, ATLASES.image_path(atlas_id), "image/jpeg", CACHE_IMMUTABLE)
+
+# Готовий grouped-layout для останньої версії каталогу
+_GROUPED_CACHE = {"version": None, "layout": None}
+
+@app.get("/gallery/grouped/")
+async def get_grouped_gallery(request: Request):
+    """
+    Галерея, де серії знімків одного моменту зібрані в групи.
+    Групи беруться з готового індексу (group_id у каталозі), тут лише збираємо відповідь.
+    """
+    version = CATALOG.version()
+    etag = f'"{version}-grouped"'
+    headers = {"ETag": etag, "X-Gallery-Version": str(version), "Cache-Control": "no-cache"}
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, cache_control="no-cache", headers={"X-Gallery-Version": str(version)})
+    if _GROUPED_CACHE["version"] != version:
+        _GROUPED_CACHE["layout"] = grouped_layout(CATALOG.grouped_timeline(), gallery_item_json)
+        _GROUPED_CACHE["version"] = version
+    return JSONResponse(content=_GROUPED_CACHE["layout"], headers=headers)
+
+@app.get("/gallery/duplicates")
+def get_duplicates():
+    """Групи майже однакових фото: новіші групи першими, у групі — від новішого до старішого."""
+    groups = []
+    for names in SIMILARITY_INDEX.duplicates():
+        entries = [(name, STORE.get(name)) for name in names]
+        items = sorted((gallery_item_json(name, entry) for name, entry in entries if entry),
+                       key=lambda item: item["timestamp"] or 0, reverse=True)
+        if len(items) > 1: groups.append(items)
+    groups.sort(key=lambda items: items[0]["timestamp"] or 0, reverse=True)
+    return JSONResponse(content={"groups": groups, "count": len(groups)})
+
+@app.get("/gallery/similar/{filename}")
+def get_similar(filename: str, max_distance: int = Query(SIMILAR_DEFAULT_DISTANCE, ge=0, le=MAX_QUERY_DISTANCE),
+                limit: int = Query(50, ge=1, le=GALLERY_MAX_PAGE_SIZE)):
+    """Фото, схожі на filename, від найближчих; distance — скільки біт pHash відрізняється (з 64)."""
+    if not STORE.contains(filename): raise HTTPException(status_code=404, detail="File not found")
+    matches = SIMILARITY_INDEX.query(filename, max_distance, limit)
+    if matches is None: raise HTTPException(status_code=404, detail="Similarity hash not computed yet")
+    items = []
+    for distance, name in matches:
+        entry = STORE.get(name)
+        if entry: items.append({**gallery_item_json(name, entry), "distance": distance})
+    return JSONResponse(content={"filename": filename, "items": items})
+
+
+# --- Вибір формату зображення за заголовком Accept ---
+# WebP/AVIF помітно менші за JPEG тієї ж якості. Варіант кожного прев'ю
+# створюється один раз (з готового JPEG) і лежить поруч із ним.
+IMAGE_FORMAT_PREFERENCE = ["avif", "webp", "jpeg"]  # за рівних q — менший формат
+SUPPORTED_IMAGE_FORMATS = supported_formats()
+IMAGE_FORMAT_STATS = {}
+IMAGE_FORMAT_STATS_LOCK = threading.Lock()
+
+def parse_accept(accept: str) -> dict:
+    """'image/webp,image/*;q=0.8' -> {'image/webp': 1.0, 'image/*': 0.8}"""
+    weights = {}
+    for part in accept.split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        if not media_type: continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        weights[media_type.lower()] = max(q, weights.get(media_type.lower(), 0.0))
+    return weights
+
+def negotiate_image_format(accept: str, settings: dict) -> str:
+    """Найкращий дозволений формат, який приймає клієнт; JPEG — якщо нічого не підійшло."""
+    weights = parse_accept(accept or "")
+    enabled = {fmt for fmt in settings.get("image_formats", []) if fmt in SUPPORTED_IMAGE_FORMATS} | {"jpeg"}
+    best, best_q = "jpeg", 0.0
+    for fmt in IMAGE_FORMAT_PREFERENCE:
+        if fmt not in enabled: continue
+        # WebP/AVIF віддаємо лише тим, хто назвав їх явно: image/* не гарантує підтримку
+        q = weights.get(IMAGE_FORMATS[fmt][1], 0.0)
+        if fmt == "jpeg": q = max(q, weights.get("image/*", 0.0), weights.get("*/*", 0.0), 0.001)
+        if q > best_q: best, best_q = fmt, q
+    return best
+
+def _format_stats(fmt: str) -> dict:
+    return IMAGE_FORMAT_STATS.setdefault(fmt, {"generated": 0, "bytes": 0, "jpeg_bytes": 0, "served": 0, "served_bytes": 0})
+
+def record_format_generated(fmt: str, size: int, jpeg_size: int):
+    """Скільки важить варіант порівняно з JPEG того ж зображення."""
+    with IMAGE_FORMAT_STATS_LOCK:
+        stats = _format_stats(fmt)
+        stats["generated"] += 1
+        stats["bytes"] += size
+        stats["jpeg_bytes"] += jpeg_size
+
+def record_format_served(fmt: str, size: int):
+    with IMAGE_FORMAT_STATS_LOCK:
+        stats = _format_stats(fmt)
+        stats["served"] += 1
+        stats["served_bytes"] += size
+
+# Лінива генерація відсутніх файлів: один рендер на файл, навіть якщо
+# його одночасно просять кілька запитів
+DERIVATIVE_LOCKS = {}
+DERIVATIVE_LOCKS_GUARD = threading.Lock()
+
+def render_once(file_path: str, is_fresh, render) -> bool:
+    """Викликає render(), якщо файл не is_fresh(); паралельні запити чекають на той самий рендер."""
+    if is_fresh(): return True
+    with DERIVATIVE_LOCKS_GUARD:
+        lock = DERIVATIVE_LOCKS.setdefault(file_path, threading.Lock())
+    try:
+        with lock:
+            if is_fresh(): return True
+            return render()
+    finally:
+        with DERIVATIVE_LOCKS_GUARD:
+            DERIVATIVE_LOCKS.pop(file_path, None)
+
+def versioned_cache_control(request: Request, current_version=None) -> str:
+    """
+    Адреса з ?v=<версія> незмінна, тож її можна кешувати назавжди. Якщо поточна
+    версія відома, а клієнт прислав стару — кешувати не дозволяємо.
+    """
+    requested = request.query_params.get("v")
+    if requested and (current_version is None or requested == current_version): return CACHE_IMMUTABLE
+    return CACHE_REVALIDATE
 
+def image_variant_response(request: Request, jpeg_path: str, cache_control: str) -> Response:
+    """Віддає JPEG-прев'ю або його WebP/AVIF-варіант, залежно від Accept."""
+    settings = load_settings()
+    fmt = negotiate_image_format(request.headers.get("accept", ""), settings)
+    headers = {"Vary": "Accept"}
+    if fmt != "jpeg":
+        variant_path = os.path.splitext(jpeg_path)[0] + IMAGE_FORMATS[fmt][2]
+
+        def is_fresh():
+            # Варіант застарів, якщо JPEG перегенерували після нього
+            return os.path.exists(variant_path) and os.path.getmtime(variant_path) >= os.path.getmtime(jpeg_path)
+
+        def render():
+            try:
+                size = transcode_image(jpeg_path, variant_path, fmt, settings.get("preview_quality", 80))
+            except Exception as e:
+                print(f"⚠️ Не вдалося створити {fmt}-варіант {os.path.basename(jpeg_path)}: {e}")
+                return False
+            record_format_generated(fmt, size, os.path.getsize(jpeg_path))
+            return True
+
+        if render_once(variant_path, is_fresh, render):
+            record_format_served(fmt, os.path.getsize(variant_path))
+            return file_response(request, variant_path, IMAGE_FORMATS[fmt][1], cache_control, headers=headers)
+    record_format_served("jpeg", os.path.getsize(jpeg_path))
+    return file_response(request, jpeg_path, "image/jpeg", cache_control, headers=headers)
 
 @app.get("/thumbnail/{filename}")
-# ... (без змін) ...
-async def get_thumbnail(filename: str):
+def get_thumbnail(filename: str, request: Request):
+    # Тут відомо лише ім'я прев'ю, а не запис, тож версії з ?v= довіряємо
     file_path = os.path.join(THUMBNAILS_PATH, filename)
-    if os.path.exists(file_path): return FileResponse(file_path)
+    if os.path.exists(file_path): return image_variant_response(request, file_path, versioned_cache_control(request))
     raise HTTPException(status_code=404, detail="Thumbnail not found")
 
+@app.get("/thumbnail/{size}/{filename}")
+def get_sized_thumbnail(size: int, filename: str, request: Request):
+    """
+    Прев'ю медіафайлу `filename` найменшого розміру з драбини, не меншого за `size`
+    (або найбільшого, якщо такого немає). Відсутній щабель генерується на льоту;
+    застарілий віддається як є, а нова драбина будується у фоні.
+    """
+    entry = STORE.get(filename)
+    if not entry: raise HTTPException(status_code=404, detail="File not found")
+    settings = load_settings()
+    ladder = derivative_ladder(settings)
+    rung = next((s for s in ladder if s >= size), ladder[-1])
+    file_path = derivative_path(entry["thumbnail"], rung, settings)
+    original_file_path = original_path_for(filename, entry)
+
+    def render():
+        if not os.path.exists(original_file_path):
+            raise HTTPException(status_code=404, detail="File not found")
+        return render_thumbnail_task(thumbnail_task_for(entry["type"], original_file_path, entry["thumbnail"], settings, sizes=[rung]))
+
+    if not render_once(file_path, lambda: os.path.exists(file_path), render):
+        raise HTTPException(status_code=500, detail="Could not create thumbnail")
+    if thumbnail_is_stale(entry, settings): schedule_thumbnail_refresh(filename, entry, settings)
+    return image_variant_response(request, file_path, versioned_cache_control(request, media_version(entry)))
+
+# --- Пакет мініатюр в одній відповіді ---
+# Формат (усі числа big-endian):
+#   b"BSB1"
+#   для кожного файлу: u16 довжина імені, ім'я (UTF-8), u8 код формату
+#                      (0 — прев'ю немає, 1 — JPEG), u32 довжина даних, дані
+#   u16 0 — кінець пакета
+BUNDLE_MAGIC = b"BSB1"
+BUNDLE_FORMAT_MISSING = 0
+BUNDLE_FORMAT_JPEG = 1
+BUNDLE_MAX_FILES = 500
+BUNDLE_CHUNK_SIZE = 64 * 1024
+
+def iter_thumbnail_bundle(paths: list):
+    """Генератор кадрів: кожен файл читається шматками і відправляється одразу."""
+    yield BUNDLE_MAGIC
+    for filename, file_path in paths:
+        name = filename.encode("utf-8")
+        try:
+            f = open(file_path, "rb") if file_path else None
+        except OSError:
+            f = None
+        if f is None:
+            yield struct.pack(">H", len(name)) + name + struct.pack(">BI", BUNDLE_FORMAT_MISSING, 0)
+            continue
+        with f:
+            # Довжину беремо з уже відкритого файлу: атомарна заміна прев'ю її не зіб'є
+            remaining = os.fstat(f.fileno()).st_size
+            yield struct.pack(">H", len(name)) + name + struct.pack(">BI", BUNDLE_FORMAT_JPEG, remaining)
+            while remaining > 0:
+                chunk = f.read(min(BUNDLE_CHUNK_SIZE, remaining))
+                if not chunk: break
+                remaining -= len(chunk)
+                yield chunk
+            if remaining:
+                # Файл укоротили під час читання — добиваємо нулями, щоб не зламати кадри
+                yield bytes(remaining)
+    yield struct.pack(">H", 0)
+
+@app.post("/thumbnails/bundle")
+def get_thumbnails_bundle(
+    files: List[str] = Body(None, embed=True),
+    cursor: str = Body(None, embed=True),
+    limit: int = Body(None, embed=True),
+    size: int = Body(None, embed=True),
+):
+    """
+    Мініатюри багатьох файлів одним потоком: або перелік `files` (імена
+    медіафайлів), або сторінка галереї `cursor`/`limit`, як у /gallery/.
+    `size` — щабель драбини (за замовчуванням preview_size). Відсутні на
+    диску прев'ю позначаються кодом 0, клієнт може довантажити їх окремо.
+    """
+    settings = load_settings()
+    if files is not None:
+        if len(files) > BUNDLE_MAX_FILES:
+            raise HTTPException(status_code=400, detail=f"Too many files (max {BUNDLE_MAX_FILES})")
+        entries = [(filename, STORE.get(filename)) for filename in files]
+    else:
+        if not limit or not 1 <= limit <= BUNDLE_MAX_FILES:
+            raise HTTPException(status_code=400, detail=f"limit must be between 1 and {BUNDLE_MAX_FILES}")
+        try:
+            entries, _ = CATALOG.list_gallery_page(cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    ladder = derivative_ladder(settings)
+    rung = next((s for s in ladder if s >= size), ladder[-1]) if size else settings.get("preview_size", 400)
+    paths = [(filename, derivative_path(entry["thumbnail"], rung, settings) if entry else None) for filename, entry in entries]
+    return StreamingResponse(iter_thumbnail_bundle(paths), media_type="application/octet-stream",
+                             headers={"X-Bundle-Format": "1", "X-Bundle-Size": str(rung)})
+
+# --- Анімовані прев'ю відео ---
+VIDEO_PREVIEWS_PATH = os.path.join(STORAGE_PATH, "cache", "video_previews")
+os.makedirs(VIDEO_PREVIEWS_PATH, exist_ok=True)
+VIDEO_PREVIEW_FORMATS = {"webp": "image/webp", "mp4": "video/mp4"}
+
+@app.get("/video_preview/{filename}")
+def get_video_preview(filename: str, request: Request, format: str = Query("webp")):
+    """
+    Кілька кадрів відео у вигляді короткої анімації (WebP або німий MP4) для
+    відтворення при наведенні/прокрутці. Генерується один раз для кожної
+    версії оригіналу; ffmpeg запускається через обмежений пул.
+    """
+    if format not in VIDEO_PREVIEW_FORMATS: raise HTTPException(status_code=400, detail="Unsupported format")
+    entry = STORE.get(filename)
+    if not entry or entry.get("type") != "video": raise HTTPException(status_code=404, detail="Video not found")
+    video_path = original_path_for(filename, entry)
+    if not os.path.exists(video_path): raise HTTPException(status_code=404, detail="Video not found")
+    name_id = hashlib.sha1(filename.encode("utf-8")).hexdigest()[:12]
+    version = hashlib.sha1(source_signature(video_path).encode("utf-8")).hexdigest()[:12]
+    preview_path = os.path.join(VIDEO_PREVIEWS_PATH, f"{name_id}-{version}.{format}")
+
+    def render():
+        if not render_animated_preview(video_path, preview_path, format): return False
+        # Прев'ю попередніх версій цього файлу більше не знадобляться
+        for old in os.listdir(VIDEO_PREVIEWS_PATH):
+            if old.startswith(f"{name_id}-") and old.endswith(f".{format}") and not old.startswith(f"{name_id}-{version}"):
+                os.remove(os.path.join(VIDEO_PREVIEWS_PATH, old))
+        return True
+
+    if not render_once(preview_path, lambda: os.path.exists(preview_path), render):
+        raise HTTPException(status_code=500, detail="Could not create video preview")
+    return file_response(request, preview_path, VIDEO_PREVIEW_FORMATS[format], versioned_cache_control(request, media_version(entry)))
+
+# --- HLS: відтворення відео з адаптивним бітрейтом ---
+HLS_CACHE_PATH = os.path.join(STORAGE_PATH, "cache", "hls")
+HLS_PLAYLIST_TYPE = "application/vnd.apple.mpegurl"
+
+@app.get("/hls/{filename}/master.m3u8")
+def get_hls_master(filename: str):
+    """
+    Точка входу плеєра. Перший запит запускає кодування драбини (360p/720p/...
+    не більше за оригінал); плейлисти варіантів з'являються вже після першого
+    сегмента, тож відтворення починається за секунди, а не після всього ролика.
+    """
+    entry = STORE.get(filename)
+    if not entry or entry.get("type") != "video": raise HTTPException(status_code=404, detail="Video not found")
+    video_path = original_path_for(filename, entry)
+    if not os.path.exists(video_path): raise HTTPException(status_code=404, detail="Video not found")
+    session_id = HLS.session_id(filename, source_signature(video_path))
+    if not HLS.start(session_id, video_path):
+        raise HTTPException(status_code=500, detail="Could not transcode video")
+    playlist = HLS.wait_for_master(session_id)
+    if playlist is None: raise HTTPException(status_code=503, detail="Transcoder busy", headers={"Retry-After": "2"})
+    return Response(playlist, media_type=HLS_PLAYLIST_TYPE, headers={"Cache-Control": CACHE_REVALIDATE})
+
+@app.get("/hls/session/{session_id}/{rendition}/{name}")
+def get_hls_file(session_id: str, rendition: str, name: str, request: Request):
+    """Плейлист варіанта (доростає, поки йде кодування) або сегмент (незмінний)."""
+    if name == "index.m3u8":
+        path = HLS.media_playlist(session_id, rendition)
+        if path is None: raise HTTPException(status_code=503, detail="Playlist not ready", headers={"Retry-After": "2"})
+        return file_response(request, path, HLS_PLAYLIST_TYPE, CACHE_REVALIDATE)
+    path = HLS.segment_path(session_id, rendition, name)
+    if path is None: raise HTTPException(status_code=404, detail="Segment not found")
+    return file_response(request, path, "video/mp2t", CACHE_IMMUTABLE)
+
+@app.get("/stats/images")
+async def get_image_stats():
+    """Економія трафіку від WebP/AVIF і стан кешу зменшених оригіналів."""
+    with IMAGE_FORMAT_STATS_LOCK:
+        formats = {fmt: dict(stats) for fmt, stats in IMAGE_FORMAT_STATS.items()}
+    for fmt, stats in formats.items():
+        if fmt == "jpeg" or not stats["bytes"]: continue
+        ratio = stats["jpeg_bytes"] / stats["bytes"]
+        stats["saved_percent"] = round(100.0 * (1 - 1 / ratio), 1)
+        # Скільки байтів ми заощадили б при відповідях JPEG-ом (за середнім співвідношенням)
+        stats["served_saved_bytes"] = int(stats["served_bytes"] * (ratio - 1))
+    return {"formats": formats, "supported": sorted(SUPPORTED_IMAGE_FORMATS), "resized_cache": RENDITION_CACHE.usage(),
+            "hls_cache": HLS.usage(), "atlas_cache": ATLASES.usage()}
+
 @app.get("/original/{filename}")
 # ... (без змін) ...
-async def get_original_file(filename: str):
+async def get_original_file(filename: str, request: Request):
     file_path = os.path.join(ORIGINALS_PATH, filename)
-    if os.path.exists(file_path): return FileResponse(file_path)
+    if os.path.exists(file_path):
+        entry = STORE.get(filename)
+        return file_response(request, file_path, cache_control=versioned_cache_control(request, media_version(entry) if entry else ""))
     raise HTTPException(status_code=404, detail="File not found")
 
-@app.post("/gallery/rescan")
-async def rescan_storage():
-    # ... (цей код треба теж оновити, щоб він використовував get_original_date) ...
-    supported_image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.heic', 'webp']
-    supported_video_extensions = ['.mp4', '.mov', '.avi', '.mkv', 'webm']
-    metadata = load_metadata()
-    original_files = os.listdir(ORIGINALS_PATH)
-    processed_count, updated_count = 0, 0
-    
-    for filename in original_files:
-        original_file_path = os.path.join(ORIGINALS_PATH, filename)
-        # Перескануємо, тільки якщо запис неповний (немає timestamp)
-        if filename in metadata and 'timestamp' in metadata[filename]: continue
-            
-        if filename in metadata: updated_count += 1
-        else: processed_count += 1
+# =================================================================
+# ФОНОВІ ЗАДАЧІ: ПЕРЕСКАНУВАННЯ ТА ГЕНЕРАЦІЯ ПРЕВ'Ю
+# =================================================================
+# Обидві задачі роздають рендер прев'ю в пул процесів (по одному на ядро),
+# пропускають файли, оригінал і налаштування яких не змінились, і звітують
+# про прогрес через /jobs/{job_id}. Скасування — POST /jobs/{job_id}/cancel.
+JOBS = JobManager()
+# Кадри для прев'ю відео в процесах пулу рахуються в той самий ліміт ffmpeg, що й у сервері
+set_process_pool_initializer(use_ffmpeg_slots, ffmpeg_slots())
+RESCAN_COMMIT_BATCH = 200
+
+# Дерево оригіналів (з підпапками) обходить TreeScanner: каталоги, mtime яких
+# не змінився з минулого разу, не перечитуються, тож повторний rescan без змін
+# коштує по одному stat() на каталог. ?full=true — перечитати все дерево.
+ORIGINALS_SNAPSHOT_FILE = os.path.join(STORAGE_PATH, "cache", "originals_snapshot.json")
+ORIGINALS_SCANNER = TreeScanner(ORIGINALS_PATH, ORIGINALS_SNAPSHOT_FILE, accept=lambda name: get_media_type(name) is not None)
+
+def scan_originals(job, full: bool = False) -> list:
+    """
+    [(filename, folder, шлях, source_sig)] для всіх медіафайлів у дереві оригіналів.
+    Записи в галереї ключуються ім'ям файлу, тому з кількох однойменних файлів
+    беремо той, на який уже вказує запис, інакше — найближчий до кореня.
+    """
+    by_name = {}
+    for rel_path, (size, mtime_ns) in ORIGINALS_SCANNER.scan(full=full, check_cancelled=job.check_cancelled).items():
+        folder, filename = os.path.split(rel_path)
+        current = by_name.get(filename)
+        if current is not None:
+            entry = STORE.get(filename)
+            known_folder = entry.get("folder", "") if entry else None
+            if current[1] == known_folder or (folder != known_folder and current[1].count("/") <= folder.count("/")):
+                continue
+        by_name[filename] = (filename, folder, os.path.join(ORIGINALS_PATH, rel_path), f"{size}:{mtime_ns}")
+    return list(by_name.values())
 
-        file_extension = os.path.splitext(filename.lower())[1]
-        file_type = None
-        if file_extension in supported_image_extensions: file_type = "image"
-        elif file_extension in supported_video_extensions: file_type = "video"
-        else: continue
+def rescan_storage_job(job, full: bool = False):
+    settings = load_settings()
+    counts = {"new": 0, "updated": 0}
+    candidates = []  # (filename, folder, шлях, file_type, existing, source_sig, потрібне прев'ю)
+    for filename, folder, original_file_path, sig in scan_originals(job, full):
+        job.check_cancelled()
+        file_type = get_media_type(filename)
+        existing = STORE.get(filename)
+        # Повний запис, оригінал якого не змінився, не чіпаємо
+        # (старі записи без source_sig вважаємо актуальними; записи без media
+        # перечитуємо — дешево, лише заголовки, — щоб виправити дату зйомки)
+        if (existing and 'timestamp' in existing and "media" in existing and existing.get("source_sig", sig) == sig
+                and existing.get("folder", "") == folder):
+            job.skipped += 1
+            continue
+        counts["updated" if existing else "new"] += 1
+        thumbnail_path = derivative_path(f"{os.path.splitext(filename)[0]}.jpg", settings.get("preview_size", 400), settings)
+        source_changed = existing is not None and existing.get("source_sig") not in (None, sig)
+        candidates.append((filename, folder, original_file_path, file_type, existing, sig,
+                           source_changed or not os.path.exists(thumbnail_path)))
+    job.total = len(candidates)
+    job.message = "Scanning"
+
+    updates = {}
+    def commit(force=False):
+        if updates and (force or len(updates) >= RESCAN_COMMIT_BATCH):
+            STORE.set_many(updates)
+            updates.clear()
+
+    def add_entry(filename, folder, original_file_path, file_type, existing, sig, rendered):
+        # rendered: результат render_thumbnail_task, None — помилка, {} — прев'ю вже було
+        if rendered is not None:
+            try:
+                entry = {
+                    **(existing or {}),
+                    "type": file_type,
+                    "thumbnail": f"{os.path.splitext(filename)[0]}.jpg",
+                    **read_media_info(original_file_path),
+                    "folder": folder,
+                    "size": os.path.getsize(original_file_path),
+                    "source_sig": sig,
+                }
+            except OSError as e:
+                # Файл видалили чи перейменували після сканування (Samba, стеження) — не зупиняємо весь прохід
+                print(f"⚠️ {original_file_path} зник під час сканування: {e}")
+                job.skipped += 1
+                job.processed += 1
+                return
+            if rendered:
+                entry["thumb_sig"] = thumbnail_signature(sig, settings)
+                entry.update(thumbnail_result_fields(rendered))
+            updates[filename] = entry
+        else:
+            job.failed += 1
+        job.processed += 1
+        commit()
+
+    tasks, by_source = [], {}
+    for filename, folder, original_file_path, file_type, existing, sig, needs_thumbnail in candidates:
+        job.check_cancelled()
+        if needs_thumbnail:
+            tasks.append(thumbnail_task_for(file_type, original_file_path, f"{os.path.splitext(filename)[0]}.jpg", settings))
+            by_source[original_file_path] = (filename, folder, original_file_path, file_type, existing, sig)
+        else:
+            add_entry(filename, folder, original_file_path, file_type, existing, sig, {})
 
-        thumbnail_filename = f"{os.path.splitext(filename)[0]}.jpg"
-        thumbnail_file_path = os.path.join(THUMBNAILS_PATH, thumbnail_filename)
-        
-        if not os.path.exists(thumbnail_file_path):
-            created = False
-            if file_type == "image": created = create_photo_thumbnail(original_file_path, thumbnail_file_path)
-            elif file_type == "video": created = create_video_thumbnail(original_file_path, thumbnail_file_path)
-            if not created: continue
-
-        # --- ВИКОРИСТОВУЄМО НОВУ ФУНКЦІЮ І ТУТ ---
-        metadata[filename] = {
-            "type": file_type,
-            "thumbnail": thumbnail_filename,
-            "timestamp": get_original_date(original_file_path)
-        }
+    def on_result(task, result):
+        add_entry(*by_source[task[1]], result if isinstance(result, dict) else None)
+    try:
+        run_in_process_pool(job, render_thumbnail_task, tasks, on_result)
+    finally:
+        commit(force=True)
+    job.message = f"Scan complete. New: {counts['new']}. Updated: {counts['updated']}."
+    return {**counts, "failed": job.failed, "skipped": job.skipped, "scan": ORIGINALS_SCANNER.last_stats}
 
-    save_metadata(metadata)
-    message = f"Scan complete. New: {processed_count}. Updated: {updated_count}."
-    return {"status": "success", "message": message}
+def generate_all_thumbnails_job(job):
+    """
+    Генерує прев'ю, яких немає або які зроблені з іншими налаштуваннями.
+    Якщо налаштування змінились під час роботи, проходить ще раз з новими.
+    """
+    while True:
+        settings = load_settings()
+        generate_thumbnails_pass(job, settings)
+        if thumbnail_settings_version(load_settings()) == thumbnail_settings_version(settings): break
+        job.message = "Settings changed, starting over"
+    removed = remove_orphan_derivatives(settings)
+    job.message = "Done"
+    return {"generated": job.processed - job.failed, "failed": job.failed, "skipped": job.skipped,
+            "removed_sizes": removed}
+
+def generate_thumbnails_pass(job, settings: dict):
+    tasks, signatures = [], {}
+    for filename, folder, original_file_path, sig in scan_originals(job):
+        job.check_cancelled()
+        entry = STORE.get(filename)
+        # Файлу ще немає в галереї (або запис належить однойменному файлу з іншої папки):
+        # прев'ю для нього зробить rescan/стеження разом із записом, тут результат нікуди було б зберегти
+        if entry is None or entry.get("folder", "") != folder:
+            job.skipped += 1
+            continue
+        file_type = get_media_type(filename)
+        thumbnail_name = f"{os.path.splitext(filename)[0]}.jpg"
+        thumb_sig = thumbnail_signature(sig, settings)
+        # Прев'ю (заглушка і хеші) вже зроблені з цього ж оригіналу і з тими ж налаштуваннями
+        if (entry.get("thumb_sig") == thumb_sig and entry.get("placeholder") and entry.get("phash")
+                and os.path.exists(derivative_path(thumbnail_name, settings.get("preview_size", 400), settings))):
+            job.skipped += 1
+            continue
+        tasks.append(thumbnail_task_for(file_type, original_file_path, thumbnail_name, settings))
+        signatures[original_file_path] = (filename, sig, thumb_sig)
+    job.total += len(tasks)
+    job.message = "Generating thumbnails"
+
+    def on_result(task, result):
+        filename, sig, thumb_sig = signatures[task[1]]
+        if isinstance(result, dict):
+            STORE.update(filename, source_sig=sig, thumb_sig=thumb_sig, **thumbnail_result_fields(result))
+        else:
+            job.failed += 1
+        job.processed += 1
+    run_in_process_pool(job, render_thumbnail_task, tasks, on_result)
+
+def remove_orphan_derivatives(settings: dict) -> list:
+    """Прибирає каталоги розмірів, яких більше немає в драбині (після того, як їм знайшлася заміна)."""
+    live = {str(size) for size in derivative_ladder(settings) if size != settings.get("preview_size", 400)}
+    removed = []
+    for name in os.listdir(DERIVATIVES_PATH):
+        if name not in live and os.path.isdir(os.path.join(DERIVATIVES_PATH, name)):
+            shutil.rmtree(os.path.join(DERIVATIVES_PATH, name), ignore_errors=True)
+            removed.append(name)
+    return removed
+
+def job_started_response(job, created: bool) -> dict:
+    return {"status": "started" if created else "already_running", "job_id": job.id, "job": job.to_json()}
+
+@app.post("/gallery/rescan")
+async def rescan_storage(full: bool = False):
+    job, created = JOBS.start("rescan", lambda job: rescan_storage_job(job, full))
+    return job_started_response(job, created)
+
+@app.get("/jobs/")
+async def list_jobs():
+    return [job.to_json() for job in JOBS.list()]
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    job = JOBS.get(job_id)
+    if not job: raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_json()
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = JOBS.get(job_id)
+    if not job: raise HTTPException(status_code=404, detail="Job not found")
+    job.cancel()
+    return job.to_json()
+
+# --- Стеження за папкою оригіналів ---
+# Файли, скопійовані в ORIGINALS_PATH повз API (Samba, rsync, файловий менеджер),
+# потрапляють у той самий конвеєр ingest, що й завантаження, — без /gallery/rescan.
+# Якщо inotify загубив події (переповнення черги), запускаємо звичайний rescan.
+WATCH_ORIGINALS = True
+
+def watcher_files_changed(paths: list):
+    base_path = os.path.abspath(ORIGINALS_PATH)
+    for path in paths:
+        invalidate_directory(path)
+        filename = os.path.basename(path)
+        with INFLIGHT_LOCK:
+            if path in INFLIGHT_PATHS: continue  # уже обробляється (наше ж завантаження)
+        entry = STORE.get(filename)
+        if entry:
+            existing_path = os.path.abspath(original_path_for(filename, entry))
+            if existing_path == path:
+                try:
+                    if entry.get("source_sig") == source_signature(path): continue
+                except FileNotFoundError:
+                    continue
+            elif os.path.exists(existing_path):
+                print(f"⚠️ {path}: у галереї вже є файл з ім'ям {filename} ({existing_path}), пропускаю")
+                continue
+        folder = os.path.relpath(os.path.dirname(path), base_path)
+        submit_ingest(filename, path, "" if folder == "." else folder)
+        print(f"📥 Новий файл у папці: {os.path.relpath(path, base_path)}")
+
+def watcher_files_removed(paths: list):
+    removed, unknown = [], []
+    for path in paths:
+        invalidate_directory(path)
+        filename = os.path.basename(path)
+        entry = STORE.get(filename)
+        if entry and os.path.abspath(original_path_for(filename, entry)) == path:
+            removed.append(filename)
+        else:
+            unknown.append(path + os.sep)
+    if unknown:
+        # Серед невідомих шляхів можуть бути видалені папки — прибираємо все, що лежало в них
+        prefixes = tuple(unknown)
+        removed.extend(name for name, entry in STORE.snapshot().items()
+                       if name not in removed and os.path.abspath(original_path_for(name, entry)).startswith(prefixes))
+    if removed:
+        STORE.remove_many(removed)
+        print(f"🗑️ Прибрано з галереї {len(removed)} видалених файлів")
+
+def watcher_overflow():
+    JOBS.start("rescan", rescan_storage_job)
+
+ORIGINALS_WATCHER = MediaWatcher(ORIGINALS_PATH, on_changed=watcher_files_changed, on_removed=watcher_files_removed,
+                                 on_overflow=watcher_overflow, ignore=lambda name: get_media_type(name) is None)
+
+@app.on_event("startup")
+def start_originals_watcher():
+    if WATCH_ORIGINALS: ORIGINALS_WATCHER.start()
+
+@app.on_event("shutdown")
+def stop_originals_watcher():
+    ORIGINALS_WATCHER.stop()
+
+@app.get("/gallery/watcher")
+async def get_watcher_status():
+    return ORIGINALS_WATCHER.status()
 
 # --- Глобальні налаштування ---
 SETTINGS_FILE = os.path.join(STORAGE_PATH, "settings.json")
@@ -713,6 +1843,12 @@ DEFAULT_SETTINGS = {
     "preview_quality": 80,
     "photo_size": 0,      # 0 = оригінал
     "photo_quality": 100,
+    "derivative_sizes": [128, 400, 1080, 2160],  # драбина прев'ю; preview_size додається автоматично
+    "resized_cache_mb": 1024,  # дисковий кеш /original_resized/
+    "image_formats": ["avif", "webp"],  # що можна віддавати замість JPEG, якщо клієнт приймає
+    "hls_cache_mb": 4096,  # сегменти HLS; найдавніше переглянуті ролики витісняються першими
+    "hls_prepare_on_ingest": False,  # кодувати HLS одразу після завантаження (у фоні, коли сервер простоює)
+    "thumbnail_epoch": 0,  # збільшує /thumbnails/clear_cache/, щоб перебудувати всі прев'ю
 }
 
 def load_settings():
@@ -735,27 +1871,58 @@ async def get_settings():
 @app.post("/settings/")
 async def update_settings(data: dict = Body(...)):
     settings = load_settings()
+    previous = dict(settings)
     for key in DEFAULT_SETTINGS:
         if key in data:
             settings[key] = data[key]
     save_settings(settings)
-    return {"status": "success", "settings": settings}
+    if (settings["photo_size"], settings["photo_quality"]) != (previous["photo_size"], previous["photo_quality"]):
+        RENDITION_CACHE.clear()
+    if settings["resized_cache_mb"] != previous["resized_cache_mb"]:
+        RENDITION_CACHE.set_disk_budget(settings["resized_cache_mb"] * 1024 * 1024)
+    if settings["hls_cache_mb"] != previous["hls_cache_mb"]:
+        HLS.set_disk_budget(settings["hls_cache_mb"] * 1024 * 1024)
+    response = {"status": "success", "settings": settings}
+    # Нові налаштування прев'ю: старі віддаються й далі, а заміна будується у фоні
+    if thumbnail_settings_version(settings) != thumbnail_settings_version(previous):
+        job, created = JOBS.start("generate_thumbnails", generate_all_thumbnails_job)
+        response["thumbnails_job"] = job_started_response(job, created)
+    return response
 
 @app.post("/thumbnails/clear_cache/")
 async def clear_thumbnails_cache():
-    try:
-        for fname in os.listdir(THUMBNAILS_PATH):
-            fpath = os.path.join(THUMBNAILS_PATH, fname)
-            if os.path.isfile(fpath):
-                os.remove(fpath)
-        return {"status": "success", "message": "Thumbnail cache cleared"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    """
+    Перебудова всіх прев'ю без порожньої галереї: позначає наявні застарілими
+    (нова епоха в налаштуваннях) і запускає фонову генерацію. Поки нове
+    прев'ю не готове, клієнт отримує старе.
+    """
+    settings = load_settings()
+    settings["thumbnail_epoch"] = settings.get("thumbnail_epoch", 0) + 1
+    save_settings(settings)
+    job, created = JOBS.start("generate_thumbnails", generate_all_thumbnails_job)
+    return {**job_started_response(job, created), "message": "Thumbnails will be rebuilt in the background"}
 
 print("🚀 Сервер готовий до роботи! (v_final, з оригінальною датою)")
 
+# --- Кеш зменшених оригіналів для переглядача ---
+# Ключ — (вміст файлу, photo_size, photo_quality, формат), тож зміна налаштувань
+# сама по собі веде до нових ключів; старі рендери ми ще й прибираємо одразу.
+RENDITION_CACHE_PATH = os.path.join(STORAGE_PATH, "cache", "resized")
+RENDITION_MEMORY_BUDGET = 64 * 1024 * 1024
+RENDITION_CACHE = RenditionCache(RENDITION_CACHE_PATH, memory_budget=RENDITION_MEMORY_BUDGET,
+                                 disk_budget=load_settings().get("resized_cache_mb", 1024) * 1024 * 1024)
+
+HLS = HlsManager(HLS_CACHE_PATH, disk_budget=load_settings().get("hls_cache_mb", 4096) * 1024 * 1024)
+
+def rendition_key(filename: str, file_path: str, max_size: int, quality: int, fmt: str) -> str:
+    sig = source_signature(file_path)
+    entry = STORE.get(filename)
+    # Хеш вмісту переживає перейменування, але лише поки файл не змінювали на місці
+    version = entry["content_hash"] if entry and entry.get("content_hash") and entry.get("source_sig") == sig else sig
+    return f"{version}:{max_size}:{quality}:{fmt}"
+
 @app.get("/original_resized/{filename}")
-async def get_resized_original(filename: str):
+def get_resized_original(filename: str, request: Request):
     file_path = os.path.join(ORIGINALS_PATH, filename)
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="File not found")
@@ -765,73 +1932,44 @@ async def get_resized_original(filename: str):
     ext = os.path.splitext(filename.lower())[1]
     # Якщо не зображення — просто віддаємо файл
     if ext not in [".jpg", ".jpeg", ".png", ".heic", ".webp"]:
-        return FileResponse(file_path)
-    try:
-        with Image.open(file_path) as img:
-            # HEIC/HEIF підтримка
-            if img.format and img.format.upper() in ['HEIC', 'HEIF']:
-                from pillow_heif import register_heif_opener
-                register_heif_opener()
-                img = Image.open(file_path)
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
-            # Якщо max_size > 0 — змінюємо розмір
-            if max_size and max_size > 0:
-                img.thumbnail((max_size, max_size))
-            buf = io.BytesIO()
-            img.save(buf, "JPEG", quality=quality, optimize=True)
-            buf.seek(0)
-            return StreamingResponse(buf, media_type="image/jpeg")
-    except Exception as e:
-        print(f"Помилка стискання: {e}")
-        return FileResponse(file_path)
+        return file_response(request, file_path)
+    fmt = negotiate_image_format(request.headers.get("accept", ""), settings)
+    key = rendition_key(filename, file_path, max_size, quality, fmt)
+    # Ключ однозначно визначає вміст, тож 304 відповідаємо, навіть не дивлячись у кеш
+    etag = make_etag(key)
+    headers = {"Vary": "Accept"}
+    if is_not_modified(request, etag): return not_modified_response(etag, headers=headers)
+    data = RENDITION_CACHE.get(key)
+    if data is None:
+        # JPEG кодуємо завжди: він потрібен для статистики і стане в пригоді клієнтам без WebP/AVIF
+        formats = {"jpeg", fmt}
+        try:
+            rendered = render_renditions(file_path, max_size, quality, formats)
+        except Exception as e:
+            print(f"Помилка стискання: {e}")
+            return file_response(request, file_path)
+        for rendered_fmt, rendered_data in rendered.items():
+            RENDITION_CACHE.put(rendition_key(filename, file_path, max_size, quality, rendered_fmt), rendered_data)
+        if fmt != "jpeg": record_format_generated(fmt, len(rendered[fmt]), len(rendered["jpeg"]))
+        data = rendered[fmt]
+    record_format_served(fmt, len(data))
+    return bytes_response(request, data, IMAGE_FORMATS[fmt][1], etag, headers=headers)
 
 @app.post("/thumbnails/generate_all/")
 async def generate_all_thumbnails():
     """
-    Генерує мініатюри для всіх медіафайлів у ORIGINALS_PATH згідно з поточними налаштуваннями.
-    """
-    supported_image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.heic', 'webp']
-    supported_video_extensions = ['.mp4', '.mov', '.avi', '.mkv', 'webm']
-    metadata = load_metadata()
-    original_files = os.listdir(ORIGINALS_PATH)
-    generated, failed = 0, 0
-
-    for filename in original_files:
-        original_file_path = os.path.join(ORIGINALS_PATH, filename)
-        file_extension = os.path.splitext(filename.lower())[1]
-        file_type = None
-        if file_extension in supported_image_extensions:
-            file_type = "image"
-        elif file_extension in supported_video_extensions:
-            file_type = "video"
-        else:
-            continue
-
-        thumbnail_filename = f"{os.path.splitext(filename)[0]}.jpg"
-        thumbnail_file_path = os.path.join(THUMBNAILS_PATH, thumbnail_filename)
-
-        try:
-            if file_type == "image":
-                created = create_photo_thumbnail(original_file_path, thumbnail_file_path)
-            else:
-                created = create_video_thumbnail(original_file_path, thumbnail_file_path)
-            if created:
-                generated += 1
-            else:
-                failed += 1
-        except Exception as e:
-            print(f"Помилка при створенні мініатюри для {filename}: {e}")
-            failed += 1
-
-    return {"status": "success", "generated": generated, "failed": failed}
+    Запускає фонову генерацію мініатюр для всіх медіафайлів у ORIGINALS_PATH
+    згідно з поточними налаштуваннями. Прогрес — /jobs/{job_id}.
+    """
+    job, created = JOBS.start("generate_thumbnails", generate_all_thumbnails_job)
+    return job_started_response(job, created)
 
 @app.get("/original_with_path/")
-async def get_original_with_path(path: str = Query(...)):
+async def get_original_with_path(request: Request, path: str = Query(...)):
     base_path = os.path.abspath(ORIGINALS_PATH)
     requested_file = os.path.abspath(os.path.join(base_path, path))
     if not requested_file.startswith(base_path):
         raise HTTPException(status_code=403, detail="Access denied")
     if not os.path.isfile(requested_file):
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(requested_file)
\ No newline at end of file
+    return file_response(request, requested_file)
\ No newline at end of file
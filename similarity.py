@@ -0,0 +1,255 @@
+# similarity.py - Перцептивні хеші (pHash, dHash) і індекс для пошуку схожих фото
+# (хеші рахуються в пулі процесів разом з прев'ю: жодних побічних ефектів при імпорті)
+
+import math
+import threading
+from itertools import combinations
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:  # без NumPy той самий DCT рахується на чистому Python (повільніше, але працює)
+    np = None
+
+HASH_BITS = 64
+PHASH_SAMPLE = 32  # pHash: DCT зменшеної до 32x32 сірої копії, беремо низькі частоти 8x8
+PHASH_LOW = 8
+
+# Індекс ділить 64-бітний хеш на 4 частини по 16 біт. Якщо відстань між хешами <= d,
+# то хоч одна частина відрізняється не більше ніж на d // 4 біт (принцип Діріхле),
+# тож кандидатів шукаємо по таблиці кожної частини, а не перебором усіх фото.
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+MAX_QUERY_DISTANCE = 15  # далі кандидатів стає стільки, що індекс уже не допомагає
+
+_DCT = [[math.cos(math.pi * (2 * n + 1) * k / (2 * PHASH_SAMPLE)) for n in range(PHASH_SAMPLE)] for k in range(PHASH_LOW)]
+_DCT_NP = np.array(_DCT, dtype=np.float64) if np is not None else None
+# np.bitwise_count є лише з NumPy 2.0; на 1.x рахуємо біти по байтах через таблицю
+_POPCOUNT_BYTES = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8) if np is not None else None
+
+
+def _pack(bits) -> str:
+    value = 0
+    for bit in bits:
+        value = (value << 1) | bool(bit)
+    return f"{value:016x}"
+
+
+def _gray(img: Image.Image, size: tuple):
+    return img.convert("L").resize(size, Image.Resampling.BILINEAR)
+
+
+def dhash(img: Image.Image) -> str:
+    """Різницевий хеш: чи яскравіший кожен піксель 9x8 копії за сусіда зліва."""
+    px = list(_gray(img, (9, 8)).getdata())
+    return _pack(px[row * 9 + col + 1] > px[row * 9 + col] for row in range(8) for col in range(8))
+
+
+def phash(img: Image.Image) -> str:
+    """
+    Хеш за DCT: 63 низькі частоти з блоку 8x8 порівнюються з їхньою медіаною.
+    Постійна складова (середня яскравість) не входить ні в медіану, ні в біти.
+    """
+    gray = _gray(img, (PHASH_SAMPLE, PHASH_SAMPLE))
+    if np is not None:
+        px = np.asarray(gray, dtype=np.float64)
+        ac = (_DCT_NP @ px @ _DCT_NP.T).ravel()[1:]
+        return _pack(ac > np.median(ac))
+    px = list(gray.getdata())
+    rows = [[sum(c * px[y * PHASH_SAMPLE + x] for x, c in enumerate(basis)) for basis in _DCT] for y in range(PHASH_SAMPLE)]
+    ac = [sum(basis[y] * rows[y][u] for y in range(PHASH_SAMPLE)) for basis in _DCT for u in range(PHASH_LOW)][1:]
+    median = sorted(ac)[len(ac) // 2]
+    return _pack(value > median for value in ac)
+
+
+def perceptual_hashes(img: Image.Image) -> dict:
+    """{"phash", "dhash"} у вигляді 16 hex-символів; img — уже зменшене прев'ю."""
+    return {"phash": phash(img), "dhash": dhash(img)}
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _popcount(values):
+    """Кількість одиничних бітів у кожному елементі масиву uint64."""
+    if hasattr(np, "bitwise_count"): return np.bitwise_count(values)
+    return _POPCOUNT_BYTES[np.ascontiguousarray(values).view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _flip_masks(radius: int) -> list:
+    """XOR-маски всіх 16-бітних значень на відстані <= radius (для radius 1 — 17 масок)."""
+    masks = _FLIP_MASKS.get(radius)
+    if masks is None:
+        masks = [sum(1 << bit for bit in bits) for distance in range(radius + 1)
+                 for bits in combinations(range(CHUNK_BITS), distance)]
+        _FLIP_MASKS[radius] = masks
+    return masks
+
+_FLIP_MASKS = {}
+
+
+class SimilarityIndex:
+    """
+    Індекс pHash усіх записів сховища (multi-index hashing по 4 таблицях).
+
+    query() знаходить схожі фото за кілька мілісекунд навіть на 100 тис. записів.
+    Пари "майже дублікатів" (pHash <= duplicate_distance і dHash <=
+    duplicate_dhash_distance) підтримуються інкрементально при кожній зміні
+    сховища, тож duplicates() лише збирає з них зв'язні групи.
+    """
+
+    def __init__(self, duplicate_distance: int = 6, duplicate_dhash_distance: int = 10):
+        self.duplicate_distance = duplicate_distance
+        self.duplicate_dhash_distance = duplicate_dhash_distance
+        self._lock = threading.Lock()
+        self._hashes = {}  # filename -> (phash, dhash) як int
+        self._tables = [{} for _ in range(CHUNKS)]  # частина хеша -> множина імен
+        self._edges = {}  # filename -> множина майже дублікатів
+
+    def attach(self, store):
+        """Підписується на зміни сховища і будує індекс з усіх його записів."""
+        store.add_listener(self.on_store_change)
+        entries = store.snapshot()  # не під нашим локом: обробник змін бере локи в порядку сховище -> індекс
+        with self._lock:
+            if np is not None and not self._hashes:
+                self._bulk_load(entries)
+                return
+            for name, entry in entries.items():
+                if name not in self._hashes: self._add(name, entry)
+
+    def on_store_change(self, upserts: dict, deletes):
+        with self._lock:
+            for name in deletes:
+                self._remove(name)
+            for name, entry in upserts.items():
+                hashes = self._parse(entry)
+                if hashes is not None and self._hashes.get(name) == hashes: continue
+                self._remove(name)
+                self._add(name, entry)
+
+    def __len__(self):
+        return len(self._hashes)
+
+    # --- Внутрішнє (під локом) ---
+    @staticmethod
+    def _parse(entry: dict):
+        try:
+            return int(entry["phash"], 16), int(entry["dhash"], 16)
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _chunks(value: int):
+        return [(value >> (CHUNK_BITS * i)) & CHUNK_MASK for i in range(CHUNKS)]
+
+    def _candidates(self, value: int, max_distance: int) -> set:
+        found = set()
+        masks = _flip_masks(max_distance // CHUNKS)
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            for mask in masks:
+                names = table.get(chunk ^ mask)
+                if names: found.update(names)
+        return found
+
+    def _add(self, name: str, entry: dict):
+        hashes = self._parse(entry)
+        if hashes is None: return
+        phash_value, dhash_value = hashes
+        for other in self._candidates(phash_value, self.duplicate_distance):
+            other_phash, other_dhash = self._hashes[other]
+            if (hamming(phash_value, other_phash) <= self.duplicate_distance
+                    and hamming(dhash_value, other_dhash) <= self.duplicate_dhash_distance):
+                self._edges.setdefault(name, set()).add(other)
+                self._edges.setdefault(other, set()).add(name)
+        self._hashes[name] = hashes
+        for table, chunk in zip(self._tables, self._chunks(phash_value)):
+            table.setdefault(chunk, set()).add(name)
+
+    def _bulk_load(self, entries: dict):
+        """
+        Початкове наповнення: ті самі таблиці, але пари дублікатів шукаються
+        векторно — для кожної таблиці й маски одним проходом по всіх фото (через розміри кошиків),
+        а не окремим запитом на кожне фото.
+        """
+        names, values = [], []
+        for name, entry in entries.items():
+            hashes = self._parse(entry)
+            if hashes is None: continue
+            names.append(name)
+            values.append(hashes)
+            self._hashes[name] = hashes
+            for table, chunk in zip(self._tables, self._chunks(hashes[0])):
+                table.setdefault(chunk, set()).add(name)
+        if len(names) < 2: return
+        phashes = np.array([v[0] for v in values], dtype=np.uint64)
+        dhashes = np.array([v[1] for v in values], dtype=np.uint64)
+        found = []
+        for i in range(CHUNKS):
+            keys = ((phashes >> np.uint64(CHUNK_BITS * i)) & np.uint64(CHUNK_MASK)).astype(np.int64)
+            order = np.argsort(keys, kind="stable")
+            bucket_sizes = np.bincount(keys, minlength=CHUNK_MASK + 1)
+            bucket_starts = np.cumsum(bucket_sizes) - bucket_sizes
+            for mask in _flip_masks(self.duplicate_distance // CHUNKS):
+                target = keys ^ mask
+                lo, counts = bucket_starts[target], bucket_sizes[target]
+                left = np.repeat(np.arange(len(names)), counts)
+                offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                right = order[np.repeat(lo, counts) + offsets]
+                keep = left < right
+                left, right = left[keep], right[keep]
+                close = ((_popcount(phashes[left] ^ phashes[right]) <= self.duplicate_distance)
+                         & (_popcount(dhashes[left] ^ dhashes[right]) <= self.duplicate_dhash_distance))
+                found.append(left[close] * len(names) + right[close])
+        for pair in np.unique(np.concatenate(found)).tolist():
+            a, b = names[pair // len(names)], names[pair % len(names)]
+            self._edges.setdefault(a, set()).add(b)
+            self._edges.setdefault(b, set()).add(a)
+
+    def _remove(self, name: str):
+        hashes = self._hashes.pop(name, None)
+        if hashes is None: return
+        for table, chunk in zip(self._tables, self._chunks(hashes[0])):
+            names = table.get(chunk)
+            names.discard(name)
+            if not names: del table[chunk]
+        for other in self._edges.pop(name, ()):
+            neighbours = self._edges.get(other)
+            neighbours.discard(name)
+            if not neighbours: del self._edges[other]
+
+    # --- Запити ---
+    def query(self, filename: str, max_distance: int, limit: int = None) -> list:
+        """[(відстань pHash, ім'я)] для схожих на filename, від найближчих. None — у файла немає хеша."""
+        max_distance = min(max_distance, MAX_QUERY_DISTANCE)
+        with self._lock:
+            hashes = self._hashes.get(filename)
+            if hashes is None: return None
+            value = hashes[0]
+            matches = []
+            for other in self._candidates(value, max_distance):
+                if other == filename: continue
+                distance = hamming(value, self._hashes[other][0])
+                if distance <= max_distance: matches.append((distance, other))
+        matches.sort()
+        return matches[:limit] if limit else matches
+
+    def duplicates(self) -> list:
+        """Групи майже однакових фото (списки імен, кожна щонайменше з двох)."""
+        with self._lock:
+            edges = {name: set(neighbours) for name, neighbours in self._edges.items()}
+        groups, seen = [], set()
+        for start in edges:
+            if start in seen: continue
+            group, stack = [], [start]
+            seen.add(start)
+            while stack:
+                name = stack.pop()
+                group.append(name)
+                for other in edges[name]:
+                    if other not in seen:
+                        seen.add(other)
+                        stack.append(other)
+            groups.append(group)
+        return groups
@@ -0,0 +1,180 @@
+# thumbnailer.py - Створення прев'ю без залежності від стану сервера
+# (модуль безпечно імпортується в процесах пулу: жодних побічних ефектів при імпорті)
+
+import io
+import os
+import tempfile
+import threading
+from PIL import Image, ImageOps, features
+
+import blurhash
+from similarity import perceptual_hashes
+from video_previews import extract_still
+
+# Як у Image.thumbnail: декодуємо щонайменше вдвічі більшим за найбільше прев'ю,
+# а далі зменшуємо якісним фільтром — так швидко і без помітних артефактів
+REDUCING_GAP = 2.0
+
+# Формати, які сервер уміє віддавати: назва -> (формат Pillow, MIME, розширення файлу)
+IMAGE_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+    "webp": ("WEBP", "image/webp", ".webp"),
+    "avif": ("AVIF", "image/avif", ".avif"),
+}
+
+_heif_registered = False
+
+
+def _register_heif():
+    """HEIC/HEIF відкриваються через pillow_heif, якщо він встановлений."""
+    global _heif_registered
+    if _heif_registered: return
+    _heif_registered = True
+    try:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+    except ImportError:
+        pass
+
+
+def decode_image(image_path: str, max_size: int) -> Image.Image:
+    """
+    Декодує зображення одразу зменшеним до ~max_size * REDUCING_GAP (0 — повний розмір):
+    JPEG — масштабуванням DCT (1/2, 1/4, 1/8) прямо під час декодування,
+    HEIC — через вбудовану мініатюру, якщо вона достатньо велика.
+    Повертає RGB-зображення з уже застосованою EXIF-орієнтацією.
+    """
+    _register_heif()
+    with Image.open(image_path) as img:
+        # Розмір чернетки — з тими ж пропорціями, що й оригінал; квадрат
+        # max_size x max_size змусив би декодер обрати вдвічі більший масштаб
+        if max_size > 0:
+            scale = min(1.0, max_size * REDUCING_GAP / max(img.size))
+            img.draft("RGB", (max(1, int(img.width * scale)), max(1, int(img.height * scale))))
+        img.load()
+    ImageOps.exif_transpose(img, in_place=True)
+    if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+        # Прозорі ділянки — на білому тлі, а не чорними
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def save_jpeg_atomic(img: Image.Image, path: str, quality: int):
+    """Пише JPEG через тимчасовий файл, щоб паралельний запит не віддав недописане прев'ю."""
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        img.save(tmp_path, "JPEG", quality=quality, optimize=True)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+
+
+def fit_size(size: tuple, box: int) -> tuple:
+    """Розмір, що вписується в квадрат box x box зі збереженням пропорцій (без збільшення)."""
+    width, height = size
+    scale = min(1.0, box / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def render_photo_sizes(image_path: str, outputs: list):
+    """
+    Робить усі прев'ю з одного декодування. `outputs` — список
+    (шлях прев'ю, розмір, якість JPEG); кожне вписується у квадрат розміру.
+    Повертає {"placeholder": BlurHash, "phash", "dhash"} (з найменшого прев'ю) або None при помилці.
+    """
+    if not outputs: return {"placeholder": None}
+    try:
+        base = decode_image(image_path, max(size for _, size, _ in outputs))
+        # Від більшого до меншого: наступний розмір зменшуємо з попереднього,
+        # поки той ще щонайменше вдвічі більший — це дешевше, ніж щоразу з бази
+        source = base
+        for thumbnail_path, size, quality in sorted(outputs, key=lambda o: o[1], reverse=True):
+            if max(source.size) < size * REDUCING_GAP: source = base
+            target = fit_size(base.size, size)
+            img = source.resize(target, Image.Resampling.BICUBIC, reducing_gap=REDUCING_GAP) if target != source.size else source
+            save_jpeg_atomic(img, thumbnail_path, quality)
+            source = img
+        # Заглушка і перцептивні хеші рахуються з уже зменшеної копії, тож майже нічого не коштують
+        return {"placeholder": blurhash.encode(source), **perceptual_hashes(source)}
+    except Exception as e:
+        print(f"❌ Помилка фото-прев'ю для {os.path.basename(image_path)}: {e}")
+        return None
+
+
+def render_photo_thumbnail(image_path: str, thumbnail_path: str, size: int, quality: int) -> bool:
+    return render_photo_sizes(image_path, [(thumbnail_path, size, quality)]) is not None
+
+
+def supported_formats() -> set:
+    """Формати з IMAGE_FORMATS, для яких у цій збірці Pillow є кодек."""
+    return {"jpeg"} | {name for name in ("webp", "avif") if features.check(name)}
+
+
+def encode_image(img: Image.Image, fmt: str, quality: int) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "jpeg":
+        img.save(buf, "JPEG", quality=quality, optimize=True)
+    elif fmt == "webp":
+        img.save(buf, "WEBP", quality=quality, method=4)
+    else:
+        img.save(buf, IMAGE_FORMATS[fmt][0], quality=quality)
+    return buf.getvalue()
+
+
+def render_renditions(image_path: str, max_size: int, quality: int, formats) -> dict:
+    """
+    Зменшена (max_size = 0 — повнорозмірна) копія фото для перегляду,
+    закодована в кожному з `formats` з одного декодування. Повертає {формат: байти}.
+    """
+    img = decode_image(image_path, max_size)
+    if max_size > 0:
+        target = fit_size(img.size, max_size)
+        if target != img.size: img = img.resize(target, Image.Resampling.BICUBIC, reducing_gap=REDUCING_GAP)
+    return {fmt: encode_image(img, fmt, quality) for fmt in formats}
+
+
+def transcode_image(source_path: str, target_path: str, fmt: str, quality: int) -> int:
+    """Перекодовує готове прев'ю в інший формат (атомарно). Повертає розмір результату."""
+    with Image.open(source_path) as img:
+        data = encode_image(img.convert("RGB"), fmt, quality)
+    tmp_path = f"{target_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, target_path)
+    finally:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+    return len(data)
+
+
+def render_video_sizes(video_path: str, outputs: list):
+    """Витягує один кадр у найбільшому розмірі, а менші прев'ю робить з нього (результат — як у render_photo_sizes)."""
+    if not outputs: return {"placeholder": None}
+    largest = max(size for _, size, _ in outputs)
+    fd, frame_path = tempfile.mkstemp(suffix=".jpg")
+    os.close(fd)
+    try:
+        if not extract_still(video_path, frame_path, largest):
+            print(f"❌ Не вдалося витягти кадр з {os.path.basename(video_path)}")
+            return None
+        return render_photo_sizes(frame_path, outputs)
+    finally:
+        if os.path.exists(frame_path): os.remove(frame_path)
+
+
+def render_video_thumbnail(video_path: str, thumbnail_path: str, size: int) -> bool:
+    return render_video_sizes(video_path, [(thumbnail_path, size, 80)]) is not None
+
+
+def render_thumbnail_task(task: tuple):
+    """
+    Точка входу для пулу процесів: (тип, оригінал, [(шлях прев'ю, розмір, якість), ...]).
+    Повертає {"placeholder": ...} або None, якщо прев'ю не вдалося.
+    """
+    file_type, source_path, outputs = task
+    if file_type == "image":
+        return render_photo_sizes(source_path, outputs)
+    return render_video_sizes(source_path, outputs)
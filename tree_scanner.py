@@ -0,0 +1,109 @@
+# tree_scanner.py - Рекурсивний обхід папки оригіналів через os.scandir
+# зі збереженим знімком каталогів: незмінені каталоги не перечитуються
+
+import os
+import json
+import time
+import threading
+
+SNAPSHOT_VERSION = 1
+# Каталог, змінений менше ніж стільки секунд до сканування, наступного разу
+# перечитуємо ще раз: за грубої точності mtime новий файл міг з'явитися в ту саму мить
+RACY_SECONDS = 2.0
+
+
+class TreeScanner:
+    """
+    Повний список файлів дерева `root`: {відносний шлях: (size, mtime_ns)}.
+
+    Для кожного каталогу знімок пам'ятає його mtime, кількість записів, файли
+    (з розміром і mtime) і підкаталоги. Створення, видалення чи перейменування
+    файлу змінює mtime каталогу, тож каталог з тим самим mtime не читаємо —
+    лише один stat() на каталог. Перезапис файлу на місці mtime каталогу
+    не змінює: такі зміни ловить стеження за папкою (watcher.py) або повне
+    сканування (full=True).
+
+    `accept(name)` вирішує, які файли потрапляють у знімок; приховані
+    файли й каталоги пропускаються завжди.
+    """
+
+    def __init__(self, root: str, snapshot_path: str, accept=None):
+        self.root = os.path.abspath(root)
+        self.snapshot_path = snapshot_path
+        self.accept = accept
+        self._dirs = None  # відносний шлях каталогу ("" — корінь) -> запис знімка
+        self._lock = threading.Lock()
+        self.last_stats = {}
+
+    # --- Знімок на диску ---
+    def _load(self) -> dict:
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == SNAPSHOT_VERSION and data.get("root") == self.root:
+                return data["dirs"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def _save(self):
+        tmp_path = f"{self.snapshot_path}.tmp"
+        os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            # dumps, а не dump: dump у файл кодує без C-прискорення
+            f.write(json.dumps({"version": SNAPSHOT_VERSION, "root": self.root, "dirs": self._dirs}, separators=(",", ":")))
+        os.replace(tmp_path, self.snapshot_path)
+
+    # --- Сканування ---
+    def _list_dir(self, path: str, mtime_ns: int, racy_after: int) -> dict:
+        files, dirs, count = {}, [], 0
+        with os.scandir(path) as it:
+            for entry in it:
+                count += 1
+                if entry.name.startswith("."): continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.name)
+                    elif (self.accept is None or self.accept(entry.name)) and entry.is_file():
+                        st = entry.stat()
+                        files[entry.name] = [st.st_size, st.st_mtime_ns]
+                except FileNotFoundError:
+                    continue
+        return {"mtime_ns": mtime_ns, "count": count, "files": files, "dirs": sorted(dirs),
+                "racy": mtime_ns >= racy_after}
+
+    def scan(self, full: bool = False, check_cancelled=None) -> dict:
+        with self._lock:
+            if self._dirs is None: self._dirs = self._load()
+            old = {} if full else self._dirs
+            new, result = {}, {}
+            racy_after = time.time_ns() - int(RACY_SECONDS * 1e9)
+            listed = skipped = 0
+            stack = [""]
+            while stack:
+                if check_cancelled: check_cancelled()
+                rel = stack.pop()
+                path = os.path.join(self.root, rel) if rel else self.root
+                try:
+                    mtime_ns = os.stat(path).st_mtime_ns
+                except (FileNotFoundError, NotADirectoryError):
+                    continue
+                snap = old.get(rel)
+                if snap is None or snap["mtime_ns"] != mtime_ns or snap.get("racy"):
+                    try:
+                        snap = self._list_dir(path, mtime_ns, racy_after)
+                    except (FileNotFoundError, NotADirectoryError, PermissionError):
+                        continue
+                    listed += 1
+                else:
+                    skipped += 1
+                new[rel] = snap
+                prefix = f"{rel}/" if rel else ""
+                for name, stat in snap["files"].items():
+                    result[prefix + name] = tuple(stat)
+                stack.extend(prefix + name for name in snap["dirs"])
+            changed = listed > 0 or new.keys() != self._dirs.keys()
+            self._dirs = new
+            if changed: self._save()
+            self.last_stats = {"dirs_listed": listed, "dirs_skipped": skipped, "files": len(result)}
+            return result
@@ -0,0 +1,172 @@
+# video_previews.py - Кадри й анімовані прев'ю для відео через обмежений пул ffmpeg
+# (як і thumbnailer, безпечно імпортується в процесах пулу)
+
+import os
+import shutil
+import tempfile
+import threading
+from PIL import Image
+import ffmpeg
+from jobs import PROCESS_POOL_CONTEXT
+
+# Одночасно працює не більше стількох ffmpeg — решта чекає в черзі, щоб прокрутка
+# галереї з відео не запускала десятки декодерів на Pi. Семафор міжпроцесний:
+# сервер передає його процесам пулу (use_ffmpeg_slots), тож ліміт спільний для всіх
+FFMPEG_MAX_PROCESSES = max(1, (os.cpu_count() or 2) // 2)
+_FFMPEG_SLOTS = None
+_FFMPEG_SLOTS_LOCK = threading.Lock()
+
+# Кадр для прев'ю беремо з ~1 секунди (перша часто чорна), але не далі середини ролика
+STILL_SEEK_SECONDS = 1.0
+
+# Анімоване прев'ю: кілька кадрів, рівномірно по всьому ролику
+ANIMATED_FRAMES = 8
+ANIMATED_FRAME_MS = 250
+ANIMATED_WIDTH = 240
+
+
+def ffmpeg_slots():
+    """
+    Семафор створюється при першому використанні, а не при імпорті: процеси пулу
+    імпортують модуль, але отримують семафор сервера. Контекст — той самий, що й
+    у пулу (семафор з fork-контексту в процеси forkserver не передається).
+    """
+    global _FFMPEG_SLOTS
+    with _FFMPEG_SLOTS_LOCK:
+        if _FFMPEG_SLOTS is None:
+            _FFMPEG_SLOTS = PROCESS_POOL_CONTEXT.BoundedSemaphore(FFMPEG_MAX_PROCESSES)
+        return _FFMPEG_SLOTS
+
+
+def use_ffmpeg_slots(slots):
+    """Ініціалізатор процесу пулу: ffmpeg тут займає слоти з того самого семафора, що й сервер."""
+    global _FFMPEG_SLOTS
+    _FFMPEG_SLOTS = slots
+
+
+def run_ffmpeg(stream) -> bool:
+    """Запускає ffmpeg, зайнявши слот пулу. False (з логом) при помилці."""
+    with ffmpeg_slots():
+        try:
+            stream.overwrite_output().run(capture_stdout=True, capture_stderr=True)
+            return True
+        except ffmpeg.Error as e:
+            print(f"❌ Помилка FFmpeg: {e.stderr.decode(errors='replace')[-500:]}")
+            return False
+
+
+def probe_duration(video_path: str):
+    """Тривалість у секундах або None, якщо ffprobe її не знає."""
+    try:
+        info = ffmpeg.probe(video_path)
+        return float(info["format"]["duration"])
+    except (ffmpeg.Error, KeyError, ValueError, FileNotFoundError):
+        return None
+
+
+def probe_video(video_path: str) -> dict:
+    """
+    Тривалість і розміри відео так, як його показує плеєр (з урахуванням
+    повороту з метаданих телефона). Невідомі значення — None.
+    """
+    info = {"duration": None, "width": None, "height": None}
+    try:
+        data = ffmpeg.probe(video_path)
+    except (ffmpeg.Error, FileNotFoundError):
+        return info
+    try:
+        info["duration"] = float(data["format"]["duration"])
+    except (KeyError, ValueError):
+        pass
+    stream = next((s for s in data.get("streams", []) if s.get("codec_type") == "video"), None)
+    if stream and stream.get("width") and stream.get("height"):
+        rotation = stream.get("tags", {}).get("rotate")
+        for side_data in stream.get("side_data_list", []):
+            rotation = side_data.get("rotation", rotation)
+        width, height = int(stream["width"]), int(stream["height"])
+        try:
+            if abs(int(float(rotation or 0))) % 180 == 90: width, height = height, width
+        except ValueError:
+            pass
+        info["width"], info["height"] = width, height
+    return info
+
+
+def _produced(path: str) -> bool:
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+
+def _fit(stream, size: int):
+    """Вписує кадр у квадрат size x size за довшою стороною, без збільшення."""
+    return stream.filter("scale", f"min({size},iw)", f"min({size},ih)", force_original_aspect_ratio="decrease")
+
+
+def extract_still(video_path: str, frame_path: str, size: int, duration: float = None) -> bool:
+    """
+    Один кадр у JPEG, вписаний у `size` пікселів за довшою стороною (менший ролик не збільшуємо).
+
+    Спершу — швидкий пошук з декодуванням лише ключових кадрів (-skip_frame nokey):
+    ffmpeg не розпаковує проміжні кадри GOP. Якщо ролик коротший за точку пошуку
+    або ключового кадру після неї немає, беремо перший кадр звичайним способом.
+    """
+    seek = STILL_SEEK_SECONDS if duration is None else min(STILL_SEEK_SECONDS, duration / 2)
+    if os.path.exists(frame_path): os.remove(frame_path)
+    if seek > 0:
+        run_ffmpeg(_fit(ffmpeg.input(video_path, ss=seek, skip_frame="nokey"), size)
+                   .output(frame_path, vframes=1, **{"q:v": 2}))
+        if _produced(frame_path): return True
+    run_ffmpeg(_fit(ffmpeg.input(video_path), size).output(frame_path, vframes=1, **{"q:v": 2}))
+    return _produced(frame_path)
+
+
+def _extract_frames(video_path: str, frames_dir: str, duration, frames: int, width: int) -> list:
+    """До `frames` кадрів, рівномірно по ролику; спершу лише з ключових кадрів."""
+    pattern = os.path.join(frames_dir, "%03d.jpg")
+    interval = (duration / frames) if duration else 2.0
+
+    def collect():
+        return sorted(os.path.join(frames_dir, name) for name in os.listdir(frames_dir))
+
+    # fps=1/interval поверх ключових кадрів: дешево навіть для довгих роликів
+    run_ffmpeg(ffmpeg.input(video_path, skip_frame="nokey")
+               .filter("fps", fps=1 / interval).filter("scale", width, -2)
+               .output(pattern, vframes=frames, **{"q:v": 4}))
+    found = collect()
+    if len(found) >= min(frames, 2): return found
+    # Короткий ролик або один ключовий кадр на весь файл — декодуємо все
+    for path in found: os.remove(path)
+    run_ffmpeg(ffmpeg.input(video_path)
+               .filter("fps", fps=frames / duration if duration else 4).filter("scale", width, -2)
+               .output(pattern, vframes=frames, **{"q:v": 4}))
+    return collect()
+
+
+def render_animated_preview(video_path: str, output_path: str, fmt: str = "webp",
+                            frames: int = ANIMATED_FRAMES, width: int = ANIMATED_WIDTH) -> bool:
+    """
+    Коротке зациклене прев'ю з кількох кадрів: анімований WebP (збирається
+    Pillow, кодек ffmpeg не потрібен) або німий MP4 (H.264, faststart).
+    """
+    frames_dir = tempfile.mkdtemp(prefix="preview-")
+    tmp_path = f"{output_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        found = _extract_frames(video_path, frames_dir, probe_duration(video_path), frames, width)
+        if not found: return False
+        if fmt == "mp4":
+            ok = run_ffmpeg(ffmpeg.input(os.path.join(frames_dir, "%03d.jpg"), framerate=1000 / ANIMATED_FRAME_MS)
+                            .output(tmp_path, format="mp4", vcodec="libx264", pix_fmt="yuv420p", an=None,
+                                    movflags="+faststart", crf=30))
+            if not ok: return False
+        else:
+            images = [Image.open(path) for path in found]
+            images[0].save(tmp_path, "WEBP", save_all=True, append_images=images[1:],
+                           duration=ANIMATED_FRAME_MS, loop=0, quality=60)
+            for img in images: img.close()
+        os.replace(tmp_path, output_path)
+        return True
+    except Exception as e:
+        print(f"❌ Помилка анімованого прев'ю для {os.path.basename(video_path)}: {e}")
+        return False
+    finally:
+        shutil.rmtree(frames_dir, ignore_errors=True)
+        if os.path.exists(tmp_path): os.remove(tmp_path)
@@ -0,0 +1,290 @@
+# watcher.py - Стеження за папкою оригіналів: нові, змінені й видалені файли
+# без повного пересканування (inotify у Linux, опитування деінде)
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import threading
+
+# Скільки тиші після останньої події чекаємо, перш ніж обробляти файл
+WATCH_DEBOUNCE_SECONDS = 2.0
+# Файл вважаємо дописаним, якщо розмір і mtime не змінились між двома перевірками
+# і з останнього запису минуло щонайменше стільки
+WATCH_SETTLE_SECONDS = 1.0
+# Інтервал для запасного режиму (немає inotify або вичерпано ліміт watch-ів)
+WATCH_POLL_INTERVAL = 10.0
+
+# Тимчасові файли копіювальників і наших власних записів
+_TEMP_SUFFIXES = (".uploading", ".tmp", ".part", ".partial", ".crdownload", ".filepart")
+
+# Константи inotify з <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+               | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_inotify():
+    """libc з inotify або None (не Linux, немає ctypes чи функцій)."""
+    if not sys.platform.startswith("linux"): return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+        return libc
+    except (OSError, AttributeError, ImportError):
+        return None
+
+
+class MediaWatcher:
+    """
+    Стежить за деревом `root` і викликає:
+      on_changed([шлях, ...]) — файли з'явились або змінились і вже дописані;
+      on_removed([шлях, ...]) — файли або цілі папки зникли;
+      on_overflow()           — подій забагато, щось могло загубитись (потрібен rescan).
+
+    Події по одному шляху збираються і обробляються лише після WATCH_DEBOUNCE_SECONDS
+    тиші, тож копіювання через Samba/rsync (запис шматками, тимчасове ім'я +
+    перейменування) дає один виклик на файл. `ignore(name)` відсіює непотрібні імена.
+    """
+
+    def __init__(self, root: str, on_changed, on_removed, on_overflow=None, ignore=None,
+                 debounce: float = WATCH_DEBOUNCE_SECONDS, settle: float = WATCH_SETTLE_SECONDS,
+                 poll_interval: float = WATCH_POLL_INTERVAL):
+        self.root = os.path.abspath(root)
+        self.on_changed = on_changed
+        self.on_removed = on_removed
+        self.on_overflow = on_overflow
+        self.ignore = ignore
+        self.debounce = debounce
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.backend = None
+        self.stats = {"events": 0, "changed": 0, "removed": 0, "overflows": 0}
+        self._pending = {}  # шлях -> {"removed": bool, "last_event": час, "stat": (size, mtime_ns) або None}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._fd = None
+        self._watches = {}  # wd -> каталог
+
+    # --- Запуск/зупинка ---
+    def start(self):
+        libc = _load_inotify()
+        if libc is not None and self._start_inotify(libc):
+            self.backend = "inotify"
+            target = self._inotify_loop
+        else:
+            self.backend = "polling"
+            target = self._poll_loop
+        for func in (target, self._flush_loop):
+            thread = threading.Thread(target=func, name=f"watcher-{func.__name__.strip('_')}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"👀 Стежу за {self.root} ({self.backend})")
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def status(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {"backend": self.backend, "watched_dirs": len(self._watches), "pending": pending, **self.stats}
+
+    # --- Фільтр і черга подій ---
+    def _ignored(self, path: str) -> bool:
+        name = os.path.basename(path)
+        if name.startswith(".") or name.lower().endswith(_TEMP_SUFFIXES): return True
+        return bool(self.ignore and self.ignore(name))
+
+    def _note(self, path: str, removed: bool):
+        with self._lock:
+            self.stats["events"] += 1
+            self._pending[path] = {"removed": removed, "last_event": time.monotonic(), "stat": None}
+
+    def _flush_loop(self):
+        while not self._stop.wait(0.5):
+            now = time.monotonic()
+            changed, removed = [], []
+            with self._lock:
+                due = [(path, state) for path, state in self._pending.items() if now - state["last_event"] >= self.debounce]
+            for path, state in due:
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    with self._lock:
+                        if self._pending.get(path) is state: del self._pending[path]
+                    removed.append(path)
+                    continue
+                current = (st.st_size, st.st_mtime_ns)
+                settled = state["stat"] == current and time.time() - st.st_mtime >= self.settle
+                with self._lock:
+                    if self._pending.get(path) is not state: continue  # прийшла нова подія
+                    if settled:
+                        del self._pending[path]
+                    else:
+                        state["stat"], state["last_event"] = current, now - self.debounce  # перевірити знову за 0.5 с
+                if settled: changed.append(path)
+            self._dispatch(changed, removed)
+
+    def _dispatch(self, changed: list, removed: list):
+        try:
+            if removed:
+                self.stats["removed"] += len(removed)
+                self.on_removed(removed)
+            if changed:
+                self.stats["changed"] += len(changed)
+                self.on_changed(changed)
+        except Exception as e:
+            print(f"⚠️ Помилка обробки змін у {self.root}: {e}")
+
+    def _overflow(self):
+        self.stats["overflows"] += 1
+        print("⚠️ Черга подій inotify переповнилась — потрібне повне пересканування")
+        if self.on_overflow:
+            try:
+                self.on_overflow()
+            except Exception as e:
+                print(f"⚠️ Помилка запуску пересканування: {e}")
+
+    # --- inotify ---
+    def _start_inotify(self, libc) -> bool:
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0: return False
+        self._libc, self._fd = libc, fd
+        if not self._add_tree(self.root, report_files=False):
+            os.close(fd)
+            self._fd = None
+            self._watches.clear()
+            return False
+        return True
+
+    def _add_watch(self, directory: str) -> bool:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            err = self._libc_errno()
+            if err == errno.ENOSPC:
+                print("⚠️ Вичерпано ліміт inotify watch-ів (fs.inotify.max_user_watches)")
+                return False
+            return True  # каталог встиг зникнути — не страшно
+        self._watches[wd] = directory
+        return True
+
+    @staticmethod
+    def _libc_errno() -> int:
+        import ctypes
+        return ctypes.get_errno()
+
+    def _add_tree(self, directory: str, report_files: bool) -> bool:
+        """Ставить watch на каталог і всі підкаталоги; для нового каталогу — ще й повідомляє про файли в ньому."""
+        if not self._add_watch(directory): return False
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return True
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not entry.name.startswith(".") and not self._add_tree(entry.path, report_files): return False
+            elif report_files and not self._ignored(entry.path):
+                # Файли, скопійовані разом з папкою до того, як ми почали за нею стежити
+                self._note(entry.path, removed=False)
+        return True
+
+    def _inotify_loop(self):
+        while not self._stop.is_set():
+            try:
+                ready, _, _ = select.select([self._fd], [], [], 1.0)
+            except (OSError, ValueError):
+                return
+            if not ready: continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError:
+                return
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += _EVENT_HEADER.size + length
+                self._handle_event(wd, mask, os.fsdecode(name))
+
+    def _handle_event(self, wd: int, mask: int, name: str):
+        if mask & IN_Q_OVERFLOW:
+            self._overflow()
+            return
+        if mask & IN_IGNORED:
+            self._watches.pop(wd, None)
+            return
+        directory = self._watches.get(wd)
+        if directory is None: return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if directory == self.root: print(f"⚠️ Папку {self.root} видалено або переміщено")
+            return
+        path = os.path.join(directory, name)
+        if mask & IN_ISDIR:
+            if name.startswith("."): return
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                if not self._add_tree(path, report_files=True): self._overflow()
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._note(path, removed=True)
+            return
+        if self._ignored(path): return
+        if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            self._note(path, removed=False)
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            self._note(path, removed=True)
+        # IN_CREATE для файлу ігноруємо: чекаємо IN_CLOSE_WRITE, коли запис закінчено
+
+    # --- Запасний режим: опитування ---
+    def _snapshot(self) -> dict:
+        files = {}
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except (FileNotFoundError, PermissionError):
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith("."): stack.append(entry.path)
+                    elif not self._ignored(entry.path):
+                        st = entry.stat()
+                        files[entry.path] = (st.st_size, st.st_mtime_ns)
+                except FileNotFoundError:
+                    continue
+        return files
+
+    def _poll_loop(self):
+        previous = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            for path, stat in current.items():
+                if previous.get(path) != stat: self._note(path, removed=False)
+            for path in previous.keys() - current.keys():
+                self._note(path, removed=True)
+            previous = current